@@ -0,0 +1,96 @@
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+
+# Function to draw the confidence interval of an approximate query result as error bars
+def draw_error_bars(df, x, y):
+    if f'{y}_low' not in df.columns:
+        return
+    # Bars are drawn in x order, one per known x value
+    df = df[df[x].notna()].sort_values(x)
+    positions = range(len(df))
+    plt.errorbar(positions, df[y], yerr=[df[y] - df[f'{y}_low'], df[f'{y}_high'] - df[y]],
+                 fmt='none', ecolor='black', capsize=3)
+
+
+# Function to draw the peak hours bar chart
+def plot_peak_hours(df_peak_hours, title):
+    # Convert hour column to integer for proper sorting
+    df_peak_hours = df_peak_hours.assign(hour=df_peak_hours['hour'].astype(int)).sort_values(by='hour')
+
+    fig = plt.figure(figsize=(10, 6))
+    sns.barplot(data=df_peak_hours, x='hour', y='trip_count', hue='hour', palette='viridis', legend=False)
+    draw_error_bars(df_peak_hours, 'hour', 'trip_count')
+    plt.title(title, fontsize=16)
+    plt.xlabel("Hour of Day (24-hour format)", fontsize=12)
+    plt.ylabel("Number of Trips", fontsize=12)
+    plt.xticks(fontsize=10)
+    plt.yticks(fontsize=10)
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    plt.tight_layout()
+    return fig
+
+
+# Function to draw the passenger count vs. average fare bar chart
+def plot_passenger_fare(df_fare, title):
+    fig = plt.figure(figsize=(10, 6))
+    sns.barplot(data=df_fare, x='passenger_count', y='avg_fare', hue='passenger_count', palette='coolwarm',
+                legend=False)
+    draw_error_bars(df_fare, 'passenger_count', 'avg_fare')
+    plt.title(title, fontsize=16)
+    plt.xlabel("Passenger Count", fontsize=12)
+    plt.ylabel("Average Fare ($)", fontsize=12)
+    plt.xticks(fontsize=10)
+    plt.yticks(fontsize=10)
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    plt.tight_layout()
+    return fig
+
+
+# Function to draw the monthly usage trend line chart
+def plot_monthly_trends(df_trend, title):
+    fig = plt.figure(figsize=(12, 6))
+    plt.plot(df_trend['month'], df_trend['trip_count'], marker='o', linestyle='-', color='orange', label='Monthly Trips')
+    # Approximate results carry a confidence interval
+    if 'trip_count_low' in df_trend.columns:
+        plt.fill_between(df_trend['month'], df_trend['trip_count_low'], df_trend['trip_count_high'],
+                         color='orange', alpha=0.2, label='95% confidence interval')
+    plt.title(title, fontsize=16)
+    plt.xlabel("Month", fontsize=12)
+    plt.ylabel("Number of Trips", fontsize=12)
+    plt.xticks(rotation=45, fontsize=10)
+    plt.yticks(fontsize=10)
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    plt.legend()
+    plt.tight_layout()
+    return fig
+
+
+# Drawing function for each named backend query
+PLOTS = {
+    'peak_hours': plot_peak_hours,
+    'passenger_fare': plot_passenger_fare,
+    'monthly_trips': plot_monthly_trends,
+}
+
+# Every chart of the visualize scripts: (query, title, file name in 'Chart of visualization/')
+CHARTS = {
+    'yellow': [
+        ('peak_hours', "Peak Hours for Taxi Usage (Yellow Taxi)", 'peak_hours_yellow_taxi'),
+        ('passenger_fare', "Passenger Count vs. Average Fare (Yellow Taxi)", 'passenger_count-yellow_taxi_based-on_avgFare'),
+        ('monthly_trips', "Monthly Usage Trends (Yellow Taxi)", 'yellow_taxi_yearly_trend'),
+    ],
+    'green': [
+        ('peak_hours', "Peak Hours for Taxi Usage", 'Peak_hour_green-taxi'),
+        ('passenger_fare', "Passenger Count vs. Average Fare", 'passenger_count_green_taxi-based-on_avgFare'),
+        ('monthly_trips', "Monthly Usage Trends", 'Green-taxi_trip_trend_over_theYear'),
+    ],
+    'fhv': [
+        ('peak_hours', "Peak Hours for Taxi Usage (FHV Taxi)", 'Peak_hours_fhv_taxi'),
+        ('monthly_trips', "Monthly Usage Trends (FHV Taxi)", 'Fhv_taxi_trend_over_year'),
+    ],
+    'fhvhv': [
+        ('peak_hours', "Peak Hours for Taxi Usage (FHVHV Taxi)", 'peak_hours_fhvhv_taxi'),
+        ('monthly_trips', "Monthly Usage Trends (FHVHV Taxi)", 'Fhvhv_taxi_trend_over_year'),
+    ],
+}
@@ -1,74 +1,43 @@
-import sqlite3
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-# SQLite database path
-sqlite_db_path = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\taxi_data.db"
-
-# Connect to SQLite
-conn = sqlite3.connect(sqlite_db_path)
-
-# Query 1: Peak Hours for Taxi Usage
-query1 = """
-SELECT 
-    strftime('%H', pickup_datetime) AS hour,
-    COUNT(*) AS trip_count
-FROM 
-    fhv_trip_data
-GROUP BY 
-    hour
-ORDER BY 
-    trip_count DESC;
-"""
-
-# Execute Query 1
-df_peak_hours = pd.read_sql_query(query1, conn)
-
-# Convert hour column to integer for proper sorting
-df_peak_hours['hour'] = df_peak_hours['hour'].astype(int)
-df_peak_hours = df_peak_hours.sort_values(by='hour')
-
-# Visualization 1: Peak Hours
-plt.figure(figsize=(10, 6))
-sns.barplot(data=df_peak_hours, x='hour', y='trip_count', palette='viridis', legend=False)
-plt.title("Peak Hours for Taxi Usage (FHV Taxi)", fontsize=16)
-plt.xlabel("Hour of Day (24-hour format)", fontsize=12)
-plt.ylabel("Number of Trips", fontsize=12)
-plt.xticks(fontsize=10)
-plt.yticks(fontsize=10)
-plt.grid(axis='y', linestyle='--', alpha=0.7)
-plt.tight_layout()
-plt.show()
-
-# Query 2: Trends in Monthly Trip Counts
-query2 = """
-SELECT 
-    strftime('%Y-%m', pickup_datetime) AS month, 
-    COUNT(*) AS trip_count
-FROM 
-    fhv_trip_data
-GROUP BY 
-    month
-ORDER BY 
-    month;
-"""
-
-# Execute Query 2
-df_trend = pd.read_sql_query(query2, conn)
-
-# Visualization 2: Monthly Usage Trends
-plt.figure(figsize=(12, 6))
-plt.plot(df_trend['month'], df_trend['trip_count'], marker='o', linestyle='-', color='orange', label='Monthly Trips')
-plt.title("Monthly Usage Trends (FHV Taxi)", fontsize=16)
-plt.xlabel("Month", fontsize=12)
-plt.ylabel("Number of Trips", fontsize=12)
-plt.xticks(rotation=45, fontsize=10)
-plt.yticks(fontsize=10)
-plt.grid(axis='y', linestyle='--', alpha=0.7)
-plt.legend()
-plt.tight_layout()
-plt.show()
-
-# Close the database connection
-conn.close()
+import os
+import sys
+
+import matplotlib.pyplot as plt
+
+from charts import plot_peak_hours, plot_monthly_trends
+
+# The storage backends live next to the loaders
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Processing and loading data'))
+from storage_backends import open_backend  # noqa: E402
+
+# Storage to query: 'sqlite' (rollups in taxi_data.db) or 'parquet' (the partitioned dataset, via DuckDB)
+storage_backend = 'sqlite'
+sqlite_db_path = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\taxi_data.db"
+dataset_root = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\taxi_dataset"
+
+# Answer from the stratified trip samples (faster on large tables) and draw
+# the 95% confidence intervals; the 'parquet' storage always answers exactly
+approximate_queries = False
+
+# Query results are cached here until the next ingest changes the data
+query_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.query_cache')
+
+# Open the storage backend
+backend = open_backend(storage_backend, sqlite_db=sqlite_db_path, dataset_root=dataset_root,
+                       cache_dir=query_cache_dir)
+
+# Query 1: Peak Hours for Taxi Usage
+df_peak_hours = backend.query('peak_hours', 'fhv', approximate=approximate_queries)
+
+# Visualization 1: Peak Hours
+plot_peak_hours(df_peak_hours, "Peak Hours for Taxi Usage (FHV Taxi)")
+plt.show()
+
+# Query 2: Trends in Monthly Trip Counts
+df_trend = backend.query('monthly_trips', 'fhv', approximate=approximate_queries)
+
+# Visualization 2: Monthly Usage Trends
+plot_monthly_trends(df_trend, "Monthly Usage Trends (FHV Taxi)")
+plt.show()
+
+# Close the storage backend
+backend.close()
@@ -1,103 +1,50 @@
-import sqlite3
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-# SQLite database path
-sqlite_db_path = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\taxi_data.db"
-
-# Connect to SQLite
-conn = sqlite3.connect(sqlite_db_path)
-
-# Query 1: Peak Hours for Taxi Usage
-query1 = """
-SELECT 
-    strftime('%H', lpep_pickup_datetime) AS hour,
-    COUNT(*) AS trip_count
-FROM 
-    green_taxi_data
-GROUP BY 
-    hour
-ORDER BY 
-    trip_count DESC;
-"""
-
-# Execute Query 1
-df_peak_hours = pd.read_sql_query(query1, conn)
-
-# Convert hour column to integer for proper sorting
-df_peak_hours['hour'] = df_peak_hours['hour'].astype(int)
-df_peak_hours = df_peak_hours.sort_values(by='hour')
-
-# Visualization 1: Peak Hours
-plt.figure(figsize=(10, 6))
-sns.barplot(data=df_peak_hours, x='hour', y='trip_count', palette='viridis', legend=False)
-plt.title("Peak Hours for Taxi Usage", fontsize=16)
-plt.xlabel("Hour of Day (24-hour format)", fontsize=12)
-plt.ylabel("Number of Trips", fontsize=12)
-plt.xticks(fontsize=10)
-plt.yticks(fontsize=10)
-plt.grid(axis='y', linestyle='--', alpha=0.7)
-plt.tight_layout()
-plt.show()
-
-# Query 2: Passenger Count vs. Average Fare
-query2 = """
-SELECT 
-    passenger_count, 
-    AVG(fare_amount) AS avg_fare, 
-    COUNT(*) AS trip_count
-FROM 
-    green_taxi_data
-GROUP BY 
-    passenger_count
-ORDER BY 
-    passenger_count;
-"""
-
-# Execute Query 2
-df_fare = pd.read_sql_query(query2, conn)
-
-# Visualization 2: Passenger Count vs. Average Fare
-plt.figure(figsize=(10, 6))
-sns.barplot(data=df_fare, x='passenger_count', y='avg_fare', palette='coolwarm', legend=False)
-plt.title("Passenger Count vs. Average Fare", fontsize=16)
-plt.xlabel("Passenger Count", fontsize=12)
-plt.ylabel("Average Fare ($)", fontsize=12)
-plt.xticks(fontsize=10)
-plt.yticks(fontsize=10)
-plt.grid(axis='y', linestyle='--', alpha=0.7)
-plt.tight_layout()
-plt.show()
-
-# Query 3: Monthly Trip Count Trends
-query3 = """
-SELECT 
-    strftime('%Y-%m', lpep_pickup_datetime) AS month, 
-    COUNT(*) AS trip_count
-FROM 
-    green_taxi_data
-GROUP BY 
-    month
-ORDER BY 
-    month;
-"""
-
-# Execute Query 3
-df_trend = pd.read_sql_query(query3, conn)
-
-# Visualization 3: Monthly Usage Trends
-plt.figure(figsize=(12, 6))
-plt.plot(df_trend['month'], df_trend['trip_count'], marker='o', linestyle='-', color='orange', label='Monthly Trips')
-plt.title("Monthly Usage Trends", fontsize=16)
-plt.xlabel("Month", fontsize=12)
-plt.ylabel("Number of Trips", fontsize=12)
-plt.xticks(rotation=45, fontsize=10)
-plt.yticks(fontsize=10)
-plt.grid(axis='y', linestyle='--', alpha=0.7)
-plt.legend()
-plt.tight_layout()
-plt.show()
-
-# Close the database connection
-conn.close()
+import os
+import sys
+
+import matplotlib.pyplot as plt
+
+from charts import plot_peak_hours, plot_passenger_fare, plot_monthly_trends
+
+# The storage backends live next to the loaders
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Processing and loading data'))
+from storage_backends import open_backend  # noqa: E402
+
+# Storage to query: 'sqlite' (rollups in taxi_data.db) or 'parquet' (the partitioned dataset, via DuckDB)
+storage_backend = 'sqlite'
+sqlite_db_path = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\taxi_data.db"
+dataset_root = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\taxi_dataset"
+
+# Answer from the stratified trip samples (faster on large tables) and draw
+# the 95% confidence intervals; the 'parquet' storage always answers exactly
+approximate_queries = False
+
+# Query results are cached here until the next ingest changes the data
+query_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.query_cache')
+
+# Open the storage backend
+backend = open_backend(storage_backend, sqlite_db=sqlite_db_path, dataset_root=dataset_root,
+                       cache_dir=query_cache_dir)
+
+# Query 1: Peak Hours for Taxi Usage
+df_peak_hours = backend.query('peak_hours', 'green', approximate=approximate_queries)
+
+# Visualization 1: Peak Hours
+plot_peak_hours(df_peak_hours, "Peak Hours for Taxi Usage")
+plt.show()
+
+# Query 2: Passenger Count vs. Average Fare
+df_fare = backend.query('passenger_fare', 'green', approximate=approximate_queries)
+
+# Visualization 2: Passenger Count vs. Average Fare
+plot_passenger_fare(df_fare, "Passenger Count vs. Average Fare")
+plt.show()
+
+# Query 3: Monthly Trip Count Trends
+df_trend = backend.query('monthly_trips', 'green', approximate=approximate_queries)
+
+# Visualization 3: Monthly Usage Trends
+plot_monthly_trends(df_trend, "Monthly Usage Trends")
+plt.show()
+
+# Close the storage backend
+backend.close()
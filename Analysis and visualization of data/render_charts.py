@@ -0,0 +1,128 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib
+matplotlib.use('Agg')  # headless: figures are only ever written to files
+
+import matplotlib.pyplot as plt  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from charts import CHARTS, PLOTS  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Processing and loading data'))
+from storage_backends import DEFAULT_STORAGE_BACKEND, STORAGE_BACKENDS, open_backend  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CHART_DIR = os.path.join(HERE, 'Chart of visualization')
+QUERY_CACHE_DIR = os.path.join(HERE, '.query_cache')
+
+# Same locations as the visualize scripts
+SQLITE_DB_PATH = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\taxi_data.db"
+DATASET_ROOT = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\taxi_dataset"
+
+# Input hash of every chart file written, so unchanged charts are not drawn again
+STATE_FILE = '.render_state.json'
+
+# Bump when charts.py changes how charts look, to redraw everything once
+CHART_STYLE_VERSION = 1
+
+
+def chart_input_hash(query, title, df):
+    """Hash of everything a chart is drawn from: its query result, title and the chart style."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([CHART_STYLE_VERSION, query, title, list(df.columns)]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def render_chart(query, title, df, paths):
+    """Worker task: draw one chart and save it in every requested format."""
+    fig = PLOTS[query](df, title)
+    for path in paths:
+        fig.savefig(path)
+    plt.close(fig)
+    return paths
+
+
+def _load_state(out_dir):
+    try:
+        with open(os.path.join(out_dir, STATE_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_state(out_dir, state):
+    path = os.path.join(out_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def render_all(backend, taxi_types=None, out_dir=CHART_DIR, formats=('png',), workers=None, force=False,
+               approximate=False):
+    """Render every chart of every taxi type into out_dir, redrawing only what changed.
+
+    The queries run in this process (they are answered from rollups or the
+    query cache); drawing and saving run in a process pool. A chart is
+    skipped when its input hash matches the last render and all of its
+    files exist. With approximate=True the queries are answered from the
+    trip samples and drawn with error bars. Returns the number of charts drawn.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    state = _load_state(out_dir)
+    started = time.perf_counter()
+
+    jobs = {}
+    skipped = 0
+    for taxi_type in taxi_types or CHARTS:
+        for query, title, file_stem in CHARTS[taxi_type]:
+            df = backend.query(query, taxi_type, approximate=approximate)
+            input_hash = chart_input_hash(query, title, df)
+            paths = [os.path.join(out_dir, f'{file_stem}.{fmt}') for fmt in formats]
+            if not force and state.get(file_stem) == input_hash and all(map(os.path.exists, paths)):
+                skipped += 1
+                continue
+            jobs[file_stem] = (query, title, df, paths, input_hash)
+
+    drawn = 0
+    if jobs:
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(jobs))) as pool:
+            futures = {pool.submit(render_chart, *job[:4]): file_stem for file_stem, job in jobs.items()}
+            for future in as_completed(futures):
+                file_stem = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Failed to render {file_stem}: {e}")
+                    continue
+                state[file_stem] = jobs[file_stem][4]
+                drawn += 1
+        _save_state(out_dir, state)
+
+    print(f"Rendered {drawn} charts, {skipped} unchanged, in {time.perf_counter() - started:.2f}s")
+    return drawn
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render every taxi chart to files without opening windows.")
+    parser.add_argument('--backend', choices=STORAGE_BACKENDS, default=DEFAULT_STORAGE_BACKEND)
+    parser.add_argument('--db', default=SQLITE_DB_PATH)
+    parser.add_argument('--dataset-root', default=DATASET_ROOT)
+    parser.add_argument('--types', nargs='+', choices=list(CHARTS), default=list(CHARTS))
+    parser.add_argument('--out-dir', default=CHART_DIR)
+    parser.add_argument('--formats', nargs='+', choices=['png', 'svg'], default=['png'])
+    parser.add_argument('--workers', type=int, default=None, help="render processes (default: CPU count)")
+    parser.add_argument('--approximate', action='store_true',
+                        help="answer from the trip samples and draw confidence intervals")
+    parser.add_argument('--force', action='store_true', help="redraw charts even if their data is unchanged")
+    args = parser.parse_args()
+
+    with open_backend(args.backend, sqlite_db=args.db, dataset_root=args.dataset_root,
+                      cache_dir=QUERY_CACHE_DIR) as backend:
+        render_all(backend, args.types, args.out_dir, args.formats, args.workers, args.force, args.approximate)
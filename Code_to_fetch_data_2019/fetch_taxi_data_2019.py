@@ -1,59 +1,209 @@
-import os
-import requests
-from bs4 import BeautifulSoup
-from tenacity import retry, stop_after_attempt, wait_exponential
-from tqdm import tqdm
-
-BASE_URL = "https://www.nyc.gov"
-DATA_PAGE = "https://www.nyc.gov/site/tlc/about/tlc-trip-record-data.page"
-DATA_DIR = "data"
-YEAR = 2019
-
-os.makedirs(DATA_DIR, exist_ok=True)
-
-def get_2019_parquet_links():
-    """Scrape the webpage to get Parquet file links for 2019."""
-    print(f"Fetching data links from {DATA_PAGE}...")
-    response = requests.get(DATA_PAGE)
-    response.raise_for_status()
-
-    soup = BeautifulSoup(response.content, "html.parser")
-    links = soup.find_all("a", href=True)
-    
-    parquet_links = []
-    for link in links:
-        href = link["href"]
-        if f"{YEAR}" in href and href.endswith(".parquet"):
-            parquet_links.append(BASE_URL + href if href.startswith("/") else href)
-    
-    print(f"Found {len(parquet_links)} Parquet files for {YEAR}.")
-    return parquet_links
-
-@retry(stop=stop_after_attempt(10), wait=wait_exponential(multiplier=1, min=2, max=60))
-def download_parquet_file(url, filepath):
-    """Download a Parquet file with retries."""
-    print(f"Attempting to download {url}...")
-    response = requests.get(url, stream=True, timeout=10)
-    response.raise_for_status()
-
-    with open(filepath, "wb") as f:
-        for chunk in tqdm(response.iter_content(chunk_size=1024), desc=f"Saving {os.path.basename(filepath)}"):
-            f.write(chunk)
-    print(f"Successfully downloaded {url} to {filepath}")
-
-def download_2019_data():
-    """Download all 2019 Parquet files."""
-    links = get_2019_parquet_links()
-    for link in links:
-        filename = os.path.basename(link)
-        filepath = os.path.join(DATA_DIR, filename)
-        if not os.path.exists(filepath):
-            try:
-                download_parquet_file(link, filepath)
-            except requests.exceptions.RequestException as e:
-                print(f"Failed to download {filename}: {e}")
-        else:
-            print(f"{filename} already exists. Skipping.")
-
-if __name__ == "__main__":
-    download_2019_data()
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+from tqdm import tqdm
+
+from tlc_catalog import CATALOG_FILE, DATA_PAGE, RECHECK_DAYS, TAXI_TYPES, TLCCatalog, parse_years
+
+DATA_DIR = "data"
+YEAR = 2019
+
+# Parallel downloads and the size of each write to disk
+MAX_WORKERS = 4
+CHUNK_SIZE = 1024 * 1024
+
+class IncompleteDownload(requests.exceptions.RequestException):
+    """The server closed the connection before sending the whole file."""
+
+def make_session(pool_size=MAX_WORKERS):
+    """Create a requests session whose connection pool is shared by all download threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def get_2019_parquet_links(data_dir=DATA_DIR):
+    """Get the Parquet file links for 2019 from the catalog, refreshing it if the TLC page changed."""
+    print(f"Fetching data links from {DATA_PAGE}...")
+    catalog = TLCCatalog(os.path.join(data_dir, CATALOG_FILE))
+    catalog.refresh()
+    catalog.save()
+    parquet_links = [catalog.url(name) for name in catalog.names([YEAR])]
+    print(f"Found {len(parquet_links)} Parquet files for {YEAR}.")
+    return parquet_links
+
+def _expected_size(response, offset):
+    """Total file size announced by the server, or None if it did not say."""
+    if response.status_code == 206:
+        content_range = response.headers.get("Content-Range", "")
+        total = content_range.rpartition("/")[2]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    return int(length) if length is not None else None
+
+def _validator(response):
+    """The strong ETag or the Last-Modified date of a response, usable in If-Range; None if it has neither."""
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+def _transient(error):
+    """Whether a failed download may succeed when tried again: a dropped or
+    timed out connection, a truncated body or a server error (5xx). A 404 or
+    any other client error would fail the same way every time."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                              requests.exceptions.ChunkedEncodingError, IncompleteDownload))
+
+@retry(retry=retry_if_exception(_transient), stop=stop_after_attempt(10),
+       wait=wait_exponential(multiplier=1, min=2, max=60), reraise=True)
+def download_parquet_file(url, filepath, session=None):
+    """Download a Parquet file, retrying transient failures and resuming from a partial download.
+
+    Data is written to filepath + '.part' and renamed to filepath only once
+    its size matches what the server announced, so filepath never holds a
+    truncated file. The ETag or Last-Modified date of the response is kept
+    in filepath + '.part.validator', and a retry continues the .part file
+    with a Range request sent with If-Range, so the server only sends the
+    rest when the remote file is still the same version. When it has been
+    replaced, or the server ignores Range, the whole file comes back and
+    the download starts over.
+    """
+    session = session or requests
+    part_path = filepath + ".part"
+    validator_path = part_path + ".validator"
+    validator = None
+    if os.path.exists(part_path) and os.path.exists(validator_path):
+        with open(validator_path) as f:
+            validator = f.read().strip() or None
+    # A .part without a validator may hold any version of the file; never append to it
+    offset = os.path.getsize(part_path) if validator else 0
+    headers = {"Accept-Encoding": "identity"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+
+    print(f"Attempting to download {url}" + (f" (resuming at {offset} bytes)..." if offset else "..."))
+    with session.get(url, stream=True, timeout=30, headers=headers) as response:
+        if response.status_code == 416:
+            # The partial file does not fit the remote file any more; start over
+            os.remove(part_path)
+            raise IncompleteDownload(f"Range not satisfiable for {url}, restarting")
+        response.raise_for_status()
+        if response.status_code != 206:
+            if offset:
+                print(f"{os.path.basename(filepath)} changed on the server; downloading it again")
+            offset = 0
+            with open(validator_path, "w") as f:
+                f.write(_validator(response) or "")
+        expected = _expected_size(response, offset)
+
+        with open(part_path, "ab" if offset else "wb") as f, \
+                tqdm(total=expected, initial=offset, unit="B", unit_scale=True,
+                     desc=f"Saving {os.path.basename(filepath)}", leave=False) as progress:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                progress.update(len(chunk))
+
+    size = os.path.getsize(part_path)
+    if expected is not None and size != expected:
+        raise IncompleteDownload(f"Got {size} of {expected} bytes for {url}")
+    os.replace(part_path, filepath)
+    os.remove(validator_path)
+    print(f"Successfully downloaded {url} to {filepath}")
+
+def needs_download(url, filepath, session=None):
+    """Check whether filepath is missing or differs in size from the remote file.
+
+    A file of another size is downloaded again from the start: it may be a
+    truncated copy, but also an older version the TLC has since replaced,
+    and appending the new version's tail to it would corrupt it.
+    """
+    if not os.path.exists(filepath):
+        return True
+    response = (session or requests).head(url, timeout=30, allow_redirects=True)
+    if not response.ok or "Content-Length" not in response.headers:
+        return False
+    return os.path.getsize(filepath) != int(response.headers["Content-Length"])
+
+def download_files(links, data_dir=DATA_DIR, max_workers=MAX_WORKERS, verify_existing=True, replace_existing=False):
+    """Download links into data_dir concurrently over one pooled session.
+
+    With replace_existing, files that already exist are downloaded again
+    (the new copy replaces the old one only once complete). Returns the
+    list of file names that could not be downloaded.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    session = make_session(max_workers)
+    failed = []
+
+    def fetch(link):
+        filename = os.path.basename(link)
+        filepath = os.path.join(data_dir, filename)
+        if (os.path.exists(filepath) and not replace_existing
+                and not (verify_existing and needs_download(link, filepath, session))):
+            print(f"{filename} already exists. Skipping.")
+            return
+        download_parquet_file(link, filepath, session)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch, link): link for link in links}
+        for future in as_completed(futures):
+            filename = os.path.basename(futures[future])
+            try:
+                future.result()
+            except requests.exceptions.RequestException as e:
+                print(f"Failed to download {filename}: {e}")
+                failed.append(filename)
+    session.close()
+    return failed
+
+def sync_catalog(data_dir=DATA_DIR, years=(YEAR,), taxi_types=None, page_url=DATA_PAGE, max_workers=MAX_WORKERS,
+                 recheck_days=RECHECK_DAYS):
+    """Download the new and changed trip files of the given years and taxi types into data_dir.
+
+    The link index and the remote sizes seen so far are kept in
+    data_dir/.tlc_catalog.json (see tlc_catalog.py), so a sync where nothing
+    changed sends one conditional request. Returns the list of file names
+    that could not be downloaded.
+    """
+    session = make_session(max_workers)
+    catalog = TLCCatalog(os.path.join(data_dir, CATALOG_FILE), page_url, session)
+    changed = catalog.refresh()
+    queued = catalog.plan(data_dir, years, taxi_types, recheck_days, max_workers)
+    catalog.save()
+    print(f"Catalog {'updated' if changed else 'unchanged'}: {len(catalog.names(years, taxi_types))} files, "
+          f"{len(queued)} new or changed ({catalog.requests['GET']} GET, {catalog.requests['HEAD']} HEAD requests)")
+    failed = download_files([catalog.url(name) for name in queued], data_dir, max_workers,
+                            verify_existing=False, replace_existing=True) if queued else []
+    catalog.mark_downloaded(name for name in queued if name not in failed)
+    catalog.save()
+    session.close()
+    return failed
+
+def download_2019_data():
+    """Download all 2019 Parquet files."""
+    sync_catalog(DATA_DIR, [YEAR])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download new and changed TLC trip record files.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--years", nargs="+", default=[str(YEAR)], help="years or ranges, e.g. 2009-2012 2019 2021-")
+    parser.add_argument("--types", nargs="+", choices=TAXI_TYPES)
+    parser.add_argument("--page-url", default=DATA_PAGE, help="page listing the files (e.g. a local stub server)")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="parallel downloads and HEAD checks")
+    parser.add_argument("--recheck-days", type=float, default=RECHECK_DAYS,
+                        help="check downloaded files against the server again after this many days")
+    args = parser.parse_args()
+
+    failed = sync_catalog(args.data_dir, parse_years(args.years), args.types, args.page_url, args.workers,
+                          args.recheck_days)
+    if failed:
+        raise SystemExit(f"Failed to download {len(failed)} files: {', '.join(sorted(failed))}")
@@ -0,0 +1,199 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from bs4 import BeautifulSoup
+
+DATA_PAGE = "https://www.nyc.gov/site/tlc/about/tlc-trip-record-data.page"
+
+# Trip record files listed on the TLC page, e.g. .../yellow_tripdata_2019-01.parquet
+TAXI_TYPES = ("yellow", "green", "fhv", "fhvhv")
+TRIP_FILE = re.compile(rf"(?P<taxi_type>{'|'.join(TAXI_TYPES)})_tripdata_(?P<year>\d{{4}})-(?P<month>\d{{2}})\.parquet")
+
+# The parsed link index, the page's ETag/Last-Modified and every file's
+# remote size and ETag are kept in this file in the data directory
+CATALOG_FILE = ".tlc_catalog.json"
+
+# A downloaded file whose size matches the last HEAD is trusted without a
+# request for this many days; after that its remote size and ETag are checked
+# again, which catches files the TLC republishes under the same name
+RECHECK_DAYS = 30
+
+def parse_years(specs):
+    """Sorted years from specs like ['2009-2012', '2019']; an open range '2015-' ends this year."""
+    years = set()
+    for spec in specs:
+        first, dash, last = str(spec).partition("-")
+        if not first.isdigit() or (last and not last.isdigit()):
+            raise ValueError(f"Expected a year or a range of years like 2009-2019, got {spec!r}")
+        last = (last or time.strftime("%Y")) if dash else first
+        years.update(range(int(first), int(last) + 1))
+    return sorted(years)
+
+def parse_links(html, page_url):
+    """{file name: absolute URL} of the trip record files linked from the TLC page."""
+    links = {}
+    for link in BeautifulSoup(html, "html.parser").find_all("a", href=True):
+        url = urljoin(page_url, link["href"].strip())
+        name = os.path.basename(urlsplit(url).path)
+        if TRIP_FILE.fullmatch(name):
+            links[name] = url
+    return links
+
+class TLCCatalog:
+    """Index of the TLC trip record files, kept up to date with as few requests as possible.
+
+    Usage:
+        catalog = TLCCatalog(os.path.join(data_dir, CATALOG_FILE))
+        catalog.refresh()
+        names = catalog.plan(data_dir, years=range(2009, 2025))
+        ... download catalog.url(name) for every name ...
+        catalog.mark_downloaded(names)
+        catalog.save()
+
+    refresh() asks for the page with If-None-Match/If-Modified-Since and only
+    parses it when the server says it changed. plan() sends a HEAD request
+    only for files that are new, missing or incomplete locally, or whose last
+    check is older than recheck_days, and queues those whose remote size or
+    ETag differs from the downloaded copy. When nothing changed, a sync
+    costs one conditional GET answered with 304.
+    """
+
+    def __init__(self, path, page_url=DATA_PAGE, session=None):
+        self.path = path
+        self.page_url = page_url
+        self.session = session or requests.Session()
+        self.requests = {"GET": 0, "HEAD": 0}
+        self.state = self._load()
+
+    def _load(self):
+        state = None
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                state = json.load(f)
+        if state is None or state.get("page_url") != self.page_url:
+            state = {"page_url": self.page_url, "etag": None, "last_modified": None, "files": {}}
+        return state
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+    def refresh(self):
+        """Update the link index from the TLC page; return False when the page has not changed."""
+        headers = {}
+        if self.state["etag"]:
+            headers["If-None-Match"] = self.state["etag"]
+        if self.state["last_modified"]:
+            headers["If-Modified-Since"] = self.state["last_modified"]
+        self.requests["GET"] += 1
+        response = self.session.get(self.page_url, headers=headers, timeout=30)
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+
+        links = parse_links(response.content, response.url)
+        files = self.state["files"]
+        for name in set(files) - set(links):
+            del files[name]
+        for name, url in links.items():
+            entry = files.setdefault(name, {})
+            if entry.get("url") != url:
+                entry.clear()
+                entry["url"] = url
+        self.state["etag"] = response.headers.get("ETag")
+        self.state["last_modified"] = response.headers.get("Last-Modified")
+        return True
+
+    def names(self, years=None, taxi_types=None):
+        """File names in the index for the given years and taxi types (None = all), oldest month first."""
+        years = set(years) if years is not None else None
+        selected = []
+        for name in self.state["files"]:
+            match = TRIP_FILE.fullmatch(name)
+            if years is not None and int(match["year"]) not in years:
+                continue
+            if taxi_types is not None and match["taxi_type"] not in taxi_types:
+                continue
+            selected.append((match["year"], match["month"], name))
+        return [name for _, _, name in sorted(selected)]
+
+    def url(self, name):
+        return self.state["files"][name]["url"]
+
+    def head(self, name):
+        """Record a file's remote size and ETag from a HEAD request."""
+        entry = self.state["files"][name]
+        self.requests["HEAD"] += 1
+        response = self.session.head(entry["url"], timeout=30, allow_redirects=True)
+        response.raise_for_status()
+        length = response.headers.get("Content-Length")
+        entry["size"] = int(length) if length is not None else None
+        entry["etag"] = response.headers.get("ETag")
+        entry["checked_at"] = time.time()
+
+    def plan(self, data_dir, years=None, taxi_types=None, recheck_days=RECHECK_DAYS, workers=4):
+        """Return the names of the files to download into data_dir: new, changed or incomplete ones.
+
+        Queued files are downloaded again even though they exist (see
+        download_files' replace_existing), from the start: a local file of
+        another size may be an older version, not a truncated one. A .part
+        of a version the TLC has since replaced is removed as well; other
+        .part files resume only while the server confirms the version with
+        If-Range (see download_parquet_file).
+        """
+        files = self.state["files"]
+        names = self.names(years, taxi_types)
+        local_sizes = {}
+        to_check = []
+        for name in names:
+            entry = files[name]
+            path = os.path.join(data_dir, name)
+            local_sizes[name] = os.path.getsize(path) if os.path.exists(path) else None
+            fresh = time.time() - entry.get("checked_at", 0) < recheck_days * 86400
+            if not (fresh and local_sizes[name] is not None and entry["size"] in (None, local_sizes[name])):
+                to_check.append(name)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for name, error in zip(to_check, pool.map(self._try_head, to_check)):
+                if error is not None:
+                    print(f"Could not check {name}: {error}")
+
+        queued = []
+        for name in names:
+            entry = files[name]
+            if "checked_at" not in entry:
+                continue
+            local_size, remote_size = local_sizes[name], entry["size"]
+            path = os.path.join(data_dir, name)
+            complete = local_size is not None and remote_size in (None, local_size)
+            if complete and "downloaded_etag" not in entry:
+                # Downloaded before the catalog existed: adopt the local copy
+                entry["downloaded_etag"] = entry["etag"]
+            changed = entry.get("downloaded_etag", entry["etag"]) != entry["etag"]
+            if complete and not changed:
+                continue
+            if changed:
+                for stale in (path + ".part", path + ".part.validator"):
+                    if os.path.exists(stale):
+                        os.remove(stale)
+            queued.append(name)
+        return queued
+
+    def _try_head(self, name):
+        try:
+            self.head(name)
+        except requests.exceptions.RequestException as e:
+            return e
+        return None
+
+    def mark_downloaded(self, names):
+        """Remember that these files now hold the version last seen by HEAD."""
+        for name in names:
+            entry = self.state["files"][name]
+            entry["downloaded_etag"] = entry.get("etag")
@@ -0,0 +1,162 @@
+import argparse
+import glob
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pyarrow as pa
+
+from month_partitions import parse_month
+from transform_engine import widen_money
+
+# Cleaned trips are also kept as uncompressed Arrow IPC files, which are read
+# back by memory-mapping them instead of going through the SQL driver:
+#   <root>/<taxi type>/<yyyymm>/<source file>.arrow
+# One file per source file and pickup month, so a replaced source file only
+# swaps its own files. Files loaded before the cache existed are not in it;
+# load them again to add them.
+DEFAULT_ARROW_CACHE = True
+
+# Arrow type for each column type declared in a loader's CREATE_TABLE_SQL
+ARROW_TYPES = {
+    'DATETIME': pa.timestamp('us'),
+    'INTEGER': pa.int64(),
+    'REAL': pa.float64(),
+    'TEXT': pa.string(),
+}
+
+
+def arrow_schema(loader):
+    """Arrow schema of a loader's COLUMNS, typed as declared in its CREATE_TABLE_SQL."""
+    conn = sqlite3.connect(':memory:')
+    conn.execute(loader.CREATE_TABLE_SQL)
+    declared = {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info({loader.TABLE_NAME})')}
+    conn.close()
+    # Text stored in lookup tables in SQLite stays text in Arrow
+    declared.update({source: 'TEXT' for source in loader.DIMENSIONS})
+    return pa.schema([(col, ARROW_TYPES[declared[col]]) for col in loader.COLUMNS])
+
+
+def arrow_column(series, arrow_type):
+    """Convert a cleaned column, including compact dtypes, to its declared Arrow type."""
+    if series.dtype == np.float32:
+        series = widen_money(series.to_numpy())
+    array = pa.array(series, from_pandas=True)
+    if pa.types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+    return array.cast(arrow_type)
+
+
+def arrow_cache_root(sqlite_db):
+    """Directory of the Arrow cache kept next to a SQLite database: taxi_data.db -> taxi_data_arrow/."""
+    return os.path.splitext(os.path.abspath(sqlite_db))[0] + '_arrow'
+
+
+class ArrowCacheWriter:
+    """Write one source file's cleaned batches into the cache's month files.
+
+    Usage (write is usually a writer listener):
+        with ArrowCacheWriter(root, 'yellow', 'yellow_tripdata_2019-01.parquet', schema) as cache:
+            cache.write(df)
+
+    Batches stream into temporary files, one per pickup month. Only when the
+    block exits normally are the source file's previous files removed and
+    the new ones renamed into place; on error the old files stay untouched.
+    Windows cannot replace a file another process still has mapped, so
+    readers should drop their tables before a month is reloaded there.
+    """
+
+    def __init__(self, root, taxi_type, file_name, schema):
+        self.type_dir = os.path.join(root, taxi_type)
+        self.part_name = f'{os.path.splitext(file_name)[0]}.arrow'
+        self.schema = schema
+        self._writers = {}
+
+    def __enter__(self):
+        return self
+
+    def _path(self, month):
+        return os.path.join(self.type_dir, str(int(month)), self.part_name)
+
+    def write(self, df):
+        if df.empty:
+            return
+        batch = pa.RecordBatch.from_arrays([arrow_column(df[field.name], field.type) for field in self.schema],
+                                           schema=self.schema)
+        months = df['pickup_month'].to_numpy(dtype=np.int64)
+        for month in np.unique(months):
+            rows = months == month
+            writer = self._writers.get(month)
+            if writer is None:
+                path = self._path(month)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = self._writers[month] = pa.ipc.new_file(path + '.tmp', self.schema)
+            writer.write_batch(batch if rows.all() else batch.filter(pa.array(rows)))
+
+    def __exit__(self, exc_type, exc, tb):
+        for writer in self._writers.values():
+            writer.close()
+        new_files = [self._path(month) for month in self._writers]
+        if exc_type is None:
+            for old_file in glob.glob(os.path.join(self.type_dir, '*', self.part_name)):
+                os.remove(old_file)
+            for path in new_files:
+                os.replace(path + '.tmp', path)
+        else:
+            for path in new_files:
+                os.remove(path + '.tmp')
+        return False
+
+
+def cached_months(root, taxi_type):
+    """yyyymm of every month in the cache of a taxi type, oldest first."""
+    directory = os.path.join(root, taxi_type)
+    names = os.listdir(directory) if os.path.isdir(directory) else []
+    return sorted(int(name) for name in names if name.isdigit())
+
+
+def open_trips(root, taxi_type, columns=None, start=None, end=None):
+    """Open the cached trips of a taxi type as one Arrow table, without copying them.
+
+    Every month file from start to end ('YYYY-MM', either may be None) is
+    memory-mapped and only the requested columns are kept; the table's
+    chunks point straight into the files, so opening costs milliseconds
+    whatever the row count. Returns an empty table with no columns when
+    nothing is cached.
+    """
+    first, last = parse_month(start), parse_month(end)
+    tables = []
+    for month in cached_months(root, taxi_type):
+        if (first is not None and month < first) or (last is not None and month > last):
+            continue
+        for path in sorted(glob.glob(os.path.join(root, taxi_type, str(month), '*.arrow'))):
+            table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+            tables.append(table.select(columns) if columns else table)
+    if not tables:
+        return pa.table({})
+    return pa.concat_tables(tables)
+
+
+def read_trips(root, taxi_type, columns=None, start=None, end=None):
+    """The cached trips as a pandas DataFrame (numeric columns without NULLs are not copied when possible)."""
+    return open_trips(root, taxi_type, columns, start, end).to_pandas(split_blocks=True)
+
+
+if __name__ == "__main__":
+    from taxi_types import TAXI_TYPES
+
+    parser = argparse.ArgumentParser(description="Open the Arrow cache of cleaned trips and show what it holds.")
+    parser.add_argument('--root', default=arrow_cache_root(r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\taxi_data.db"))
+    parser.add_argument('--type', choices=list(TAXI_TYPES), required=True)
+    parser.add_argument('--columns', nargs='+', help="columns to open (default: all)")
+    parser.add_argument('--start', help="first pickup month, YYYY-MM")
+    parser.add_argument('--end', help="last pickup month, YYYY-MM")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    trips = open_trips(args.root, args.type, args.columns, args.start, args.end)
+    elapsed = time.perf_counter() - started
+    print(f"Opened {trips.num_rows:,} rows in {trips.num_columns} columns "
+          f"({trips.nbytes / 1e6:,.1f} MB mapped) in {elapsed * 1000:.1f} ms")
+    print(trips.schema)
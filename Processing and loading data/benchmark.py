@@ -0,0 +1,227 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from parquet_stream import iter_parquet_batches
+from storage_backends import DEFAULT_STORAGE_BACKEND, QUERIES, STORAGE_BACKENDS, open_backend
+from synthetic_tlc_data import generate_dataset
+from taxi_types import TAXI_TYPES, get_transform, load_loader
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# How much worse than the baseline a metric may get before it counts as a
+# regression, as a fraction of the baseline value. Query latencies are small
+# and noisy, so they also get an absolute allowance in milliseconds.
+TOLERANCES = {
+    'rows_per_sec': 0.25,
+    'peak_rss_mb': 0.25,
+    'storage_mb': 0.10,
+    'median_ms': 0.50,
+}
+LATENCY_SLACK_MS = 2.0
+
+# Metrics where a larger value is better; every other metric should go down
+HIGHER_IS_BETTER = {'rows_per_sec'}
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MiB, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def ingest_case(taxi_type, files, storage_backend, sqlite_db, dataset_root):
+    """Load files the way insert_<type>_to_sqlite.py's main loop does, in a fresh process.
+
+    Returns rows in/out, seconds, rows/sec and the process's peak RSS.
+    """
+    loader = load_loader(taxi_type)
+    transform = get_transform(taxi_type)
+    rows_in = rows_out = 0
+    with open_backend(storage_backend, sqlite_db=sqlite_db, dataset_root=dataset_root) as backend:
+        backend.prepare(taxi_type)
+        started = time.perf_counter()
+        for file_path in files:
+            load = backend.check_file(taxi_type, file_path)
+            batches = (transform(df) for df in iter_parquet_batches(
+                file_path, loader.BATCH_ROWS, loader.READ_COLUMNS, loader.CATEGORY_COLUMNS))
+            rows_out += backend.load_file(load, batches)
+            rows_in += load.rows_read
+        seconds = time.perf_counter() - started
+    return {
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(rows_in / seconds if seconds else 0.0),
+        'peak_rss_mb': round(peak_rss_mb(), 1) if resource else None,
+    }
+
+
+def query_latencies(backend, taxi_types, repeat):
+    """Median and best latency (ms) of every named query, without the query cache."""
+    results = {}
+    for taxi_type in taxi_types:
+        for name in QUERIES:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                backend.query(name, taxi_type)
+                timings.append((time.perf_counter() - started) * 1000)
+            results[f'{taxi_type}.{name}'] = {
+                'median_ms': round(statistics.median(timings), 2),
+                'best_ms': round(min(timings), 2),
+            }
+    return results
+
+
+def storage_mb(storage_backend, sqlite_db, dataset_root):
+    """Size of the loaded data on disk, after folding the SQLite WAL into the database file."""
+    if storage_backend == 'sqlite':
+        with open_backend('sqlite', sqlite_db=sqlite_db) as backend:
+            backend.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        size = os.path.getsize(sqlite_db)
+    else:
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(dataset_root) for name in names)
+    return round(size / (1024 * 1024), 2)
+
+
+def run_benchmark(work_dir, rows, taxi_types=None, months=(1,), storage_backend=DEFAULT_STORAGE_BACKEND,
+                  repeat=5, seed=0):
+    """Generate synthetic data, load every taxi type into a fresh store and time the queries."""
+    taxi_types = list(taxi_types or TAXI_TYPES)
+    data_dir = os.path.join(work_dir, 'data')
+    sqlite_db = os.path.join(work_dir, 'benchmark.db')
+    dataset_root = os.path.join(work_dir, 'dataset')
+    for path in (sqlite_db, sqlite_db + '-wal', sqlite_db + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(dataset_root, ignore_errors=True)
+
+    print(f"Generating {rows:,} rows per file for {', '.join(taxi_types)} in {data_dir}")
+    files = generate_dataset(data_dir, rows, taxi_types, months=months, seed=seed)
+
+    ingest = {}
+    spawn = multiprocessing.get_context('spawn')
+    for taxi_type in taxi_types:
+        type_files = [f for f in files if os.path.basename(f).startswith(f'{taxi_type}_')]
+        # A fresh process per taxi type, so peak RSS belongs to that load alone
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+            ingest[taxi_type] = pool.submit(ingest_case, taxi_type, type_files, storage_backend,
+                                            sqlite_db, dataset_root).result()
+
+    with open_backend(storage_backend, sqlite_db=sqlite_db, dataset_root=dataset_root) as backend:
+        queries = query_latencies(backend, taxi_types, repeat)
+
+    return {
+        'config': {'rows': rows, 'months': list(months), 'types': taxi_types,
+                   'backend': storage_backend, 'seed': seed},
+        'ingest': ingest,
+        'queries': queries,
+        'storage_mb': storage_mb(storage_backend, sqlite_db, dataset_root),
+    }
+
+
+def _flatten(results):
+    """{'ingest.yellow.rows_per_sec': value, ...} for every comparable metric."""
+    metrics = {'storage_mb': results['storage_mb']}
+    for section in ('ingest', 'queries'):
+        for case, values in results[section].items():
+            for metric, value in values.items():
+                if metric in TOLERANCES and value is not None:
+                    metrics[f'{section}.{case}.{metric}'] = value
+    return metrics
+
+
+def compare_to_baseline(results, baseline):
+    """Return a list of human-readable regressions of results against baseline.
+
+    Returns None when the baseline was recorded with a different configuration.
+    """
+    if baseline['config'] != results['config']:
+        return None
+    regressions = []
+    current = _flatten(results)
+    for key, base in _flatten(baseline).items():
+        if key not in current or not base:
+            continue
+        value = current[key]
+        metric = key.rsplit('.', 1)[-1]
+        tolerance = TOLERANCES[metric]
+        if metric in HIGHER_IS_BETTER:
+            worse = value < base * (1 - tolerance)
+        else:
+            worse = value > base * (1 + tolerance)
+            if metric == 'median_ms':
+                worse = worse and value - base > LATENCY_SLACK_MS
+        if worse:
+            regressions.append(f"{key}: {value} vs baseline {base} ({(value - base) / base:+.0%})")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'ingest':<10} {'rows':>12} {'seconds':>9} {'rows/sec':>12} {'peak RSS MiB':>13}")
+    for taxi_type, r in results['ingest'].items():
+        rss = f"{r['peak_rss_mb']:.1f}" if r['peak_rss_mb'] is not None else 'n/a'
+        print(f"{taxi_type:<10} {r['rows_in']:>12,} {r['seconds']:>9.2f} {r['rows_per_sec']:>12,} {rss:>13}")
+    print(f"{'query':<28} {'median ms':>10} {'best ms':>10}")
+    for case, r in results['queries'].items():
+        print(f"{case:<28} {r['median_ms']:>10.2f} {r['best_ms']:>10.2f}")
+    print(f"storage: {results['storage_mb']:.2f} MiB")
+
+
+def main(argv=None, prog=None):
+    """Run the benchmark from command-line arguments; exits with status 1 on a regression."""
+    parser = argparse.ArgumentParser(prog=prog, description="Benchmark ingest and queries on synthetic TLC data.")
+    parser.add_argument('--work-dir', default='benchmark_work')
+    parser.add_argument('--rows', type=int, default=1_000_000, help="rows per synthetic file")
+    parser.add_argument('--months', nargs='+', type=int, default=[1])
+    parser.add_argument('--types', nargs='+', choices=list(TAXI_TYPES), default=list(TAXI_TYPES))
+    parser.add_argument('--backend', choices=STORAGE_BACKENDS, default=DEFAULT_STORAGE_BACKEND)
+    parser.add_argument('--repeat', type=int, default=5, help="runs per query")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the new baseline")
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.work_dir, args.rows, args.types, args.months, args.backend,
+                            args.repeat, args.seed)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f))
+        if regressions is None:
+            print("Baseline was recorded with a different configuration; not comparing.")
+        elif regressions:
+            for regression in regressions:
+                print(f"REGRESSION {regression}")
+            sys.exit(1)
+        else:
+            print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+from month_partitions import trip_rows
+
+# Lookup tables hold each distinct value of a low-cardinality text column once;
+# trip tables store the value's integer id instead of the text. A trip table
+# declares its lookups in its loader as
+#   DIMENSIONS = {source column: (stored id column, lookup table)}
+# and several source columns may share one lookup table (e.g. dispatching and
+# affiliated base numbers both use fhv_bases).
+DIMENSION_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY,
+    value TEXT NOT NULL UNIQUE
+);
+'''
+
+# Value -> id mappings of every lookup table this process has used, keyed by
+# (database file, table), so they are read from SQLite once and not per file
+_mappings = {}
+
+
+def _database_file(conn):
+    return next(row[2] for row in conn.execute('PRAGMA database_list') if row[1] == 'main')
+
+
+def _as_text(value):
+    """The TEXT a value used to be stored as (SQLite renders 1.0 as '1.0', like str())."""
+    return value if isinstance(value, str) else str(value)
+
+
+class Dimension:
+    """The in-memory value -> id mapping of one lookup table.
+
+    Ids are only ever added, so a cached mapping stays valid across files.
+    Values added inside a transaction are kept apart until commit(), and
+    rollback() forgets them together with the rows SQLite rolled back.
+    """
+
+    def __init__(self, conn, table):
+        self.table = table
+        conn.execute(DIMENSION_TABLE_SQL.format(table=table))
+        self.ids = dict(conn.execute(f'SELECT value, id FROM {table}'))
+        self._pending = {}
+
+    def _id(self, conn, value):
+        id_ = self.ids.get(value, self._pending.get(value))
+        if id_ is None:
+            conn.execute(f'INSERT OR IGNORE INTO {self.table} (value) VALUES (?)', (value,))
+            id_ = conn.execute(f'SELECT id FROM {self.table} WHERE value = ?', (value,)).fetchone()[0]
+            self._pending[value] = id_
+        return id_
+
+    def encode(self, conn, series):
+        """Return the ids of a column's values, adding unseen values to the lookup table.
+
+        Only the distinct values are looked up (a categorical's categories
+        are used as they are); NULLs stay NULL.
+        """
+        values = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+        codes = values.cat.codes.to_numpy()
+        lookup = np.array([self._id(conn, _as_text(value)) for value in values.cat.categories], dtype=np.int64)
+        missing = codes < 0
+        ids = lookup[np.where(missing, 0, codes)] if len(lookup) else np.zeros(len(codes), dtype=np.int64)
+        if missing.any():
+            return pd.arrays.IntegerArray(ids, missing)
+        return ids
+
+    def commit(self):
+        self.ids.update(self._pending)
+        self._pending.clear()
+
+    def rollback(self):
+        self._pending.clear()
+
+
+def get_dimension(conn, table):
+    """Return the cached Dimension of a lookup table, reading it from the database on first use."""
+    key = (_database_file(conn) or id(conn), table)
+    if key not in _mappings:
+        _mappings[key] = Dimension(conn, table)
+    return _mappings[key]
+
+
+def create_dimension_tables(conn, table_name, dimensions):
+    """Create a trip table's lookup tables and move a table that still stores the text over to ids.
+
+    A table created before its lookups existed gets the id columns, filled
+    from the distinct text values, and loses the text columns, all in one
+    transaction. Needs an autocommit connection (connect_for_bulk_load).
+    """
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table_name})')]
+    legacy = {source: spec for source, spec in dimensions.items() if source in columns}
+    conn.execute('BEGIN')
+    for source, (stored, table) in dimensions.items():
+        conn.execute(DIMENSION_TABLE_SQL.format(table=table))
+        if source in legacy:
+            print(f"Moving {table_name}.{source} into lookup table {table}...")
+            conn.execute(f'INSERT OR IGNORE INTO {table} (value) '
+                         f'SELECT DISTINCT CAST({source} AS TEXT) FROM {table_name} WHERE {source} IS NOT NULL')
+            if stored not in columns:
+                conn.execute(f'ALTER TABLE {table_name} ADD COLUMN {stored} INTEGER')
+            conn.execute(f'UPDATE {table_name} SET {stored} = '
+                         f'(SELECT id FROM {table} WHERE value = CAST({table_name}.{source} AS TEXT))')
+            conn.execute(f'ALTER TABLE {table_name} DROP COLUMN {source}')
+    conn.execute('COMMIT')
+    if legacy:
+        print("Run VACUUM to return the space of the dropped text columns to the file system.")
+
+    # Mappings cached for an earlier database at this path would be stale
+    database = _database_file(conn)
+    for key in [key for key in _mappings if key[0] == database]:
+        del _mappings[key]
+
+
+def create_named_view(conn, table_name, dimensions):
+    """Create <table>_named: the trip table (all partitions) with its text columns joined back in, for ad-hoc queries."""
+    joins, names = [], []
+    for index, (source, (stored, table)) in enumerate(dimensions.items()):
+        joins.append(f'LEFT JOIN {table} d{index} ON d{index}.id = t.{stored}')
+        names.append(f'd{index}.value AS {source}')
+    conn.execute(f'DROP VIEW IF EXISTS {table_name}_named')
+    conn.execute(f"CREATE VIEW {table_name}_named AS SELECT t.*, {', '.join(names)} "
+                 f"FROM {trip_rows(conn, table_name)} t {' '.join(joins)}")
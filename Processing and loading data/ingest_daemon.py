@@ -0,0 +1,288 @@
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import signal
+import struct
+import threading
+import time
+
+from ingest_telemetry import TelemetrySink
+from parallel_ingest import DATASET_ROOT, INPUT_FOLDER, SQLITE_DB_PATH
+from parquet_stream import iter_parquet_batches
+from storage_backends import DEFAULT_STORAGE_BACKEND, STORAGE_BACKENDS, open_backend
+from taxi_types import TAXI_TYPES, classify_file, get_transform, load_loader
+
+# Seconds between directory scans when inotify is not available (Windows,
+# macOS, network shares), and the longest the daemon sleeps with inotify
+DEFAULT_POLL_SECONDS = 5.0
+
+# A file is only loaded once its size and mtime have not changed for this
+# many seconds and its Parquet footer is in place, so a file still being
+# copied into the folder is never read half-written
+DEFAULT_SETTLE_SECONDS = 2.0
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+INOTIFY_EVENT = struct.Struct('iIII')
+
+PARQUET_MAGIC = b'PAR1'
+
+
+def _trip_files(folder, taxi_types):
+    """{file name: taxi type} of the trip files in a folder, by the loaders' name rules."""
+    files = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            taxi_type = classify_file(entry.name)
+            if taxi_type in taxi_types and entry.is_file():
+                files[entry.name] = taxi_type
+    return files
+
+
+class PollingWatcher:
+    """Reports files whose size or mtime changed between two scans of a folder."""
+
+    name = 'polling'
+
+    def __init__(self, folder, interval=DEFAULT_POLL_SECONDS):
+        self.folder = folder
+        self.interval = interval
+        self._seen = self._scan()
+
+    def _scan(self):
+        seen = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                seen[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return seen
+
+    def wait(self, timeout):
+        """Sleep up to timeout seconds and return the names of files that changed meanwhile."""
+        time.sleep(min(timeout, self.interval))
+        seen = self._scan()
+        changed = {name for name, state in seen.items() if self._seen.get(name) != state}
+        self._seen = seen
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Reports files created, written or moved into a folder, as Linux inotify sees them.
+
+    Uses libc through ctypes, so there is nothing to install; raises OSError
+    where inotify is not available.
+    """
+
+    name = 'inotify'
+
+    def __init__(self, folder):
+        self.folder = folder
+        libc_name = ctypes.util.find_library('c')
+        if not hasattr(os, 'O_NONBLOCK') or libc_name is None:
+            raise OSError("inotify is not available on this platform")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available on this platform")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {folder}")
+
+    def wait(self, timeout):
+        """Block up to timeout seconds for events and return the names of the files they name."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost: look at every file again
+                    changed.update(os.listdir(self.folder))
+                elif name:
+                    changed.add(os.fsdecode(name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_watcher(folder, poll_interval=DEFAULT_POLL_SECONDS):
+    """Watch a folder with inotify where the platform has it, by polling otherwise."""
+    try:
+        return InotifyWatcher(folder)
+    except OSError:
+        return PollingWatcher(folder, poll_interval)
+
+
+def parquet_complete(file_path):
+    """True when a file ends with the Parquet footer magic, i.e. it is not still being written."""
+    try:
+        with open(file_path, 'rb') as f:
+            f.seek(-len(PARQUET_MAGIC), os.SEEK_END)
+            return f.read() == PARQUET_MAGIC
+    except OSError:
+        return False
+
+
+class IngestDaemon:
+    """Loads trip files into a storage backend as they land in a folder.
+
+    Files already in the folder are checked against the ingest manifest on
+    start, so the daemon also catches up after downtime. After that only
+    files the watcher reports are looked at. A file is loaded once it has
+    settled (see DEFAULT_SETTLE_SECONDS), through the same backend.load_file
+    as the loaders: its rows replace the file's previous rows in one
+    transaction, and the rollups, samples, month partitions, OD matrices
+    and Arrow cache are updated for that file alone. The data version moves
+    forward with every file, so cached query results are recomputed.
+    """
+
+    def __init__(self, backend, input_folder, taxi_types=None, settle_seconds=DEFAULT_SETTLE_SECONDS,
+                 watcher=None):
+        self.backend = backend
+        self.input_folder = input_folder
+        self.taxi_types = list(taxi_types or TAXI_TYPES)
+        self.settle_seconds = settle_seconds
+        self.watcher = watcher or open_watcher(input_folder)
+        self.stopping = threading.Event()
+        self._pending = {}   # file name -> (size, mtime_ns, when that state was first seen)
+        self._failed = {}    # file name -> (size, mtime_ns) of a version that failed to load
+        for taxi_type in self.taxi_types:
+            backend.prepare(taxi_type)
+
+    def _track(self, names):
+        now = time.monotonic()
+        for name in names:
+            if classify_file(name) in self.taxi_types:
+                self._pending.setdefault(name, (None, None, now))
+
+    def _settled(self):
+        """Return the pending files that are complete, updating the state of the others."""
+        now = time.monotonic()
+        ready = []
+        for name, (size, mtime, since) in list(self._pending.items()):
+            file_path = os.path.join(self.input_folder, name)
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                del self._pending[name]
+                continue
+            state = (stat.st_size, stat.st_mtime_ns)
+            if state != (size, mtime):
+                self._pending[name] = (*state, now)
+            elif now - since >= self.settle_seconds and parquet_complete(file_path):
+                del self._pending[name]
+                if self._failed.get(name) != state:
+                    ready.append(name)
+        return sorted(ready)
+
+    def load(self, file_name):
+        """Load one settled file unless the manifest says it is unchanged; return the rows written.
+
+        A file that fails to load is left alone until it changes, and one
+        moved or deleted before it was read is skipped; neither stops the
+        daemon.
+        """
+        taxi_type = classify_file(file_name)
+        file_path = os.path.join(self.input_folder, file_name)
+        started = time.perf_counter()
+        try:
+            load = self.backend.check_file(taxi_type, file_path)
+            if load.unchanged:
+                return 0
+            loader = load_loader(taxi_type)
+            transform = get_transform(taxi_type)
+            batches = (transform(df) for df in iter_parquet_batches(file_path, loader.BATCH_ROWS,
+                                                                    loader.READ_COLUMNS, loader.CATEGORY_COLUMNS))
+            rows = self.backend.load_file(load, batches)
+        except Exception as e:
+            try:
+                stat = os.stat(file_path)
+            except FileNotFoundError:
+                # The watcher reports it again if it comes back
+                print(f"{file_name}: removed before it was loaded. Skipping.")
+                return 0
+            self._failed[file_name] = (stat.st_size, stat.st_mtime_ns)
+            print(f"{file_name}: load failed, will retry when the file changes: {e}")
+            return 0
+        self._failed.pop(file_name, None)
+        print(f"{file_name}: {taxi_type} data queryable {time.perf_counter() - started:.1f}s after it settled")
+        return rows
+
+    def run(self):
+        """Watch and load until stop() is called (or SIGINT/SIGTERM when run from the command line)."""
+        print(f"Watching {self.input_folder} for {', '.join(self.taxi_types)} files ({self.watcher.name})")
+        self._track(_trip_files(self.input_folder, self.taxi_types))
+        while not self.stopping.is_set():
+            for file_name in self._settled():
+                if self.stopping.is_set():
+                    break
+                self.load(file_name)
+            timeout = self.settle_seconds if self._pending else DEFAULT_POLL_SECONDS
+            self._track(self.watcher.wait(timeout))
+
+    def stop(self):
+        self.stopping.set()
+
+    def close(self):
+        self.watcher.close()
+        self.backend.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch a folder and load new or changed taxi files as they land.")
+    parser.add_argument('--input-folder', default=INPUT_FOLDER)
+    parser.add_argument('--db', default=SQLITE_DB_PATH)
+    parser.add_argument('--backend', choices=STORAGE_BACKENDS, default=DEFAULT_STORAGE_BACKEND)
+    parser.add_argument('--dataset-root', default=DATASET_ROOT, help="root of the Parquet dataset (--backend parquet)")
+    parser.add_argument('--types', nargs='+', choices=list(TAXI_TYPES), default=list(TAXI_TYPES))
+    parser.add_argument('--settle-seconds', type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help="how long a file must stay unchanged before it is loaded")
+    parser.add_argument('--poll-seconds', type=float, default=DEFAULT_POLL_SECONDS,
+                        help="scan interval when inotify is not available")
+    parser.add_argument('--polling', action='store_true', help="poll the folder even where inotify is available")
+    parser.add_argument('--telemetry-jsonl', help="append per-stage telemetry of every file to this JSON lines file")
+    parser.add_argument('--prometheus-textfile', help="write stage metrics to this file for node_exporter")
+    args = parser.parse_args()
+
+    telemetry = None
+    if args.telemetry_jsonl or args.prometheus_textfile:
+        telemetry = TelemetrySink(args.telemetry_jsonl, args.prometheus_textfile)
+    backend = open_backend(args.backend, sqlite_db=args.db, dataset_root=args.dataset_root, telemetry=telemetry)
+    watcher = (PollingWatcher(args.input_folder, args.poll_seconds) if args.polling
+               else open_watcher(args.input_folder, args.poll_seconds))
+    daemon = IngestDaemon(backend, args.input_folder, args.types, args.settle_seconds, watcher)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: daemon.stop())
+    try:
+        daemon.run()
+    finally:
+        daemon.close()
+    print("Stopped watching.")
@@ -0,0 +1,204 @@
+import hashlib
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pyarrow.parquet as pq
+
+from dimension_tables import get_dimension
+from month_partitions import PartitionedBulkWriter, partitioning
+from quarantine import Quarantine, create_quarantine_table, delete_quarantine, quarantine_writer
+from query_cache import DATA_VERSIONS_TABLE_SQL, bump_data_version
+from rollups import create_rollup_table, delete_rollups, update_rollups
+from sqlite_bulk_writer import BulkWriter
+from time_encoding import (DEFAULT_TIME_ENCODING, TIME_BUCKET_COLUMNS, check_time_encoding,
+                           create_time_bucket_indexes)
+from trip_samples import create_sample_tables, delete_samples, sample_listener
+
+MANIFEST_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+    source_id INTEGER PRIMARY KEY,
+    file_name TEXT NOT NULL UNIQUE,
+    taxi_type TEXT NOT NULL,
+    file_size INTEGER,
+    file_mtime REAL,
+    content_hash TEXT,
+    rows_read INTEGER,
+    rows_loaded INTEGER,
+    loaded_at TEXT
+);
+'''
+
+HASH_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+class FileLoad:
+    """State of one source file compared with what the manifest recorded for it."""
+
+    def __init__(self, taxi_type, file_path, file_size, file_mtime, source_id=None,
+                 content_hash=None, status='new'):
+        self.taxi_type = taxi_type
+        self.file_path = file_path
+        self.file_name = os.path.basename(file_path)
+        self.file_size = file_size
+        self.file_mtime = file_mtime
+        self.source_id = source_id
+        self.content_hash = content_hash
+        self.status = status  # 'new', 'changed' or 'unchanged'
+        self.rows_read = None
+
+    @property
+    def unchanged(self):
+        return self.status == 'unchanged'
+
+
+def hash_file(file_path):
+    """Return the BLAKE2b hex digest of a file, read in large chunks."""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prepare_table(conn, table_name, time_encoding=DEFAULT_TIME_ENCODING):
+    """Create the manifest, rollup and data version tables and make sure a trip table can be replaced per file.
+
+    Tables created before the manifest existed get source_id and time bucket
+    columns; their old rows keep NULLs there and are never touched by a
+    replace. The table's time encoding is recorded (or checked) as well.
+    """
+    conn.execute(MANIFEST_TABLE_SQL)
+    conn.execute(DATA_VERSIONS_TABLE_SQL)
+    create_rollup_table(conn)
+    check_time_encoding(conn, table_name, time_encoding)
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table_name})')]
+    for column in ['source_id'] + TIME_BUCKET_COLUMNS:
+        if column not in columns:
+            conn.execute(f'ALTER TABLE {table_name} ADD COLUMN {column} INTEGER')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_source_id ON {table_name} (source_id)')
+    create_time_bucket_indexes(conn, table_name)
+
+
+def check_file(conn, taxi_type, file_path):
+    """Compare a file against the manifest and decide whether it needs loading.
+
+    Size and mtime are checked first so unchanged files cost one stat() call.
+    The content hash is only computed when they differ, which lets a touched
+    but identical file be skipped without reloading it.
+    """
+    stat = os.stat(file_path)
+    row = conn.execute(
+        'SELECT source_id, file_size, file_mtime, content_hash, loaded_at '
+        'FROM ingest_manifest WHERE file_name = ?',
+        (os.path.basename(file_path),)
+    ).fetchone()
+    load = FileLoad(taxi_type, file_path, stat.st_size, stat.st_mtime)
+    if row is None:
+        return load
+
+    source_id, size, mtime, content_hash, loaded_at = row
+    load.source_id = source_id
+    load.status = 'changed'
+    if loaded_at is None:
+        # A previous load was interrupted before it committed
+        return load
+    if size == stat.st_size and mtime == stat.st_mtime:
+        load.status = 'unchanged'
+        return load
+
+    load.content_hash = hash_file(file_path)
+    if load.content_hash == content_hash:
+        conn.execute('UPDATE ingest_manifest SET file_mtime = ? WHERE source_id = ?',
+                     (stat.st_mtime, source_id))
+        load.status = 'unchanged'
+    return load
+
+
+def begin_load(conn, load):
+    """Give a new file its source_id and fill in the hash and row count of load.
+
+    A new file gets a manifest row with no loaded_at, so a load that never
+    commits is seen as 'changed' by the next check_file.
+    """
+    if load.source_id is None:
+        cursor = conn.execute('INSERT INTO ingest_manifest (file_name, taxi_type) VALUES (?, ?)',
+                              (load.file_name, load.taxi_type))
+        load.source_id = cursor.lastrowid
+    if load.content_hash is None:
+        load.content_hash = hash_file(load.file_path)
+    if load.rows_read is None:
+        load.rows_read = pq.ParquetFile(load.file_path).metadata.num_rows
+    return load.source_id
+
+
+def record_load(conn, load, rows_loaded):
+    """Mark load's file as loaded with its current size, mtime and hash."""
+    conn.execute(
+        'UPDATE ingest_manifest SET taxi_type = ?, file_size = ?, file_mtime = ?, '
+        'content_hash = ?, rows_read = ?, rows_loaded = ?, loaded_at = ? '
+        'WHERE source_id = ?',
+        (load.taxi_type, load.file_size, load.file_mtime, load.content_hash,
+         load.rows_read, rows_loaded,
+         datetime.now(timezone.utc).isoformat(timespec='seconds'), load.source_id)
+    )
+
+
+@contextmanager
+def load_file_atomically(conn, load, table_name, columns, rollup_spec=None, dimensions=None, sample_rate=0,
+                         **writer_kwargs):
+    """Replace every row that came from load's file in one transaction.
+
+    Yields a BulkWriter whose rows are tagged with the file's source_id. The
+    previous rows of the file are deleted, the new rows are written and the
+    manifest entry is updated in the same transaction, so a reader sees either
+    the old month or the new month, never a mix. With a rollup_spec the file's
+    trip_rollups rows are replaced in the same transaction as well, and so is
+    its stratified sample when sample_rate is set (see trip_samples.py).
+    Rows rejected by the quality rules replace the file's rows in
+    <table>_quarantine instead (see quarantine.py).
+    Columns in dimensions are stored as lookup table ids (see
+    dimension_tables.py), and a table partitioned by month gets every row
+    in its month's partition (see month_partitions.py). The table's data version moves forward with the
+    commit, which invalidates cached query results.
+    """
+    dimensions = dimensions or {}
+    lookups = {stored: (source, get_dimension(conn, table)) for source, (stored, table) in dimensions.items()}
+    columns = [dimensions[col][0] if col in dimensions else col for col in columns]
+    encoders = {stored: (lambda df, source=source, lookup=lookup: lookup.encode(conn, df[source]))
+                for stored, (source, lookup) in lookups.items()}
+
+    create_quarantine_table(conn, table_name)
+    if sample_rate:
+        create_sample_tables(conn, table_name)
+    begin_load(conn, load)
+    writer_kwargs.setdefault('label', load.file_name)
+    writer_class = PartitionedBulkWriter if partitioning(conn, table_name) == 'month' else BulkWriter
+    try:
+        with writer_class(conn, table_name, columns, constants={'source_id': load.source_id},
+                          encoders=encoders, **writer_kwargs) as writer:
+            writer.delete_source(load.source_id)
+            delete_quarantine(conn, table_name, load.source_id)
+            writer.quarantine = Quarantine(
+                quarantine_writer(conn, load, table_name, writer.columns, encoders, writer.time_encoding)
+            )
+            if rollup_spec:
+                delete_rollups(conn, load.source_id)
+                writer.listeners.append(
+                    lambda df: update_rollups(conn, load.taxi_type, load.source_id, df, rollup_spec)
+                )
+            if sample_rate:
+                delete_samples(conn, table_name, load.source_id)
+                writer.listeners.append(
+                    sample_listener(conn, load, table_name, writer.columns, sample_rate, writer.time_encoding)
+                )
+            yield writer
+            record_load(conn, load, writer.rows_written)
+            bump_data_version(conn, table_name)
+    except BaseException:
+        for _, lookup in lookups.values():
+            lookup.rollback()
+        raise
+    for _, lookup in lookups.values():
+        lookup.commit()
+    writer.quarantine.report(load.file_name)
@@ -0,0 +1,268 @@
+import contextvars
+import json
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Ingest stages, in the order a batch passes through them:
+#   read      - Parquet decode into pandas
+#   parse     - turning the pickup/dropoff columns into datetime64 values
+#   transform - dropping incomplete rows and deriving duration, speed and buckets
+#   validate  - flagging rows that break the quality rules (see quality_rules.py)
+#   aggregate - updating trip_rollups from the batch
+#   write     - inserting the rows into SQLite or the Parquet dataset
+STAGES = ('read', 'parse', 'transform', 'validate', 'aggregate', 'write')
+
+PROMETHEUS_PREFIX = 'taxi_ingest'
+
+_current = contextvars.ContextVar('ingest_telemetry', default=None)
+
+
+def peak_rss_bytes():
+    """High-water mark of this process's resident memory, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageStats:
+    """Totals of one stage over every batch of a file."""
+
+    __slots__ = ('calls', 'wall_seconds', 'cpu_seconds', 'rows_in', 'rows_out', 'peak_rss_bytes')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.peak_rss_bytes = None
+
+    @property
+    def rows_dropped(self):
+        return self.rows_in - self.rows_out
+
+    def add(self, other):
+        self.calls += other['calls']
+        self.wall_seconds += other['wall_seconds']
+        self.cpu_seconds += other['cpu_seconds']
+        self.rows_in += other['rows_in']
+        self.rows_out += other['rows_out']
+        if other['peak_rss_bytes'] is not None:
+            self.peak_rss_bytes = max(self.peak_rss_bytes or 0, other['peak_rss_bytes'])
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class StageTimer:
+    """Measures one pass through a stage; set rows_in/rows_out on it inside the block."""
+
+    __slots__ = ('telemetry', 'name', 'rows_in', 'rows_out', '_wall', '_cpu')
+
+    def __init__(self, telemetry, name, rows_in=0):
+        self.telemetry = telemetry
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = rows_in
+
+    def __enter__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.telemetry is not None:
+            self.telemetry.stages.setdefault(self.name, StageStats()).add({
+                'calls': 1,
+                'wall_seconds': time.perf_counter() - self._wall,
+                'cpu_seconds': time.process_time() - self._cpu,
+                'rows_in': self.rows_in,
+                'rows_out': self.rows_out,
+                'peak_rss_bytes': peak_rss_bytes(),
+            })
+        return False
+
+
+class IngestTelemetry:
+    """Per-stage wall time, CPU time, row counts and peak memory of loading one file.
+
+    Code on the ingest path records into whichever IngestTelemetry is active
+    (see activate() and stage()), so the loaders, parallel_ingest and the
+    pipeline share the same instrumentation. Stages recorded in a worker
+    process come back as snapshot() dicts and are added with merge().
+    rejected counts the quarantined rows of the file per quality rule.
+    """
+
+    def __init__(self, taxi_type=None, file_name=None, backend=None):
+        self.taxi_type = taxi_type
+        self.file_name = file_name
+        self.backend = backend
+        self.stages = {}
+        self.rejected = {}
+
+    def stage(self, name, rows_in=0):
+        return StageTimer(self, name, rows_in)
+
+    def snapshot(self):
+        return {name: stats.to_dict() for name, stats in self.stages.items()}
+
+    def merge(self, snapshot):
+        for name, stats in snapshot.items():
+            self.stages.setdefault(name, StageStats()).add(stats)
+
+
+@contextmanager
+def activate(telemetry):
+    """Make telemetry the one stage() records into for the duration of the block."""
+    token = _current.set(telemetry)
+    try:
+        yield telemetry
+    finally:
+        _current.reset(token)
+
+
+def stage(name, rows_in=0):
+    """Time a stage into the active IngestTelemetry; a cheap no-op when none is active."""
+    return StageTimer(_current.get(), name, rows_in)
+
+
+def merge_stages(snapshot):
+    """Add stages recorded elsewhere, e.g. in a worker process, to the active IngestTelemetry."""
+    telemetry = _current.get()
+    if telemetry is not None:
+        telemetry.merge(snapshot)
+
+
+def count_rejections(counts):
+    """Add {quality rule: rows} quarantined from a batch to the active IngestTelemetry."""
+    telemetry = _current.get()
+    if telemetry is not None:
+        for rule, count in counts.items():
+            telemetry.rejected[rule] = telemetry.rejected.get(rule, 0) + count
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class TelemetrySink:
+    """Collects the telemetry of every file of a run and writes it out.
+
+    Each finished file appends one JSON line per stage (plus a 'file' line
+    with the whole file's wall and CPU time and its quarantined rows per
+    quality rule) to jsonl_path. prometheus_path
+    is rewritten atomically after every file with the run's totals per taxi
+    type and stage, in the text format read by node_exporter's textfile
+    collector. Either path may be None.
+    """
+
+    def __init__(self, jsonl_path=None, prometheus_path=None, run_id=None):
+        self.jsonl_path = jsonl_path
+        self.prometheus_path = prometheus_path
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.totals = {}       # (taxi_type, stage) -> StageStats
+        self.files = {}        # (taxi_type, status) -> count
+        self.file_seconds = {}  # taxi_type -> wall seconds of whole files
+        self.last_success = {}  # taxi_type -> unix time
+        self.rejected = {}     # (taxi_type, rule) -> rows
+
+    @contextmanager
+    def track(self, taxi_type, file_path, backend=None):
+        """Activate a new IngestTelemetry for one file and emit it when the block exits."""
+        telemetry = IngestTelemetry(taxi_type, os.path.basename(file_path), backend)
+        started_wall, started_cpu = time.perf_counter(), time.process_time()
+        status = 'failed'
+        try:
+            with activate(telemetry):
+                yield telemetry
+            status = 'ok'
+        finally:
+            self.emit(telemetry, status, time.perf_counter() - started_wall,
+                      time.process_time() - started_cpu)
+
+    def emit(self, telemetry, status, wall_seconds, cpu_seconds):
+        taxi_type = telemetry.taxi_type
+        for name, stats in telemetry.stages.items():
+            self.totals.setdefault((taxi_type, name), StageStats()).add(stats.to_dict())
+        for rule, count in telemetry.rejected.items():
+            self.rejected[(taxi_type, rule)] = self.rejected.get((taxi_type, rule), 0) + count
+        self.files[(taxi_type, status)] = self.files.get((taxi_type, status), 0) + 1
+        self.file_seconds[taxi_type] = self.file_seconds.get(taxi_type, 0.0) + wall_seconds
+        if status == 'ok':
+            self.last_success[taxi_type] = time.time()
+
+        if self.jsonl_path:
+            self._append_jsonl(telemetry, status, wall_seconds, cpu_seconds)
+        if self.prometheus_path:
+            self._write_prometheus()
+
+    def _append_jsonl(self, telemetry, status, wall_seconds, cpu_seconds):
+        common = {
+            'ts': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'run_id': self.run_id,
+            'taxi_type': telemetry.taxi_type,
+            'file': telemetry.file_name,
+            'backend': telemetry.backend,
+            'status': status,
+        }
+        ordered = sorted(telemetry.stages.items(),
+                         key=lambda item: STAGES.index(item[0]) if item[0] in STAGES else len(STAGES))
+        lines = [dict(common, stage=name, rows_dropped=stats.rows_dropped, **stats.to_dict())
+                 for name, stats in ordered]
+        lines.append(dict(common, stage='file', wall_seconds=wall_seconds, cpu_seconds=cpu_seconds,
+                          peak_rss_bytes=peak_rss_bytes(), rows_rejected=telemetry.rejected))
+        with open(self.jsonl_path, 'a') as f:
+            for line in lines:
+                f.write(json.dumps(line) + '\n')
+
+    def _write_prometheus(self):
+        metrics = {
+            'stage_wall_seconds': ('Wall-clock seconds spent in each stage in the last run.', 'wall_seconds'),
+            'stage_cpu_seconds': ('CPU seconds spent in each stage in the last run.', 'cpu_seconds'),
+            'stage_rows_in': ('Rows entering each stage in the last run.', 'rows_in'),
+            'stage_rows_out': ('Rows leaving each stage in the last run.', 'rows_out'),
+            'stage_rows_dropped': ('Rows dropped by each stage in the last run.', 'rows_dropped'),
+            'stage_peak_rss_bytes': ('Process peak RSS observed at the end of each stage.', 'peak_rss_bytes'),
+        }
+        lines = []
+        for metric, (help_text, attr) in metrics.items():
+            name = f'{PROMETHEUS_PREFIX}_{metric}'
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+            for (taxi_type, stage_name), stats in sorted(self.totals.items()):
+                value = getattr(stats, attr)
+                if value is not None:
+                    lines.append(f'{name}{{taxi_type="{_label_value(taxi_type)}",'
+                                 f'stage="{_label_value(stage_name)}"}} {value}')
+
+        name = f'{PROMETHEUS_PREFIX}_files'
+        lines += [f'# HELP {name} Files processed in the last run by outcome.', f'# TYPE {name} gauge']
+        for (taxi_type, status), count in sorted(self.files.items()):
+            lines.append(f'{name}{{taxi_type="{_label_value(taxi_type)}",status="{status}"}} {count}')
+        name = f'{PROMETHEUS_PREFIX}_rows_rejected'
+        lines += [f'# HELP {name} Rows quarantined by each quality rule in the last run.', f'# TYPE {name} gauge']
+        for (taxi_type, rule), count in sorted(self.rejected.items()):
+            lines.append(f'{name}{{taxi_type="{_label_value(taxi_type)}",rule="{_label_value(rule)}"}} {count}')
+        name = f'{PROMETHEUS_PREFIX}_file_wall_seconds'
+        lines += [f'# HELP {name} Wall-clock seconds of whole files in the last run.', f'# TYPE {name} gauge']
+        for taxi_type, seconds in sorted(self.file_seconds.items()):
+            lines.append(f'{name}{{taxi_type="{_label_value(taxi_type)}"}} {seconds}')
+        name = f'{PROMETHEUS_PREFIX}_last_success_timestamp_seconds'
+        lines += [f'# HELP {name} Unix time of the last successfully loaded file.', f'# TYPE {name} gauge']
+        for taxi_type, timestamp in sorted(self.last_success.items()):
+            lines.append(f'{name}{{taxi_type="{_label_value(taxi_type)}"}} {timestamp}')
+
+        tmp_path = f'{self.prometheus_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.prometheus_path)
@@ -1,87 +1,150 @@
-import sqlite3
-import pandas as pd
-import os
-
-# Function to clean and transform FHV data
-def clean_and_transform_fhv_data(df):
-    # Convert datetime columns to datetime format
-    datetime_columns = ['pickup_datetime', 'dropOff_datetime']
-    for col in datetime_columns:
-        df[col] = pd.to_datetime(df[col], errors='coerce')
-    
-    # Drop rows with missing datetime values
-    df = df.dropna(subset=['pickup_datetime', 'dropOff_datetime'])
-    
-    # Calculate trip duration in hours
-    df['trip_duration'] = (df['dropOff_datetime'] - df['pickup_datetime']).dt.total_seconds() / 3600  # in hours
-
-    # Calculate average speed in miles per hour (assuming trip distance is included elsewhere if needed)
-    # Here, assuming you don't have 'trip_miles' available based on the columns you listed
-
-     # Aggregate data: total trips
-    df['date'] = df['pickup_datetime'].dt.date
-    daily_aggregates = df.groupby('date').agg(
-            total_trips=pd.NamedAgg(column='pickup_datetime', aggfunc='count')
-        ).reset_index()
-    print(daily_aggregates.head(10))
-
-    # Keep only relevant columns for insertion into SQLite
-    df = df[['dispatching_base_num', 'pickup_datetime', 'dropOff_datetime', 'PUlocationID', 'DOlocationID', 'SR_Flag', 'Affiliated_base_number', 'trip_duration']]
-    
-    return df
-
-# Function to insert data into SQLite
-def insert_into_sqlite(df, sqlite_db):
-    # Create a connection to SQLite database
-    conn = sqlite3.connect(sqlite_db)
-    cursor = conn.cursor()
-
-    # Drop the existing table if it exists
-    cursor.execute('DROP TABLE IF EXISTS fhv_trip_data')
-
-    # Create the table with the correct schema
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS fhv_trip_data (
-        dispatching_base_num TEXT,
-        pickup_datetime DATETIME NOT NULL,
-        dropOff_datetime DATETIME NOT NULL,
-        PUlocationID INTEGER,
-        DOlocationID INTEGER,
-        SR_Flag TEXT,
-        Affiliated_base_number TEXT,
-        trip_duration REAL
-    );
-    ''')
-
-    # Insert the data into the table
-    df.to_sql('fhv_trip_data', conn, if_exists='append', index=False, chunksize=1000)
-
-    # Commit the transaction and close the connection
-    conn.commit()
-    conn.close()
-
-# Folder path containing the FHV data file(s)
-input_folder = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\data"
-sqlite_db_path = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\taxi_data.db"
-
-# Loop through all files in the data folder
-for file_name in os.listdir(input_folder):
-    if file_name.endswith(".parquet") and "fhv" in file_name and "fhvhv" not in file_name:
-        file_path = os.path.join(input_folder, file_name)
-
-        # Read the FHV data
-        df = pd.read_parquet(file_path)
-
-        # Debugging block
-        print(f"Processing file: {file_name}")
-        print(f"Columns in DataFrame: {df.columns.tolist()}")
-
-        # Process the data
-        processed_data = clean_and_transform_fhv_data(df)
-
-        # Insert the processed data into the SQLite database
-        insert_into_sqlite(processed_data, sqlite_db_path)
-
-        print(f"Data from {file_name} inserted into SQLite successfully.")
-
-print("Data processing and insertion completed.")
+import os
+
+from parquet_stream import DEFAULT_BATCH_ROWS, iter_parquet_batches, parquet_columns
+from arrow_cache import DEFAULT_ARROW_CACHE
+from dimension_tables import create_dimension_tables, create_named_view
+from ingest_manifest import prepare_table
+from ingest_telemetry import TelemetrySink
+from month_partitions import DEFAULT_PARTITIONING, prepare_partitions
+from storage_backends import DEFAULT_STORAGE_BACKEND, open_backend
+from time_encoding import DEFAULT_TIME_ENCODING
+from transform_engine import source_columns, transform_trips
+from trip_samples import DEFAULT_SAMPLE_RATE
+
+TABLE_NAME = 'fhv_trip_data'
+COLUMNS = ['dispatching_base_num', 'pickup_datetime', 'dropOff_datetime', 'PUlocationID', 'DOlocationID', 'SR_Flag', 'Affiliated_base_number', 'trip_duration', 'pickup_hour', 'pickup_date', 'pickup_month']
+
+# Columns used for the hour/day/month (and passenger count) rollups in trip_rollups
+ROLLUP_COLUMNS = {'pickup': 'pickup_datetime'}
+
+# Columns of the per-month, per-hour-of-week origin-destination matrices (see od_matrices.py)
+OD_COLUMNS = {'pickup': 'pickup_datetime', 'origin': 'PUlocationID', 'destination': 'DOlocationID'}
+
+CREATE_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS fhv_trip_data (
+    dispatching_base_id INTEGER,
+    pickup_datetime DATETIME NOT NULL,
+    dropOff_datetime DATETIME NOT NULL,
+    PUlocationID INTEGER,
+    DOlocationID INTEGER,
+    sr_flag_id INTEGER,
+    affiliated_base_id INTEGER,
+    trip_duration REAL,
+    source_id INTEGER,
+    pickup_hour INTEGER,
+    pickup_date INTEGER,
+    pickup_month INTEGER
+);
+'''
+
+# Data-quality rules (see quality_rules.py): a row matching every condition of
+# a rule is quarantined under the rule's name instead of loaded. Durations are
+# in hours and speeds in mph.
+QUALITY_RULES = {
+    'negative_duration': [('trip_duration', '<', 0)],
+    'over_24_hours': [('trip_duration', '>', 24)],
+}
+
+# Source columns for the shared transform engine (see transform_engine.py)
+TRANSFORM_SCHEMA = {
+    'pickup': 'pickup_datetime',
+    'dropoff': 'dropOff_datetime',
+    'distance': None,
+    'dtypes': {'PUlocationID': 'int16', 'DOlocationID': 'int16'},
+    'categories': ['dispatching_base_num', 'Affiliated_base_number', 'SR_Flag'],
+    'rules': QUALITY_RULES,
+}
+
+# Source columns read from Parquet (every other column is skipped) and the
+# low-cardinality strings among them that are held as categoricals
+READ_COLUMNS = source_columns(TRANSFORM_SCHEMA, COLUMNS)
+CATEGORY_COLUMNS = TRANSFORM_SCHEMA.get('categories', [])
+
+# Text columns stored as ids of lookup tables (see dimension_tables.py); the
+# fhv_trip_data_named view joins the text back in
+DIMENSIONS = {
+    'dispatching_base_num': ('dispatching_base_id', 'fhv_bases'),
+    'Affiliated_base_number': ('affiliated_base_id', 'fhv_bases'),
+    'SR_Flag': ('sr_flag_id', 'fhv_sr_flags'),
+}
+
+# Rows read, cleaned and written per batch; None streams one Parquet row group at a time
+BATCH_ROWS = DEFAULT_BATCH_ROWS
+
+# Timestamp storage: 'text' ('YYYY-MM-DD HH:MM:SS') or 'epoch' (integer seconds)
+TIME_ENCODING = DEFAULT_TIME_ENCODING
+
+# Trip table layout: 'month' (one table per pickup month, so queries over a
+# time range only read those months; see month_partitions.py) or 'none'
+PARTITIONING = DEFAULT_PARTITIONING
+
+# Share of every month/hour stratum kept in the fhv_trip_data_sample table for
+# fast approximate queries (see trip_samples.py); 0 turns sampling off
+SAMPLE_RATE = DEFAULT_SAMPLE_RATE
+
+# Also keep the cleaned trips as memory-mappable Arrow files, one per month, for
+# zero-copy reads by the analysis layer (see arrow_cache.py); False turns it off
+ARROW_CACHE = DEFAULT_ARROW_CACHE
+
+# Where the main loop stores the cleaned data: 'sqlite' (taxi_data.db) or
+# 'parquet' (a partitioned Parquet dataset queried with DuckDB)
+STORAGE_BACKEND = DEFAULT_STORAGE_BACKEND
+
+# Function to clean and transform FHV data
+def clean_and_transform_fhv_data(df):
+    # Drop rows with missing timestamps, derive trip_duration, avg_speed and the
+    # pickup time buckets, and keep only the columns stored in SQLite
+    return transform_trips(df, TRANSFORM_SCHEMA, COLUMNS)
+
+# Function to create the table (idempotent), its lookup tables and the ingest manifest
+def create_table(conn):
+    conn.execute(CREATE_TABLE_SQL)
+    prepare_table(conn, TABLE_NAME, TIME_ENCODING)
+    create_dimension_tables(conn, TABLE_NAME, DIMENSIONS)
+    prepare_partitions(conn, TABLE_NAME, PARTITIONING, ROLLUP_COLUMNS['pickup'], TIME_ENCODING)
+    create_named_view(conn, TABLE_NAME, DIMENSIONS)
+
+if __name__ == "__main__":
+    # Folder path containing the FHV data file(s)
+    input_folder = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\data"
+    sqlite_db_path = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\taxi_data.db"
+    dataset_root = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\taxi_dataset"
+    telemetry_jsonl = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\ingest_telemetry.jsonl"
+    prometheus_textfile = r"C:\\Users\\Minfy\\Desktop\\Assignment-d2k-tech\\taxi_ingest.prom"
+
+    # Per-stage timings of every file, as JSON lines and a Prometheus textfile
+    telemetry = TelemetrySink(telemetry_jsonl, prometheus_textfile)
+
+    # Open the storage backend for the whole run and make sure the table exists
+    backend = open_backend(STORAGE_BACKEND, sqlite_db=sqlite_db_path, dataset_root=dataset_root,
+                           telemetry=telemetry)
+    backend.prepare('fhv')
+
+    # Loop through all files in the data folder
+    for file_name in os.listdir(input_folder):
+        if file_name.endswith(".parquet") and "fhv" in file_name and "fhvhv" not in file_name:
+            file_path = os.path.join(input_folder, file_name)
+
+            # Skip files the manifest says are already loaded and unchanged
+            load = backend.check_file('fhv', file_path)
+            if load.unchanged:
+                print(f"{file_name} unchanged since last load. Skipping.")
+                continue
+
+            # Debugging block
+            print(f"Processing file: {file_name}")
+            print(f"Columns in DataFrame: {parquet_columns(file_path)}")
+
+            # Stream the FHV data batch by batch and process each batch lazily
+            processed_batches = (
+                clean_and_transform_fhv_data(df)
+                for df in iter_parquet_batches(file_path, BATCH_ROWS, READ_COLUMNS, CATEGORY_COLUMNS)
+            )
+
+            # Write the processed data to the storage backend
+            backend.load_file(load, processed_batches)
+
+            print(f"Data from {file_name} inserted into {STORAGE_BACKEND} successfully.")
+
+    backend.close()
+    print("Data processing and insertion completed.")
@@ -1,111 +1,143 @@
-import pandas as pd
-import sqlite3
-import os
-
-# Define the SQLite database connection
-conn = sqlite3.connect('taxi_data.db')
-cursor = conn.cursor()
-
-# Function to clean and transform green taxi data
-def clean_and_transform_green_taxi_data(df):
-    # Define the column names for green taxi
-    pickup_col, dropoff_col = 'lpep_pickup_datetime', 'lpep_dropoff_datetime'
-    
-    # Convert pickup and dropoff time to datetime
-    df[pickup_col] = pd.to_datetime(df[pickup_col], errors='coerce')
-    df[dropoff_col] = pd.to_datetime(df[dropoff_col], errors='coerce')
-
-    # Remove rows with missing or corrupt data
-    df = df.dropna(subset=[pickup_col, dropoff_col, 'fare_amount'])
-
-    # Derive new columns: trip duration in hours and avg speed
-    df['trip_duration'] = (df[dropoff_col] - df[pickup_col]).dt.total_seconds() / 3600  # in hours
-    df['avg_speed'] = df['trip_distance'] / df['trip_duration']  # in miles per hour
-
-    # Ensure avg_speed is meaningful; replace infinity and NaN with 0
-    df['avg_speed'] = df['avg_speed'].replace([float('inf'), -float('inf')], 0).fillna(0)
-
-    # Aggregate data: total trips and average fare per day
-    df['date'] = df['tpep_pickup_datetime'].dt.date
-    daily_aggregates = df.groupby('date').agg(
-            total_trips=pd.NamedAgg(column='tpep_pickup_datetime', aggfunc='count'),
-            avg_fare=pd.NamedAgg(column='fare_amount', aggfunc='mean')
-        ).reset_index()
-    print(daily_aggregates.head(10))
-
-    # Convert datetime columns to strings (ISO format)
-    df[pickup_col] = df[pickup_col].dt.strftime('%Y-%m-%d %H:%M:%S')
-    df[dropoff_col] = df[dropoff_col].dt.strftime('%Y-%m-%d %H:%M:%S')
-
-    return df
-
-# Function to insert the data into SQLite database
-def insert_data_to_db(df):
-    # Drop the table if it exists to avoid schema mismatch
-    cursor.execute('DROP TABLE IF EXISTS green_taxi_data')
-
-    # Create the table with the correct schema
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS green_taxi_data (
-        lpep_pickup_datetime DATETIME NOT NULL,
-        lpep_dropoff_datetime DATETIME NOT NULL,
-        PULocationID INTEGER,
-        DOLocationID INTEGER,
-        passenger_count REAL,
-        trip_distance REAL,
-        trip_duration REAL,
-        avg_speed REAL,
-        fare_amount REAL
-    )
-    ''')
-
-    # Insert the cleaned and transformed data into the database
-    for _, row in df.iterrows():
-        cursor.execute('''
-        INSERT INTO green_taxi_data (
-            lpep_pickup_datetime,
-            lpep_dropoff_datetime,
-            PULocationID,
-            DOLocationID,
-            passenger_count,
-            trip_distance,
-            trip_duration,
-            avg_speed,
-            fare_amount
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            row['lpep_pickup_datetime'],
-            row['lpep_dropoff_datetime'],
-            row['PULocationID'],
-            row['DOLocationID'],
-            row['passenger_count'],
-            row['trip_distance'],
-            row['trip_duration'],
-            row['avg_speed'],
-            row['fare_amount']
-        ))
-    conn.commit()
-
-# Define the folder path containing the files
-input_folder = r'C:\Users\Minfy\Desktop\Assignment-d2k-tech\data'
-
-# Loop through all files in the data folder
-for file_name in os.listdir(input_folder):
-    if file_name.endswith(".parquet") and "green" in file_name.lower():  # Check if the file is a green taxi file
-        file_path = os.path.join(input_folder, file_name)
-        
-        # Read the green taxi data
-        green_taxi_data = pd.read_parquet(file_path)
-        
-        # Clean and transform the green taxi data
-        processed_green_taxi_data = clean_and_transform_green_taxi_data(green_taxi_data)
-        
-        # Insert the processed data into SQLite database
-        insert_data_to_db(processed_green_taxi_data)
-        
-        print(f"Processed and inserted green taxi data from {file_name} into the database.")
-
-# Close the database connection
-conn.close()
-
-print("Green taxi data processing and insertion into the database is complete.")
+import os
+
+from parquet_stream import DEFAULT_BATCH_ROWS, iter_parquet_batches
+from arrow_cache import DEFAULT_ARROW_CACHE
+from ingest_manifest import prepare_table
+from ingest_telemetry import TelemetrySink
+from month_partitions import DEFAULT_PARTITIONING, prepare_partitions
+from storage_backends import DEFAULT_STORAGE_BACKEND, open_backend
+from time_encoding import DEFAULT_TIME_ENCODING
+from transform_engine import source_columns, transform_trips
+from trip_samples import DEFAULT_SAMPLE_RATE
+
+TABLE_NAME = 'green_taxi_data'
+COLUMNS = ['lpep_pickup_datetime', 'lpep_dropoff_datetime', 'PULocationID', 'DOLocationID', 'passenger_count', 'trip_distance', 'trip_duration', 'avg_speed', 'fare_amount', 'pickup_hour', 'pickup_date', 'pickup_month']
+
+# Columns used for the hour/day/month (and passenger count) rollups in trip_rollups
+ROLLUP_COLUMNS = {'pickup': 'lpep_pickup_datetime', 'fare': 'fare_amount', 'distance': 'trip_distance', 'passenger': 'passenger_count'}
+
+# Columns of the per-month, per-hour-of-week origin-destination matrices (see od_matrices.py)
+OD_COLUMNS = {'pickup': 'lpep_pickup_datetime', 'origin': 'PULocationID', 'destination': 'DOLocationID', 'fare': 'fare_amount'}
+
+CREATE_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS green_taxi_data (
+    lpep_pickup_datetime DATETIME NOT NULL,
+    lpep_dropoff_datetime DATETIME NOT NULL,
+    PULocationID INTEGER,
+    DOLocationID INTEGER,
+    passenger_count REAL,
+    trip_distance REAL,
+    trip_duration REAL,
+    avg_speed REAL,
+    fare_amount REAL,
+    source_id INTEGER,
+    pickup_hour INTEGER,
+    pickup_date INTEGER,
+    pickup_month INTEGER
+)
+'''
+
+# Data-quality rules (see quality_rules.py): a row matching every condition of
+# a rule is quarantined under the rule's name instead of loaded. Durations are
+# in hours and speeds in mph.
+QUALITY_RULES = {
+    'negative_duration': [('trip_duration', '<', 0)],
+    'over_24_hours': [('trip_duration', '>', 24)],
+    'negative_distance': [('trip_distance', '<', 0)],
+    'zero_duration_with_distance': [('trip_duration', '==', 0), ('trip_distance', '>', 0)],
+    'impossible_speed': [('avg_speed', '>', 100)],
+    'zero_distance_with_fare': [('trip_distance', '==', 0), ('fare_amount', '>', 0)],
+    'negative_fare': [('fare_amount', '<', 0)],
+}
+
+# Source columns for the shared transform engine (see transform_engine.py)
+TRANSFORM_SCHEMA = {
+    'pickup': 'lpep_pickup_datetime',
+    'dropoff': 'lpep_dropoff_datetime',
+    'distance': 'trip_distance',
+    'required': ['fare_amount'],
+    'zero_invalid_speed': True,
+    'dtypes': {'PULocationID': 'int16', 'DOLocationID': 'int16', 'passenger_count': 'int8', 'fare_amount': 'float32'},
+    'rules': QUALITY_RULES,
+}
+
+# Source columns read from Parquet (every other column is skipped) and the
+# low-cardinality strings among them that are held as categoricals
+READ_COLUMNS = source_columns(TRANSFORM_SCHEMA, COLUMNS)
+CATEGORY_COLUMNS = TRANSFORM_SCHEMA.get('categories', [])
+
+# Text columns stored as ids of lookup tables (see dimension_tables.py)
+DIMENSIONS = {}
+
+# Rows read, cleaned and written per batch; None streams one Parquet row group at a time
+BATCH_ROWS = DEFAULT_BATCH_ROWS
+
+# Timestamp storage: 'text' ('YYYY-MM-DD HH:MM:SS') or 'epoch' (integer seconds)
+TIME_ENCODING = DEFAULT_TIME_ENCODING
+
+# Trip table layout: 'month' (one table per pickup month, so queries over a
+# time range only read those months; see month_partitions.py) or 'none'
+PARTITIONING = DEFAULT_PARTITIONING
+
+# Share of every month/hour stratum kept in the green_taxi_data_sample table for
+# fast approximate queries (see trip_samples.py); 0 turns sampling off
+SAMPLE_RATE = DEFAULT_SAMPLE_RATE
+
+# Also keep the cleaned trips as memory-mappable Arrow files, one per month, for
+# zero-copy reads by the analysis layer (see arrow_cache.py); False turns it off
+ARROW_CACHE = DEFAULT_ARROW_CACHE
+
+# Where the main loop stores the cleaned data: 'sqlite' (taxi_data.db) or
+# 'parquet' (a partitioned Parquet dataset queried with DuckDB)
+STORAGE_BACKEND = DEFAULT_STORAGE_BACKEND
+
+# Function to clean and transform green taxi data
+def clean_and_transform_green_taxi_data(df):
+    # Drop rows with missing timestamps or fare, derive trip_duration, avg_speed and the
+    # pickup time buckets, and keep only the columns stored in SQLite
+    return transform_trips(df, TRANSFORM_SCHEMA, COLUMNS)
+
+# Function to create the table (idempotent) and the ingest manifest
+def create_table(conn):
+    conn.execute(CREATE_TABLE_SQL)
+    prepare_table(conn, TABLE_NAME, TIME_ENCODING)
+    prepare_partitions(conn, TABLE_NAME, PARTITIONING, ROLLUP_COLUMNS['pickup'], TIME_ENCODING)
+
+if __name__ == "__main__":
+    # Per-stage timings of every file, as JSON lines and a Prometheus textfile
+    telemetry = TelemetrySink('ingest_telemetry.jsonl', 'taxi_ingest.prom')
+
+    # Open the storage backend (the SQLite database is tuned for bulk loading)
+    backend = open_backend(STORAGE_BACKEND, sqlite_db='taxi_data.db', dataset_root='taxi_dataset',
+                           telemetry=telemetry)
+    backend.prepare('green')
+
+    # Define the folder path containing the files
+    input_folder = r'C:\Users\Minfy\Desktop\Assignment-d2k-tech\data'
+
+    # Loop through all files in the data folder
+    for file_name in os.listdir(input_folder):
+        if file_name.endswith(".parquet") and "green" in file_name.lower():  # Check if the file is a green taxi file
+            file_path = os.path.join(input_folder, file_name)
+
+            # Skip files the manifest says are already loaded and unchanged
+            load = backend.check_file('green', file_path)
+            if load.unchanged:
+                print(f"{file_name} unchanged since last load. Skipping.")
+                continue
+
+            # Stream the green taxi data batch by batch, cleaning and transforming each batch lazily
+            processed_green_taxi_batches = (
+                clean_and_transform_green_taxi_data(green_taxi_data)
+                for green_taxi_data in iter_parquet_batches(file_path, BATCH_ROWS, READ_COLUMNS, CATEGORY_COLUMNS)
+            )
+
+            # Write the processed data to the storage backend
+            backend.load_file(load, processed_green_taxi_batches)
+
+            print(f"Processed and inserted green taxi data from {file_name} into the {STORAGE_BACKEND} backend.")
+
+    # Close the storage backend
+    backend.close()
+
+    print("Green taxi data processing and insertion into the database is complete.")
@@ -1,80 +1,143 @@
-import sqlite3
-import pandas as pd
-import os
-
-# Function to clean and transform Yellow Taxi data
-def clean_and_transform_yellow_data(df):
-    # Convert datetime columns to datetime format
-    df['tpep_pickup_datetime'] = pd.to_datetime(df['tpep_pickup_datetime'], errors='coerce')
-    df['tpep_dropoff_datetime'] = pd.to_datetime(df['tpep_dropoff_datetime'], errors='coerce')
-
-    # Remove rows with missing pickup or dropoff datetimes
-    df = df.dropna(subset=['tpep_pickup_datetime', 'tpep_dropoff_datetime'])
-
-    # Calculate trip_duration in hours
-    df['trip_duration'] = (df['tpep_dropoff_datetime'] - df['tpep_pickup_datetime']).dt.total_seconds() / 3600  # in hours
-
-    # Calculate average speed in miles per hour (avg_speed = trip_distance / trip_duration)
-    df['avg_speed'] = df['trip_distance'] / df['trip_duration']
-
-    # Aggregate data: total trips and average fare per day
-    df['date'] = df['tpep_pickup_datetime'].dt.date
-    daily_aggregates = df.groupby('date').agg(
-            total_trips=pd.NamedAgg(column='tpep_pickup_datetime', aggfunc='count'),
-            avg_fare=pd.NamedAgg(column='fare_amount', aggfunc='mean')
-        ).reset_index()
-    print(daily_aggregates.head(10))
-
-    # Keep only the necessary columns for insertion into SQLite
-    df = df[['tpep_pickup_datetime', 'tpep_dropoff_datetime', 'PULocationID', 'DOLocationID', 'trip_distance', 'fare_amount', 'passenger_count', 'trip_duration', 'avg_speed']]
-
-    return df
-
-# Function to insert data into SQLite
-def insert_into_sqlite(df, sqlite_db):
-    # Create a connection to SQLite database
-    conn = sqlite3.connect(sqlite_db)
-    cursor = conn.cursor()
-
-    # Create the table if it doesn't exist already
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS yellow_taxi_data (
-        tpep_pickup_datetime DATETIME NOT NULL,
-        tpep_dropoff_datetime DATETIME NOT NULL,
-        PULocationID INTEGER,
-        DOLocationID INTEGER,
-        trip_distance REAL,
-        fare_amount REAL,
-        passenger_count INTEGER,
-        trip_duration REAL,
-        avg_speed REAL
-    );
-    ''')
-
-    # Insert the data into the table
-    df.to_sql('yellow_taxi_data', conn, if_exists='append', index=False, chunksize=1000)
-
-    # Commit the transaction and close the connection
-    conn.commit()
-    conn.close()
-
-# Folder path containing the Yellow Taxi data file(s)
-input_folder = r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\data"
-
-# Loop through all files in the data folder
-for file_name in os.listdir(input_folder):
-    if file_name.endswith(".parquet") and "yellow" in file_name:
-        file_path = os.path.join(input_folder, file_name)
-
-        # Read the Yellow Taxi data
-        df = pd.read_parquet(file_path)
-
-        # Process the data
-        processed_data = clean_and_transform_yellow_data(df)
-
-        # Insert the processed data into the SQLite database
-        insert_into_sqlite(processed_data, r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\taxi_data.db")
-
-        print(f"Data from {file_name} inserted into SQLite successfully.")
-
-print("Data processing and insertion completed.")
+import os
+
+from parquet_stream import DEFAULT_BATCH_ROWS, iter_parquet_batches
+from arrow_cache import DEFAULT_ARROW_CACHE
+from ingest_manifest import prepare_table
+from ingest_telemetry import TelemetrySink
+from month_partitions import DEFAULT_PARTITIONING, prepare_partitions
+from storage_backends import DEFAULT_STORAGE_BACKEND, open_backend
+from time_encoding import DEFAULT_TIME_ENCODING
+from transform_engine import source_columns, transform_trips
+from trip_samples import DEFAULT_SAMPLE_RATE
+
+TABLE_NAME = 'yellow_taxi_data'
+COLUMNS = ['tpep_pickup_datetime', 'tpep_dropoff_datetime', 'PULocationID', 'DOLocationID', 'trip_distance', 'fare_amount', 'passenger_count', 'trip_duration', 'avg_speed', 'pickup_hour', 'pickup_date', 'pickup_month']
+
+# Columns used for the hour/day/month (and passenger count) rollups in trip_rollups
+ROLLUP_COLUMNS = {'pickup': 'tpep_pickup_datetime', 'fare': 'fare_amount', 'distance': 'trip_distance', 'passenger': 'passenger_count'}
+
+# Columns of the per-month, per-hour-of-week origin-destination matrices (see od_matrices.py)
+OD_COLUMNS = {'pickup': 'tpep_pickup_datetime', 'origin': 'PULocationID', 'destination': 'DOLocationID', 'fare': 'fare_amount'}
+
+CREATE_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS yellow_taxi_data (
+    tpep_pickup_datetime DATETIME NOT NULL,
+    tpep_dropoff_datetime DATETIME NOT NULL,
+    PULocationID INTEGER,
+    DOLocationID INTEGER,
+    trip_distance REAL,
+    fare_amount REAL,
+    passenger_count INTEGER,
+    trip_duration REAL,
+    avg_speed REAL,
+    source_id INTEGER,
+    pickup_hour INTEGER,
+    pickup_date INTEGER,
+    pickup_month INTEGER
+);
+'''
+
+# Data-quality rules (see quality_rules.py): a row matching every condition of
+# a rule is quarantined under the rule's name instead of loaded. Durations are
+# in hours and speeds in mph.
+QUALITY_RULES = {
+    'negative_duration': [('trip_duration', '<', 0)],
+    'over_24_hours': [('trip_duration', '>', 24)],
+    'negative_distance': [('trip_distance', '<', 0)],
+    'zero_duration_with_distance': [('trip_duration', '==', 0), ('trip_distance', '>', 0)],
+    'impossible_speed': [('avg_speed', '>', 100)],
+    'zero_distance_with_fare': [('trip_distance', '==', 0), ('fare_amount', '>', 0)],
+    'negative_fare': [('fare_amount', '<', 0)],
+}
+
+# Source columns for the shared transform engine (see transform_engine.py)
+TRANSFORM_SCHEMA = {
+    'pickup': 'tpep_pickup_datetime',
+    'dropoff': 'tpep_dropoff_datetime',
+    'distance': 'trip_distance',
+    'dtypes': {'PULocationID': 'int16', 'DOLocationID': 'int16', 'passenger_count': 'int8', 'fare_amount': 'float32'},
+    'rules': QUALITY_RULES,
+}
+
+# Source columns read from Parquet (every other column is skipped) and the
+# low-cardinality strings among them that are held as categoricals
+READ_COLUMNS = source_columns(TRANSFORM_SCHEMA, COLUMNS)
+CATEGORY_COLUMNS = TRANSFORM_SCHEMA.get('categories', [])
+
+# Text columns stored as ids of lookup tables (see dimension_tables.py)
+DIMENSIONS = {}
+
+# Rows read, cleaned and written per batch; None streams one Parquet row group at a time
+BATCH_ROWS = DEFAULT_BATCH_ROWS
+
+# Timestamp storage: 'text' ('YYYY-MM-DD HH:MM:SS') or 'epoch' (integer seconds)
+TIME_ENCODING = DEFAULT_TIME_ENCODING
+
+# Trip table layout: 'month' (one table per pickup month, so queries over a
+# time range only read those months; see month_partitions.py) or 'none'
+PARTITIONING = DEFAULT_PARTITIONING
+
+# Share of every month/hour stratum kept in the yellow_taxi_data_sample table for
+# fast approximate queries (see trip_samples.py); 0 turns sampling off
+SAMPLE_RATE = DEFAULT_SAMPLE_RATE
+
+# Also keep the cleaned trips as memory-mappable Arrow files, one per month, for
+# zero-copy reads by the analysis layer (see arrow_cache.py); False turns it off
+ARROW_CACHE = DEFAULT_ARROW_CACHE
+
+# Where the main loop stores the cleaned data: 'sqlite' (taxi_data.db) or
+# 'parquet' (a partitioned Parquet dataset queried with DuckDB)
+STORAGE_BACKEND = DEFAULT_STORAGE_BACKEND
+
+# Function to clean and transform Yellow Taxi data
+def clean_and_transform_yellow_data(df):
+    # Drop rows with missing timestamps, derive trip_duration, avg_speed and the
+    # pickup time buckets, and keep only the columns stored in SQLite
+    return transform_trips(df, TRANSFORM_SCHEMA, COLUMNS)
+
+# Function to create the table (idempotent) and the ingest manifest
+def create_table(conn):
+    conn.execute(CREATE_TABLE_SQL)
+    prepare_table(conn, TABLE_NAME, TIME_ENCODING)
+    prepare_partitions(conn, TABLE_NAME, PARTITIONING, ROLLUP_COLUMNS['pickup'], TIME_ENCODING)
+
+if __name__ == "__main__":
+    # Folder path containing the Yellow Taxi data file(s)
+    input_folder = r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\data"
+    sqlite_db_path = r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\taxi_data.db"
+    dataset_root = r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\taxi_dataset"
+    telemetry_jsonl = r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\ingest_telemetry.jsonl"
+    prometheus_textfile = r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\taxi_ingest.prom"
+
+    # Per-stage timings of every file, as JSON lines and a Prometheus textfile
+    telemetry = TelemetrySink(telemetry_jsonl, prometheus_textfile)
+
+    # Open the storage backend for the whole run and make sure the table exists
+    backend = open_backend(STORAGE_BACKEND, sqlite_db=sqlite_db_path, dataset_root=dataset_root,
+                           telemetry=telemetry)
+    backend.prepare('yellow')
+
+    # Loop through all files in the data folder
+    for file_name in os.listdir(input_folder):
+        if file_name.endswith(".parquet") and "yellow" in file_name:
+            file_path = os.path.join(input_folder, file_name)
+
+            # Skip files the manifest says are already loaded and unchanged
+            load = backend.check_file('yellow', file_path)
+            if load.unchanged:
+                print(f"{file_name} unchanged since last load. Skipping.")
+                continue
+
+            # Stream the Yellow Taxi data batch by batch and process each batch lazily
+            processed_batches = (
+                clean_and_transform_yellow_data(df)
+                for df in iter_parquet_batches(file_path, BATCH_ROWS, READ_COLUMNS, CATEGORY_COLUMNS)
+            )
+
+            # Write the processed data to the storage backend
+            backend.load_file(load, processed_batches)
+
+            print(f"Data from {file_name} inserted into {STORAGE_BACKEND} successfully.")
+
+    backend.close()
+    print("Data processing and insertion completed.")
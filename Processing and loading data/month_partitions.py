@@ -0,0 +1,255 @@
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from sqlite_bulk_writer import BulkWriter
+from time_encoding import DEFAULT_TIME_ENCODING, SETTINGS_TABLE_SQL, create_time_bucket_indexes
+
+# How a trip table's rows are laid out in the database
+#   'none'  - one table holding every trip (the original layout)
+#   'month' - one table per pickup month, <trip table>_YYYYMM, listed in
+#             trip_partitions; queries over a time range only read the
+#             months they cover, and each month can be read on its own
+#             connection. The trip table itself keeps only rows without a
+#             pickup time, which belong to no month.
+PARTITIONINGS = ('none', 'month')
+DEFAULT_PARTITIONING = 'month'
+
+PARTITIONS_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS trip_partitions (
+    table_name TEXT NOT NULL,
+    month INTEGER NOT NULL,
+    partition_table TEXT NOT NULL,
+    PRIMARY KEY (table_name, month)
+) WITHOUT ROWID;
+'''
+
+# Bounds of an open-ended month range (months are yyyymm integers)
+FIRST_MONTH = 0
+LAST_MONTH = 999912
+
+
+def partition_table(table_name, month):
+    return f'{table_name}_{int(month)}'
+
+
+def all_rows_view(table_name):
+    """Name of the view over a partitioned trip table and all of its partitions."""
+    return f'{table_name}_all'
+
+
+def parse_month(value):
+    """A yyyymm integer from 'YYYY-MM', 'YYYYMM' or an integer; None stays None."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        match = re.fullmatch(r'(\d{4})-?(\d{2})', value.strip())
+        if match is None:
+            raise ValueError(f"Expected a month as 'YYYY-MM', got {value!r}")
+        return int(match.group(1)) * 100 + int(match.group(2))
+    return int(value)
+
+
+def month_range(start=None, end=None):
+    """(first, last) yyyymm of an inclusive month range; a missing bound leaves that side open."""
+    first, last = parse_month(start), parse_month(end)
+    return (FIRST_MONTH if first is None else first), (LAST_MONTH if last is None else last)
+
+
+def partitioning(conn, table_name):
+    """The layout recorded for a trip table, 'none' if it was never partitioned."""
+    try:
+        row = conn.execute('SELECT value FROM storage_settings WHERE name = ?',
+                           (f'partitioning:{table_name}',)).fetchone()
+    except sqlite3.OperationalError:
+        return 'none'
+    return row[0] if row else 'none'
+
+
+def list_partitions(conn, table_name, start=None, end=None):
+    """{month: partition table} of a trip table, pruned to the months from start to end."""
+    first, last = month_range(start, end)
+    try:
+        return dict(conn.execute(
+            'SELECT month, partition_table FROM trip_partitions '
+            'WHERE table_name = ? AND month BETWEEN ? AND ? ORDER BY month',
+            (table_name, first, last)
+        ))
+    except sqlite3.OperationalError:
+        return {}
+
+
+def trip_rows(conn, table_name):
+    """The table or view to read every row of a trip table from, partitioned or not."""
+    return all_rows_view(table_name) if partitioning(conn, table_name) == 'month' else table_name
+
+
+def tables_to_read(conn, table_name, start=None, end=None):
+    """(table, month condition) of the tables holding a trip table's rows from start to end.
+
+    Month partitions are pruned to the range and need no condition, so a
+    query on one can be answered from its time bucket indexes alone; a
+    table that is not partitioned is filtered on pickup_month. Without a
+    range, a partitioned table's own rows are read as well.
+    """
+    first, last = month_range(start, end)
+    if partitioning(conn, table_name) != 'month':
+        return [(table_name, f'pickup_month BETWEEN {first} AND {last}')]
+    tables = [(name, '1') for name in list_partitions(conn, table_name, first, last).values()]
+    if (first, last) == (FIRST_MONTH, LAST_MONTH):
+        # Trips without a pickup time, which belong to no month, stay in the trip table itself
+        tables.append((table_name, '1'))
+    return tables
+
+
+def _create_all_rows_view(conn, table_name):
+    tables = [table_name] + list(list_partitions(conn, table_name).values())
+    conn.execute(f'DROP VIEW IF EXISTS {all_rows_view(table_name)}')
+    conn.execute(f"CREATE VIEW {all_rows_view(table_name)} AS "
+                 f"{' UNION ALL '.join(f'SELECT * FROM {table}' for table in tables)}")
+
+
+def create_partition(conn, table_name, month):
+    """Create the partition of one month with the trip table's current columns (inside the caller's transaction)."""
+    name = partition_table(table_name, month)
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                       (table_name,)).fetchone()[0]
+    conn.execute(re.sub(rf'^CREATE TABLE\s+"?{table_name}"?', f'CREATE TABLE IF NOT EXISTS {name}', sql))
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_source_id ON {name} (source_id)')
+    create_time_bucket_indexes(conn, name)
+    conn.execute('INSERT OR IGNORE INTO trip_partitions (table_name, month, partition_table) VALUES (?, ?, ?)',
+                 (table_name, int(month), name))
+    _create_all_rows_view(conn, table_name)
+    return name
+
+
+def prepare_partitions(conn, table_name, layout=DEFAULT_PARTITIONING, pickup_column=None,
+                       time_encoding=DEFAULT_TIME_ENCODING):
+    """Record a trip table's layout and move the rows still in the table itself into month partitions.
+
+    Rows already in the table are moved into their month's partition in one
+    transaction. Rows loaded before the time buckets existed get them from
+    pickup_column (stored per time_encoding) first, so they move too; only
+    rows without a pickup time stay behind. Every partition gets the time
+    bucket indexes the trip table has (see create_time_bucket_indexes). A
+    partitioned table cannot go back to a single table.
+    Needs an autocommit connection (connect_for_bulk_load).
+    """
+    if layout not in PARTITIONINGS:
+        raise ValueError(f"Unknown partitioning {layout!r}, expected one of {PARTITIONINGS}")
+    current = partitioning(conn, table_name)
+    if current == 'month' and layout != 'month':
+        raise ValueError(f"{table_name} is partitioned by month; cannot load it as {layout!r}")
+    conn.execute(SETTINGS_TABLE_SQL)
+    conn.execute(PARTITIONS_TABLE_SQL)
+    conn.execute('BEGIN')
+    conn.execute('INSERT OR REPLACE INTO storage_settings (name, value) VALUES (?, ?)',
+                 (f'partitioning:{table_name}', layout))
+    if layout == 'month':
+        if pickup_column is not None:
+            pickup = f"{pickup_column}, 'unixepoch'" if time_encoding == 'epoch' else pickup_column
+            conn.execute(f'''
+                UPDATE {table_name} SET
+                    pickup_hour = CAST(strftime('%H', {pickup}) AS INTEGER),
+                    pickup_date = CAST(strftime('%Y%m%d', {pickup}) AS INTEGER),
+                    pickup_month = CAST(strftime('%Y%m', {pickup}) AS INTEGER)
+                WHERE pickup_month IS NULL AND strftime('%Y%m', {pickup}) IS NOT NULL
+            ''')
+        months = [row[0] for row in conn.execute(
+            f'SELECT DISTINCT pickup_month FROM {table_name} WHERE pickup_month IS NOT NULL')]
+        if months:
+            print(f"Moving {table_name} into {len(months)} month partitions...")
+        for month in months:
+            name = create_partition(conn, table_name, month)
+            conn.execute(f'INSERT INTO {name} SELECT * FROM {table_name} WHERE pickup_month = ?', (month,))
+        conn.execute(f'DELETE FROM {table_name} WHERE pickup_month IS NOT NULL')
+        _create_all_rows_view(conn, table_name)
+        if months:
+            print("Run VACUUM to return the space of the moved rows to the file system.")
+    # Partitions created before they got the time bucket indexes
+    for name in list_partitions(conn, table_name).values():
+        create_time_bucket_indexes(conn, name)
+    conn.execute('COMMIT')
+
+
+class PartitionedBulkWriter(BulkWriter):
+    """BulkWriter that routes every row into the partition of its pickup month.
+
+    Partitions are created on first use inside the writer's transaction, so
+    a failed load leaves no empty partitions behind.
+    """
+
+    def __init__(self, conn, table_name, columns, **kwargs):
+        super().__init__(conn, table_name, columns, **kwargs)
+        self.partitions = list_partitions(conn, table_name)
+        self._insert_sql = {}
+
+    def delete_source(self, source_id):
+        for name in [self.table_name] + list(self.partitions.values()):
+            self.conn.execute(f'DELETE FROM {name} WHERE source_id = ?', (source_id,))
+
+    def insert_rows(self, rows):
+        months = rows['pickup_month'].to_numpy(dtype=np.float64, na_value=np.nan)
+        missing = np.isnan(months)
+        if missing.any():
+            super().insert_rows(rows[missing])
+            rows, months = rows[~missing], months[~missing]
+        for month in np.unique(months).astype(np.int64):
+            if month not in self.partitions:
+                self.partitions[month] = create_partition(self.conn, self.table_name, month)
+            sql = self._insert_sql.setdefault(month, self.insert_statement(self.partitions[month]))
+            self.insert_into(sql, rows[months == month])
+
+
+class PartitionReader:
+    """Runs one aggregate per partition concurrently, each thread on its own read-only connection.
+
+    SQLite releases the GIL while a statement runs, so partitions are
+    scanned in parallel on up to workers cores; the caller merges the
+    partial results.
+    """
+
+    def __init__(self, sqlite_db, workers=None):
+        self.uri = Path(os.path.abspath(sqlite_db)).as_uri() + '?mode=ro'
+        self.workers = workers or os.cpu_count() or 1
+        self._local = threading.local()
+        self._connections = []
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def connection(self):
+        """The calling thread's read-only connection, opened on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+            self._connections.append(conn)
+        return conn
+
+    def _run(self, sql, params):
+        cursor = self.connection().execute(sql, params)
+        return pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+
+    def map(self, sql, tables, params=()):
+        """Run sql on each (table, month condition) of tables_to_read and return the results stacked into one DataFrame."""
+        if not tables:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='partition-reader')
+        frames = list(self._pool.map(
+            lambda table: self._run(sql.format(trips=table[0], months=table[1]), params), tables))
+        return pd.concat(frames, ignore_index=True)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        for conn in self._connections:
+            conn.close()
+        self._connections.clear()
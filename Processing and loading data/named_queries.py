@@ -0,0 +1,108 @@
+# SQL of the named queries every storage backend answers. Kept apart from
+# storage_backends so that tools which only read the rollups with sqlite3 (the
+# nyc-taxi query command) start without importing pandas or pyarrow.
+
+# Named queries shared by the visualize scripts and the columns both backends return
+# (peak_hours is ordered busiest hour first, month is 'YYYY-MM')
+QUERIES = {
+    'peak_hours': ['hour', 'trip_count'],
+    'passenger_fare': ['passenger_count', 'avg_fare', 'trip_count'],
+    'monthly_trips': ['month', 'trip_count'],
+}
+
+# SQLite answers them from the rollups written at ingest time
+ROLLUP_QUERIES = {
+    'peak_hours': '''
+        SELECT CAST(substr(bucket, 12, 2) AS INTEGER) AS hour, SUM(trip_count) AS trip_count
+        FROM trip_rollups
+        WHERE taxi_type = ? AND grain = 'hour'
+        GROUP BY hour
+        ORDER BY trip_count DESC
+    ''',
+    'passenger_fare': '''
+        SELECT CAST(NULLIF(bucket, '') AS INTEGER) AS passenger_count,
+               SUM(fare_sum) / NULLIF(SUM(fare_count), 0) AS avg_fare,
+               SUM(trip_count) AS trip_count
+        FROM trip_rollups
+        WHERE taxi_type = ? AND grain = 'passenger_count'
+        GROUP BY passenger_count
+        ORDER BY passenger_count
+    ''',
+    'monthly_trips': '''
+        SELECT bucket AS month, SUM(trip_count) AS trip_count
+        FROM trip_rollups
+        WHERE taxi_type = ? AND grain = 'month'
+        GROUP BY month
+        ORDER BY month
+    ''',
+}
+
+# Over a range of months, or within zones, SQLite reads the trip tables
+# instead: each query runs once per month partition ({trips}, pruned to the
+# range) on its own read connection, and the partial results are added up.
+# {months} is the table's month range condition, '1' for a partition, which
+# holds one month (see tables_to_read), and {zones} the zone conditions (see
+# zone_conditions).
+PARTITION_QUERIES = {
+    'peak_hours': '''
+        SELECT pickup_hour AS hour, COUNT(*) AS trip_count
+        FROM {trips}
+        WHERE {months}{zones}
+        GROUP BY 1
+    ''',
+    'passenger_fare': '''
+        SELECT CAST(ROUND({passenger}) AS INTEGER) AS passenger_count,
+               TOTAL({fare}) AS fare_sum, COUNT({fare}) AS fare_count, COUNT(*) AS trip_count
+        FROM {trips}
+        WHERE {months}{zones}
+        GROUP BY 1
+    ''',
+    'monthly_trips': '''
+        SELECT pickup_month AS month, COUNT(*) AS trip_count
+        FROM {trips}
+        WHERE {months}{zones}
+        GROUP BY 1
+    ''',
+}
+
+# The QUERIES answered approximately from the stratified trip samples (see
+# trip_samples.py): (group-by SQL, ROLLUP_COLUMNS measure averaged per group or
+# None, name of the group column). {passenger} is the passenger count column.
+APPROXIMATE_QUERIES = {
+    'peak_hours': ('pickup_hour', None, 'hour'),
+    'passenger_fare': ('CAST(ROUND({passenger}) AS INTEGER)', 'fare', 'passenger_count'),
+    'monthly_trips': ('pickup_month', None, 'month'),
+}
+
+# DuckDB scans only the columns a query names; {trips} is the dataset of one taxi
+# type and {where} an optional filter on the year/month partition columns and zones
+DATASET_QUERIES = {
+    'peak_hours': '''
+        SELECT pickup_hour AS hour, COUNT(*) AS trip_count
+        FROM {trips}
+        {where}
+        GROUP BY hour
+        ORDER BY trip_count DESC
+    ''',
+    'passenger_fare': '''
+        SELECT CAST(ROUND({passenger}) AS INTEGER) AS passenger_count,
+               AVG({fare}) AS avg_fare,
+               COUNT(*) AS trip_count
+        FROM {trips}
+        {where}
+        GROUP BY 1
+        ORDER BY 1 NULLS FIRST
+    ''',
+    'monthly_trips': '''
+        SELECT printf('%04d-%02d', year, month) AS month, COUNT(*) AS trip_count
+        FROM {trips}
+        {where}
+        GROUP BY 1
+        ORDER BY 1
+    ''',
+}
+
+
+# Zone filters every query takes, {filter: zone id}, and the loader's OD_COLUMNS
+# entry naming the zone column each one applies to
+ZONE_FILTERS = {'pickup_zone': 'origin', 'dropoff_zone': 'destination'}
@@ -0,0 +1,357 @@
+import argparse
+import glob
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from ingest_telemetry import stage
+from month_partitions import parse_month, trip_rows
+from transform_engine import widen_money
+
+# Dense origin-destination matrices, one set per taxi type and pickup month:
+#   <root>/<taxi type>/<yyyymm>/trips.npy     int32   [hour of week, origin, destination]
+#   <root>/<taxi type>/<yyyymm>/fare_sum.npy  float64 (taxi types with a fare)
+# Hours of the week start at Monday 00:00 (0) and end at Sunday 23:00 (167).
+# Origins and destinations are TLC zone ids used as indexes directly (1-263,
+# 264/265 for unknown zones), so matrix[:, 132, 161] is every hour of the
+# JFK -> Midtown corridor. The arrays are read as memory maps, and a slice
+# of one month is a view into the file, not a copy.
+# Every source file's contribution is kept sparse in
+#   <root>/<taxi type>/sources/<source_id>.npz
+# so replacing a file only rebuilds the months it touches.
+ZONES = 266
+HOURS_OF_WEEK = 168
+CELLS = HOURS_OF_WEEK * ZONES * ZONES
+
+NS_PER_HOUR = 3_600_000_000_000
+# 1970-01-01 was a Thursday, day 3 of a week starting on Monday
+EPOCH_WEEKDAY = 3
+
+# Buffered rows of one month are folded into its sparse counts with a single
+# bincount once there are this many (each fold allocates one dense month)
+FLUSH_ROWS = 4_000_000
+
+
+def od_root(sqlite_db):
+    """Directory of the OD matrices kept next to a SQLite database: taxi_data.db -> taxi_data_od/."""
+    return os.path.splitext(os.path.abspath(sqlite_db))[0] + '_od'
+
+
+def _month_dir(root, taxi_type, month):
+    return os.path.join(root, taxi_type, str(int(month)))
+
+
+def _source_path(root, taxi_type, source_id):
+    return os.path.join(root, taxi_type, 'sources', f'{int(source_id)}.npz')
+
+
+def _replace_array(path, cells, values, dtype):
+    """Write a dense month holding values at the flat cells next to path and rename it into place.
+
+    Only the pages with a non-zero cell are written; on file systems with
+    sparse files the empty rest of a month takes no disk space.
+    """
+    array = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=dtype,
+                                      shape=(HOURS_OF_WEEK, ZONES, ZONES))
+    array.reshape(-1)[cells] = values
+    array.flush()
+    del array
+    os.replace(path + '.tmp', path)
+
+
+def hour_of_week(pickup_ns):
+    """0 (Monday 00:00) to 167 (Sunday 23:00) of int64 nanosecond pickup times."""
+    hours = pickup_ns // NS_PER_HOUR
+    return ((hours // 24 + EPOCH_WEEKDAY) % 7) * 24 + hours % 24
+
+
+def _zone_ids(series):
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    with np.errstate(invalid='ignore'):
+        valid = (values >= 0) & (values < ZONES)
+    return values, valid
+
+
+def _fares(series):
+    """A fare column as float64 with NULL as 0, compact float32 amounts widened back to exact cents."""
+    values = series.to_numpy(dtype=np.float32 if series.dtype == np.float32 else np.float64, na_value=np.nan)
+    return np.nan_to_num(widen_money(values))
+
+
+class ODAccumulator:
+    """Adds up the OD matrices of one source file's batches.
+
+    spec maps 'pickup', 'origin', 'destination' and optionally 'fare' to
+    columns of the batches (a loader's OD_COLUMNS). Each batch only turns
+    its rows into flat cell indexes (hour of week, origin, destination);
+    the counting is one np.bincount per month over all buffered rows.
+    Rows with an unknown zone are left out.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self._buffers = {}
+        self._sparse = {}
+
+    def add(self, df):
+        if df.empty:
+            return
+        with stage('aggregate', len(df)):
+            pickup = df[self.spec['pickup']].to_numpy(dtype='datetime64[ns]').view(np.int64)
+            origin, origin_ok = _zone_ids(df[self.spec['origin']])
+            destination, destination_ok = _zone_ids(df[self.spec['destination']])
+            keep = origin_ok & destination_ok
+            cells = ((hour_of_week(pickup[keep]) * ZONES + origin[keep].astype(np.int64)) * ZONES
+                     + destination[keep].astype(np.int64))
+            fares = _fares(df[self.spec['fare']])[keep] if self.spec.get('fare') else None
+            months = df['pickup_month'].to_numpy(dtype=np.int64)[keep]
+            first = months[0] if len(months) else None
+            if first is not None and (months == first).all():
+                self._buffer(first, cells, fares)
+            else:
+                for month in np.unique(months):
+                    rows = months == month
+                    self._buffer(month, cells[rows], None if fares is None else fares[rows])
+
+    def add_counts(self, month, cells, trips, fares=None):
+        """Add cells that already hold a trip count and fare sum each (used when rebuilding from SQL)."""
+        self._fold(int(month), cells, trips, fares)
+
+    def _buffer(self, month, cells, fares):
+        buffered = self._buffers.setdefault(int(month), [])
+        buffered.append((cells.astype(np.int32), fares))
+        if sum(len(c) for c, _ in buffered) >= FLUSH_ROWS:
+            self._flush(int(month))
+
+    def _flush(self, month):
+        buffered = self._buffers.pop(month, [])
+        if buffered:
+            cells = np.concatenate([c for c, _ in buffered])
+            fares = np.concatenate([f for _, f in buffered]) if self.spec.get('fare') else None
+            self._fold(month, cells, None, fares)
+
+    def _fold(self, month, cells, trips, fares):
+        """Count cells (weighted by trips, if given) into the month's sparse (cells, trips, fare sums)."""
+        previous = self._sparse.get(month)
+        if previous is not None:
+            if trips is None:
+                trips = np.ones(len(cells), dtype=np.int64)
+            cells = np.concatenate([previous[0], cells])
+            trips = np.concatenate([previous[1], trips])
+            if fares is not None:
+                fares = np.concatenate([previous[2], fares])
+        counts = np.bincount(cells, weights=trips, minlength=CELLS)
+        nonzero = np.flatnonzero(counts)
+        sums = np.bincount(cells, weights=fares, minlength=CELLS)[nonzero] if fares is not None else None
+        self._sparse[month] = (nonzero.astype(np.int32), counts[nonzero].astype(np.int64), sums)
+
+    def months(self):
+        for month in list(self._buffers):
+            self._flush(month)
+        return self._sparse
+
+    def save(self, root, taxi_type, source_id):
+        """Replace one source file's contribution and rebuild every month it touches, now or before."""
+        with stage('aggregate'):
+            sparse = self.months()
+            path = _source_path(root, taxi_type, source_id)
+            touched = set(sparse)
+            if os.path.exists(path):
+                with np.load(path) as old:
+                    touched.update(int(month) for month in np.unique(old['month']))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            arrays = {
+                'month': np.concatenate([np.full(len(c), month, dtype=np.int32) for month, (c, _, _) in sparse.items()]
+                                        or [np.empty(0, np.int32)]),
+                'cell': np.concatenate([c for c, _, _ in sparse.values()] or [np.empty(0, np.int32)]),
+                'trips': np.concatenate([t for _, t, _ in sparse.values()] or [np.empty(0, np.int64)]),
+            }
+            if self.spec.get('fare'):
+                arrays['fare_sum'] = np.concatenate([s for _, _, s in sparse.values()] or [np.empty(0)])
+            with open(path + '.tmp', 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(path + '.tmp', path)
+            for month in sorted(touched):
+                rebuild_month(root, taxi_type, month)
+
+
+def rebuild_month(root, taxi_type, month):
+    """Write one month's dense matrices from the sparse contributions of every source file.
+
+    A month no source file has rows for any more is removed.
+    """
+    cells, trips, fares = [], [], []
+    for path in glob.glob(os.path.join(root, taxi_type, 'sources', '*.npz')):
+        with np.load(path) as source:
+            rows = source['month'] == month
+            if rows.any():
+                cells.append(source['cell'][rows])
+                trips.append(source['trips'][rows])
+                if 'fare_sum' in source.files:
+                    fares.append(source['fare_sum'][rows])
+    directory = _month_dir(root, taxi_type, month)
+    if not cells:
+        shutil.rmtree(directory, ignore_errors=True)
+        return
+    os.makedirs(directory, exist_ok=True)
+    cells = np.concatenate(cells)
+    counts = np.bincount(cells, weights=np.concatenate(trips), minlength=CELLS)
+    nonzero = np.flatnonzero(counts)
+    _replace_array(os.path.join(directory, 'trips.npy'), nonzero, counts[nonzero], np.int32)
+    if fares:
+        sums = np.bincount(cells, weights=np.concatenate(fares), minlength=CELLS)
+        _replace_array(os.path.join(directory, 'fare_sum.npy'), nonzero, sums[nonzero], np.float64)
+
+
+def rebuild_od_matrices(conn, taxi_type, table_name, spec, root, time_encoding='text'):
+    """Recompute the OD matrices of one taxi type from its trip table with SQL.
+
+    Only needed for tables loaded before the OD matrices existed, or when a
+    load stopped between committing the trips and saving its matrices. Rows
+    without a source_id count as source 0.
+    """
+    shutil.rmtree(os.path.join(root, taxi_type), ignore_errors=True)
+    pickup = f"{spec['pickup']}, 'unixepoch'" if time_encoding == 'epoch' else spec['pickup']
+    fare = f"TOTAL({spec['fare']})" if spec.get('fare') else 'NULL'
+    sql = f'''
+        SELECT pickup_month,
+               ((CAST(strftime('%w', {pickup}) AS INTEGER) + 6) % 7) * 24 + pickup_hour AS hour_of_week,
+               {spec['origin']}, {spec['destination']}, COUNT(*), {fare}
+        FROM {trip_rows(conn, table_name)}
+        WHERE source_id IS ? AND pickup_month IS NOT NULL
+          AND {spec['origin']} BETWEEN 0 AND {ZONES - 1} AND {spec['destination']} BETWEEN 0 AND {ZONES - 1}
+        GROUP BY 1, 2, 3, 4
+    '''
+    sources = [row[0] for row in conn.execute(f'SELECT DISTINCT source_id FROM {trip_rows(conn, table_name)}')]
+    for source_id in sources:
+        df = pd.read_sql_query(sql, conn, params=(source_id,))
+        df.columns = ['month', 'hour', 'origin', 'destination', 'trips', 'fare_sum']
+        accumulator = ODAccumulator(spec)
+        for month, rows in df.groupby('month'):
+            cells = ((rows['hour'].to_numpy(np.int64) * ZONES + rows['origin'].to_numpy(np.int64)) * ZONES
+                     + rows['destination'].to_numpy(np.int64))
+            accumulator.add_counts(month, cells, rows['trips'].to_numpy(np.float64),
+                                   rows['fare_sum'].to_numpy(np.float64) if spec.get('fare') else None)
+        accumulator.save(root, taxi_type, 0 if source_id is None else source_id)
+
+
+class ODMatrices:
+    """The OD matrices of one taxi type, opened as read-only memory maps.
+
+    A replaced month is picked up on the next call; maps handed out before
+    keep showing the old file.
+    """
+
+    def __init__(self, root, taxi_type):
+        self.root = root
+        self.taxi_type = taxi_type
+        self._maps = {}
+
+    def months(self):
+        """yyyymm of every month with matrices, oldest first."""
+        directory = os.path.join(self.root, self.taxi_type)
+        names = os.listdir(directory) if os.path.isdir(directory) else []
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def _open(self, month, name):
+        path = os.path.join(_month_dir(self.root, self.taxi_type, parse_month(month)), f'{name}.npy')
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self._maps.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = self._maps[path] = (mtime, np.load(path, mmap_mode='r'))
+        return cached[1]
+
+    def trips(self, month):
+        """[hour of week, origin, destination] trip counts of one month, or None."""
+        return self._open(month, 'trips')
+
+    def fare_sum(self, month):
+        """[hour of week, origin, destination] fare totals of one month, or None without fares."""
+        return self._open(month, 'fare_sum')
+
+    def _months(self, start=None, end=None):
+        first, last = parse_month(start), parse_month(end)
+        return [month for month in self.months()
+                if (first is None or month >= first) and (last is None or month <= last)]
+
+    def matrix(self, start=None, end=None, hours=None, measure='trips'):
+        """[origin, destination] totals over the months from start to end and the given hours of the week.
+
+        hours is an hour of the week, a slice or a list of them; None is all
+        168. One month and one hour returns a view of the file.
+        """
+        months = self._months(start, end)
+        total = None
+        for month in months:
+            values = self._open(month, measure)
+            if values is None:
+                continue
+            if isinstance(hours, (int, np.integer)):
+                part = values[hours]
+            else:
+                part = values[slice(None) if hours is None else hours].sum(axis=0, dtype=np.float64)
+            if len(months) == 1:
+                return part
+            total = part.astype(np.float64) if total is None else total + part
+        return total if total is not None else np.zeros((ZONES, ZONES))
+
+    def top_corridors(self, n=10, start=None, end=None, hours=None):
+        """The n busiest (origin, destination) pairs with their trip count and average fare."""
+        trips = np.asarray(self.matrix(start, end, hours))
+        flat = trips.ravel()
+        n = min(n, np.count_nonzero(flat))
+        top = np.argpartition(flat, -n)[-n:] if n else np.empty(0, dtype=np.int64)
+        top = top[np.argsort(flat[top])[::-1]]
+        origin, destination = np.divmod(top, ZONES)
+        df = pd.DataFrame({'origin': origin, 'destination': destination, 'trip_count': flat[top].astype(np.int64)})
+        if any(self.fare_sum(month) is not None for month in self._months(start, end)):
+            fares = np.asarray(self.matrix(start, end, hours, 'fare_sum')).ravel()
+            df['avg_fare'] = fares[top] / flat[top]
+        return df
+
+    def zone_to_zone(self, origin, destination, start=None, end=None):
+        """Trips from origin to destination per hour of the week (168 values)."""
+        total = np.zeros(HOURS_OF_WEEK, dtype=np.int64)
+        for month in self._months(start, end):
+            values = self.trips(month)
+            if values is not None:
+                total += values[:, origin, destination]
+        return total
+
+
+if __name__ == "__main__":
+    from sqlite_bulk_writer import connect_for_bulk_load
+    from taxi_types import TAXI_TYPES, load_loader
+
+    parser = argparse.ArgumentParser(description="Show the busiest origin-destination corridors from the OD matrices.")
+    parser.add_argument('--db', default=r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\taxi_data.db")
+    parser.add_argument('--od-root', help="directory of the OD matrices (default: next to the database)")
+    parser.add_argument('--type', choices=list(TAXI_TYPES), required=True)
+    parser.add_argument('--start', help="first pickup month, YYYY-MM")
+    parser.add_argument('--end', help="last pickup month, YYYY-MM")
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--origin', type=int, help="with --destination, show one corridor per hour of the week")
+    parser.add_argument('--destination', type=int)
+    parser.add_argument('--rebuild', action='store_true', help="recompute the matrices from the trip table first")
+    args = parser.parse_args()
+
+    root = args.od_root or od_root(args.db)
+    loader = load_loader(args.type)
+    if args.rebuild:
+        conn = connect_for_bulk_load(args.db)
+        rebuild_od_matrices(conn, args.type, loader.TABLE_NAME, loader.OD_COLUMNS, root, loader.TIME_ENCODING)
+        conn.close()
+        print(f"Rebuilt OD matrices for {args.type} in {root}")
+
+    od = ODMatrices(root, args.type)
+    if args.origin is not None and args.destination is not None:
+        trips = od.zone_to_zone(args.origin, args.destination, args.start, args.end)
+        days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+        print(pd.DataFrame(trips.reshape(7, 24), index=days).to_string())
+    else:
+        print(od.top_corridors(args.top, args.start, args.end).to_string(index=False))
@@ -0,0 +1,139 @@
+import argparse
+import itertools
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from ingest_telemetry import IngestTelemetry, TelemetrySink, activate, merge_stages
+from parquet_stream import DEFAULT_BATCH_ROWS, plan_row_group_batches, read_row_groups
+from storage_backends import DEFAULT_STORAGE_BACKEND, STORAGE_BACKENDS, open_backend
+from taxi_types import TAXI_TYPES, classify_file, get_transform, load_loader
+
+# Default locations, same as the individual loaders
+INPUT_FOLDER = r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\data"
+SQLITE_DB_PATH = r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\taxi_data.db"
+DATASET_ROOT = r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\taxi_dataset"
+
+
+def read_and_clean(taxi_type, file_path, row_groups):
+    """Worker task: decode some row groups of one file and run its transform."""
+    loader = load_loader(taxi_type)
+    df = read_row_groups(file_path, row_groups, loader.READ_COLUMNS, loader.CATEGORY_COLUMNS)
+    return get_transform(taxi_type)(df)
+
+
+def measured_read_and_clean(taxi_type, file_path, row_groups):
+    """Worker task: read_and_clean plus a snapshot of the stage telemetry it recorded."""
+    with activate(IngestTelemetry()) as telemetry:
+        df = read_and_clean(taxi_type, file_path, row_groups)
+    return df, telemetry.snapshot()
+
+
+def _merged_batches(results):
+    """Yield the DataFrames of one file's results, adding their worker telemetry to the file's."""
+    for _, (df, stages) in results:
+        merge_stages(stages)
+        yield df
+
+
+def plan_tasks(backend, input_folder, taxi_types, batch_rows=DEFAULT_BATCH_ROWS):
+    """List (taxi_type, file_path, row_groups) tasks in file order.
+
+    Files the ingest manifest reports as unchanged are left out. Returns the
+    tasks and the manifest check result for every file that will be loaded.
+    """
+    tasks, loads = [], {}
+    for file_name in sorted(os.listdir(input_folder)):
+        taxi_type = classify_file(file_name)
+        if taxi_type not in taxi_types:
+            continue
+        file_path = os.path.join(input_folder, file_name)
+        load = backend.check_file(taxi_type, file_path)
+        if load.unchanged:
+            print(f"{file_name} unchanged since last load. Skipping.")
+            continue
+        loads[file_path] = load
+        for row_groups in plan_row_group_batches(file_path, batch_rows):
+            tasks.append((taxi_type, file_path, row_groups))
+    return tasks, loads
+
+
+def _ordered_results(pool, tasks, queue_depth):
+    """Submit tasks to the pool and yield their results in submission order.
+
+    At most queue_depth tasks are in flight or waiting to be written, so a slow
+    writer applies backpressure to the workers instead of letting finished
+    batches pile up in memory.
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append((task, pool.submit(measured_read_and_clean, *task)))
+        if len(pending) >= queue_depth:
+            done_task, future = pending.popleft()
+            yield done_task, future.result()
+    while pending:
+        done_task, future = pending.popleft()
+        yield done_task, future.result()
+
+
+def run_parallel_ingest(input_folder, sqlite_db, taxi_types=None, workers=None,
+                        queue_depth=None, batch_rows=DEFAULT_BATCH_ROWS,
+                        storage_backend=DEFAULT_STORAGE_BACKEND, dataset_root=DATASET_ROOT,
+                        telemetry=None):
+    """Clean files in a process pool and load them through a single writer.
+
+    Workers only read Parquet and transform; the parent process owns the one
+    storage backend, so there is never more than one writer on the database.
+    Each source file replaces its previous rows in its own transaction, and
+    files that have not changed since the last run are skipped. Stage
+    timings measured in the workers are reported to telemetry (a
+    TelemetrySink) together with the parent's write timings.
+    """
+    taxi_types = list(taxi_types or TAXI_TYPES)
+    workers = workers or os.cpu_count() or 1
+    queue_depth = queue_depth or 2 * workers
+
+    backend = open_backend(storage_backend, sqlite_db=sqlite_db, dataset_root=dataset_root,
+                           telemetry=telemetry)
+    for taxi_type in taxi_types:
+        backend.prepare(taxi_type)
+
+    tasks, loads = plan_tasks(backend, input_folder, taxi_types, batch_rows)
+    print(f"Planned {len(tasks)} batches from {len(loads)} files in {input_folder} "
+          f"({workers} workers, queue depth {queue_depth})")
+
+    started = time.perf_counter()
+    total_rows = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = _ordered_results(pool, tasks, queue_depth)
+        for (_, file_path), group in itertools.groupby(results, key=lambda r: r[0][:2]):
+            total_rows += backend.load_file(loads[file_path], _merged_batches(group))
+    backend.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Loaded {total_rows:,} rows in {elapsed:.2f}s "
+          f"({total_rows / elapsed if elapsed else 0:,.0f} rows/sec overall)")
+    return total_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load taxi Parquet files into SQLite or a Parquet dataset in parallel.")
+    parser.add_argument('--input-folder', default=INPUT_FOLDER)
+    parser.add_argument('--db', default=SQLITE_DB_PATH)
+    parser.add_argument('--backend', choices=STORAGE_BACKENDS, default=DEFAULT_STORAGE_BACKEND)
+    parser.add_argument('--dataset-root', default=DATASET_ROOT, help="root of the Parquet dataset (--backend parquet)")
+    parser.add_argument('--types', nargs='+', choices=list(TAXI_TYPES), default=list(TAXI_TYPES))
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--queue-depth', type=int, default=None,
+                        help="max batches in flight or awaiting the writer (default: 2 x workers)")
+    parser.add_argument('--batch-rows', type=int, default=DEFAULT_BATCH_ROWS)
+    parser.add_argument('--telemetry-jsonl', help="append per-stage telemetry of every file to this JSON lines file")
+    parser.add_argument('--prometheus-textfile', help="write stage metrics to this file for node_exporter")
+    args = parser.parse_args()
+
+    telemetry = None
+    if args.telemetry_jsonl or args.prometheus_textfile:
+        telemetry = TelemetrySink(args.telemetry_jsonl, args.prometheus_textfile)
+    run_parallel_ingest(args.input_folder, args.db, args.types, args.workers,
+                        args.queue_depth, args.batch_rows, args.backend, args.dataset_root, telemetry)
@@ -0,0 +1,97 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ingest_telemetry import stage
+
+# Default number of rows per streamed batch. Peak memory of a loader is a
+# function of this value rather than of the size of the Parquet file.
+DEFAULT_BATCH_ROWS = 500_000
+
+
+def _open(file_path, columns=None, categories=()):
+    """Open a Parquet file for a projected read.
+
+    Returns the ParquetFile, the requested columns the file actually has (None
+    for all of them) and the category columns that are not stored as strings.
+    String columns in categories are read as Parquet dictionaries, so they
+    arrive in pandas as categoricals without building an object per value.
+    """
+    parquet_file = pq.ParquetFile(file_path)
+    schema = parquet_file.schema_arrow
+    if columns is not None:
+        columns = [col for col in columns if col in schema.names]
+    categories = [col for col in categories if col in (schema.names if columns is None else columns)]
+    dictionary = [col for col in categories
+                  if pa.types.is_string(schema.field(col).type) or pa.types.is_large_string(schema.field(col).type)]
+    if dictionary:
+        parquet_file = pq.ParquetFile(file_path, read_dictionary=dictionary)
+    return parquet_file, columns, [col for col in categories if col not in dictionary]
+
+
+def _to_pandas(table, categories):
+    df = table.to_pandas()
+    for col in categories:
+        df[col] = df[col].astype('category')
+    return df
+
+
+def iter_parquet_batches(file_path, batch_rows=DEFAULT_BATCH_ROWS, columns=None, categories=()):
+    """Yield a Parquet file as a sequence of pandas DataFrames.
+
+    With batch_rows=None the file is read one row group at a time, otherwise
+    it is re-sliced into batches of at most batch_rows rows. Only one batch is
+    materialized in pandas at any moment. Only the given columns are decoded
+    (those missing from the file are skipped), and the columns in categories
+    come back as pandas categoricals.
+    """
+    parquet_file, columns, categories = _open(file_path, columns, categories)
+    if batch_rows is None:
+        for index in range(parquet_file.num_row_groups):
+            with stage('read') as timer:
+                df = _to_pandas(parquet_file.read_row_group(index, columns=columns), categories)
+                timer.rows_in = timer.rows_out = len(df)
+            yield df
+    else:
+        batches = parquet_file.iter_batches(batch_size=batch_rows, columns=columns)
+        while True:
+            # The Parquet decode happens inside next(), so it is timed with the conversion
+            with stage('read') as timer:
+                batch = next(batches, None)
+                df = _to_pandas(batch, categories) if batch is not None else None
+                timer.rows_in = timer.rows_out = len(df) if df is not None else 0
+            if df is None:
+                return
+            yield df
+
+
+def parquet_columns(file_path):
+    """Return the column names of a Parquet file without reading any data."""
+    return pq.ParquetFile(file_path).schema_arrow.names
+
+
+def plan_row_group_batches(file_path, batch_rows=DEFAULT_BATCH_ROWS):
+    """Group a file's row groups into lists holding roughly batch_rows rows each.
+
+    Used to split one file into independent read tasks. A single row group is
+    never split, so a batch can exceed batch_rows when row groups are large.
+    """
+    metadata = pq.ParquetFile(file_path).metadata
+    batches, current, current_rows = [], [], 0
+    for index in range(metadata.num_row_groups):
+        current.append(index)
+        current_rows += metadata.row_group(index).num_rows
+        if batch_rows is None or current_rows >= batch_rows:
+            batches.append(current)
+            current, current_rows = [], 0
+    if current:
+        batches.append(current)
+    return batches
+
+
+def read_row_groups(file_path, row_groups, columns=None, categories=()):
+    """Read the given row groups of a Parquet file into one DataFrame (see iter_parquet_batches)."""
+    parquet_file, columns, categories = _open(file_path, columns, categories)
+    with stage('read') as timer:
+        df = _to_pandas(parquet_file.read_row_groups(row_groups, columns=columns), categories)
+        timer.rows_in = timer.rows_out = len(df)
+    return df
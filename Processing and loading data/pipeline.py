@@ -0,0 +1,202 @@
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import ExitStack
+
+from ingest_telemetry import TelemetrySink, merge_stages
+from parallel_ingest import DATASET_ROOT, INPUT_FOLDER, SQLITE_DB_PATH, measured_read_and_clean
+from parquet_stream import DEFAULT_BATCH_ROWS, plan_row_group_batches
+from storage_backends import DEFAULT_STORAGE_BACKEND, STORAGE_BACKENDS, open_backend
+from taxi_types import TAXI_TYPES, classify_file
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Code_to_fetch_data_2019'))
+import fetch_taxi_data_2019 as fetch  # noqa: E402
+
+_DOWNLOADS_DONE = object()
+
+
+def timed_read_and_clean(taxi_type, file_path, row_groups):
+    """Worker task: measured_read_and_clean plus the seconds it took, for utilization stats."""
+    started = time.perf_counter()
+    df, stages = measured_read_and_clean(taxi_type, file_path, row_groups)
+    return df, stages, time.perf_counter() - started
+
+
+class StageStats:
+    """Busy time of one pipeline stage, shared by its workers."""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.busy = 0.0
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds, items=1):
+        with self._lock:
+            self.busy += seconds
+            self.items += items
+
+    def utilization(self, wall):
+        return self.busy / (self.workers * wall) if wall else 0.0
+
+
+def _download_stage(links, data_dir, workers, downloaded, stats):
+    """Download links on a thread pool and hand each finished file to the next stage.
+
+    downloaded is bounded, so downloads pause when transforming and loading
+    fall behind instead of filling the disk ahead of them.
+    """
+    session = fetch.make_session(workers)
+
+    def download(link):
+        filepath = os.path.join(data_dir, os.path.basename(link))
+        started = time.perf_counter()
+        if fetch.needs_download(link, filepath, session):
+            fetch.download_parquet_file(link, filepath, session)
+        stats.add(time.perf_counter() - started)
+        return filepath
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(download, link): link for link in links}
+        for future in as_completed(futures):
+            try:
+                downloaded.put(future.result())
+            except Exception as e:
+                print(f"Failed to download {os.path.basename(futures[future])}: {e}")
+    session.close()
+    downloaded.put(_DOWNLOADS_DONE)
+
+
+def run_pipeline(links, data_dir, sqlite_db, download_workers=4, transform_workers=None,
+                 queue_depth=None, batch_rows=DEFAULT_BATCH_ROWS,
+                 storage_backend=DEFAULT_STORAGE_BACKEND, dataset_root=DATASET_ROOT, telemetry=None):
+    """Download, transform and load taxi files as overlapping stages.
+
+    A file is split into batches and sent to the transform pool as soon as
+    its download finishes, while later files are still downloading. The
+    single storage writer commits each file in its own transaction. Bounded
+    queues between the stages keep memory and disk use flat. Per-file stage
+    timings go to telemetry (a TelemetrySink) when given. Returns the
+    StageStats of the three stages.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    transform_workers = transform_workers or os.cpu_count() or 1
+    queue_depth = queue_depth or 2 * transform_workers
+    stages = {
+        'download': StageStats('download', download_workers),
+        'transform': StageStats('transform', transform_workers),
+        'load': StageStats('load', 1),
+    }
+
+    backend = open_backend(storage_backend, sqlite_db=sqlite_db, dataset_root=dataset_root,
+                           telemetry=telemetry)
+    for taxi_type in TAXI_TYPES:
+        backend.prepare(taxi_type)
+
+    started = time.perf_counter()
+    downloaded = queue.Queue(maxsize=queue_depth)
+    downloader = threading.Thread(
+        target=_download_stage, args=(links, data_dir, download_workers, downloaded, stages['download']),
+        daemon=True,
+    )
+    downloader.start()
+
+    ready = deque()     # tasks whose file is downloaded but not yet submitted
+    pending = deque()   # (task, future) in submission order
+    remaining = {}      # file_path -> batches still to write
+    loads = {}
+    current = None      # (file_path, ExitStack, writer) of the open file transaction
+    downloads_done = False
+
+    try:
+        with ProcessPoolExecutor(max_workers=transform_workers) as pool:
+            while not (downloads_done and not ready and not pending):
+                # Pick up finished downloads; only block when there is nothing else to do
+                try:
+                    item = downloaded.get(block=not (ready or pending) and not downloads_done)
+                except queue.Empty:
+                    item = None
+                if item is _DOWNLOADS_DONE:
+                    downloads_done = True
+                elif item is not None:
+                    taxi_type = classify_file(os.path.basename(item))
+                    load = backend.check_file(taxi_type, item)
+                    if load.unchanged:
+                        print(f"{load.file_name} unchanged since last load. Skipping.")
+                    else:
+                        batches = plan_row_group_batches(item, batch_rows)
+                        loads[item], remaining[item] = load, len(batches)
+                        ready.extend((taxi_type, item, row_groups) for row_groups in batches)
+
+                while ready and len(pending) < queue_depth:
+                    task = ready.popleft()
+                    pending.append((task, pool.submit(timed_read_and_clean, *task)))
+
+                if not pending:
+                    continue
+                if not pending[0][1].done() and not (downloads_done or len(pending) >= queue_depth):
+                    wait([pending[0][1]], timeout=0.05)
+                    continue
+
+                (_, file_path, _), future = pending.popleft()
+                df, batch_stages, transform_seconds = future.result()
+                stages['transform'].add(transform_seconds)
+
+                write_started = time.perf_counter()
+                if current is None:
+                    stack = ExitStack()
+                    stack.enter_context(backend.track(loads[file_path]))
+                    writer = stack.enter_context(backend.file_writer(loads[file_path]))
+                    current = (file_path, stack, writer)
+                merge_stages(batch_stages)
+                current[2].write(df)
+                remaining[file_path] -= 1
+                if remaining[file_path] == 0:
+                    current[1].close()
+                    current = None
+                stages['load'].add(time.perf_counter() - write_started)
+    except BaseException:
+        # Roll back the file that was being written when something failed
+        if current is not None:
+            current[1].__exit__(*sys.exc_info())
+        raise
+
+    downloader.join()
+    backend.close()
+
+    wall = time.perf_counter() - started
+    print(f"Pipeline finished in {wall:.2f}s")
+    for stage in stages.values():
+        print(f"  {stage.name:<9} {stage.items:>5} items  busy {stage.busy:8.2f}s  "
+              f"utilization {stage.utilization(wall):6.1%}")
+    return stages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download, transform and load taxi data as one pipeline.")
+    parser.add_argument('--data-dir', default=INPUT_FOLDER)
+    parser.add_argument('--db', default=SQLITE_DB_PATH)
+    parser.add_argument('--backend', choices=STORAGE_BACKENDS, default=DEFAULT_STORAGE_BACKEND)
+    parser.add_argument('--dataset-root', default=DATASET_ROOT)
+    parser.add_argument('--types', nargs='+', choices=list(TAXI_TYPES), default=list(TAXI_TYPES))
+    parser.add_argument('--download-workers', type=int, default=fetch.MAX_WORKERS)
+    parser.add_argument('--transform-workers', type=int, default=None)
+    parser.add_argument('--queue-depth', type=int, default=None)
+    parser.add_argument('--batch-rows', type=int, default=DEFAULT_BATCH_ROWS)
+    parser.add_argument('--telemetry-jsonl', help="append per-stage telemetry of every file to this JSON lines file")
+    parser.add_argument('--prometheus-textfile', help="write stage metrics to this file for node_exporter")
+    args = parser.parse_args()
+
+    links = [link for link in fetch.get_2019_parquet_links(args.data_dir)
+             if classify_file(os.path.basename(link)) in args.types]
+    telemetry = None
+    if args.telemetry_jsonl or args.prometheus_textfile:
+        telemetry = TelemetrySink(args.telemetry_jsonl, args.prometheus_textfile)
+    run_pipeline(links, args.data_dir, args.db, args.download_workers, args.transform_workers,
+                 args.queue_depth, args.batch_rows, args.backend, args.dataset_root, telemetry)
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+# Data-quality rules are declared per taxi type in its loader as
+#   QUALITY_RULES = {rule name: [(output column, operator, value), ...]}
+# A row breaking a rule matches every one of its conditions. Such a row is not
+# loaded; it goes to the quarantine with the name of the first rule it breaks.
+# Comparisons with NULL never match, so a missing value breaks no rule.
+OPERATORS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+
+# Column transform_trips adds to a batch with rejected rows: the broken
+# rule's name for those rows, NULL for the rows that are loaded (see
+# quarantine.py for where the rejected rows go)
+QUALITY_COLUMN = 'quality_rule'
+
+# Compiled rule sets, by the id of the QUALITY_RULES dict they were compiled from
+_compiled = {}
+
+
+class RuleSet:
+    """A QUALITY_RULES dict compiled into one vectorized pass over a batch.
+
+    Every distinct condition is evaluated once on the column arrays; each
+    rule is the AND of its conditions, and a row's reason is the first rule
+    it breaks.
+    """
+
+    def __init__(self, rules):
+        for name, conditions in rules.items():
+            for column, op, value in conditions:
+                if op not in OPERATORS:
+                    raise ValueError(f"Rule {name!r}: unknown operator {op!r}, expected one of {list(OPERATORS)}")
+        self.names = list(rules)
+        self.conditions = list(dict.fromkeys(tuple(condition) for conditions in rules.values()
+                                             for condition in conditions))
+        self.rules = [[self.conditions.index(tuple(condition)) for condition in conditions]
+                      for conditions in rules.values()]
+        self.columns = list(dict.fromkeys(column for column, _, _ in self.conditions))
+        self.dtype = pd.CategoricalDtype(self.names)
+
+    def evaluate(self, columns):
+        """Return int8 reason codes for a batch: the index of the first broken rule, -1 for good rows.
+
+        columns maps column names to equally long arrays.
+        """
+        arrays = {}
+        for name in self.columns:
+            values = columns[name]
+            if isinstance(values, pd.api.extensions.ExtensionArray):
+                values = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            arrays[name] = values
+        with np.errstate(invalid='ignore'):
+            matches = [OPERATORS[op](arrays[column], value) for column, op, value in self.conditions]
+        broken = []
+        for conditions in self.rules:
+            mask = matches[conditions[0]]
+            for i in conditions[1:]:
+                mask = mask & matches[i]
+            broken.append(mask)
+        any_broken = broken[0].copy()
+        for mask in broken[1:]:
+            any_broken |= mask
+
+        # Rejected rows are few: work out which rule came first only for them
+        codes = np.full(len(any_broken), -1, dtype=np.int8)
+        rows = np.flatnonzero(any_broken)
+        if len(rows):
+            codes[rows] = np.argmax(np.stack([mask[rows] for mask in broken]), axis=0)
+        return codes
+
+    def reasons(self, codes):
+        """The rule name of every row as a categorical, NULL where codes is -1."""
+        return pd.Categorical.from_codes(codes, dtype=self.dtype, validate=False)
+
+
+def compile_rules(rules):
+    """Return the RuleSet of a QUALITY_RULES dict, compiling it on first use."""
+    entry = _compiled.get(id(rules))
+    if entry is None or entry[0] is not rules:
+        entry = _compiled[id(rules)] = (rules, RuleSet(rules))
+    return entry[1]
+
+
+def split_rejected(df):
+    """Split a batch into the rows to load and the rows its quality rules rejected (or None)."""
+    if QUALITY_COLUMN not in df.columns:
+        return df, None
+    rejected = df[QUALITY_COLUMN].notna().to_numpy()
+    kept = df[~rejected].drop(columns=QUALITY_COLUMN)
+    return kept, (df[rejected] if rejected.any() else None)
+
+
+def rule_counts(rejected):
+    """{rule name: rows} of a batch of rejected rows."""
+    counts = rejected[QUALITY_COLUMN].value_counts(sort=False)
+    return {str(rule): int(count) for rule, count in counts.items() if count}
+
+
+def format_rule_counts(counts):
+    return ', '.join(f'{rule} {count:,}' for rule, count in sorted(counts.items(), key=lambda item: -item[1]))
@@ -0,0 +1,102 @@
+import argparse
+
+import pandas as pd
+
+from ingest_telemetry import count_rejections
+from quality_rules import QUALITY_COLUMN, format_rule_counts, rule_counts, split_rejected
+from sqlite_bulk_writer import BulkWriter
+from time_encoding import DEFAULT_TIME_ENCODING
+
+
+class Quarantine:
+    """Takes the rows rejected by the quality rules out of every batch of one file.
+
+    Called with a batch, it returns the rows to load, adds the rejected ones
+    to counts (per rule, also reported to the active ingest telemetry) and
+    hands them to write, if there is one.
+    """
+
+    def __init__(self, write=None):
+        self.write = write
+        self.counts = {}
+
+    def __call__(self, df):
+        kept, rejected = split_rejected(df)
+        if rejected is not None:
+            counts = rule_counts(rejected)
+            for rule, count in counts.items():
+                self.counts[rule] = self.counts.get(rule, 0) + count
+            count_rejections(counts)
+            if self.write is not None:
+                self.write(rejected)
+        return kept
+
+    @property
+    def rows(self):
+        return sum(self.counts.values())
+
+    def report(self, label):
+        if self.counts:
+            print(f"{label}: quarantined {self.rows:,} rows ({format_rule_counts(self.counts)})")
+
+
+def quarantine_table(table_name):
+    return f'{table_name}_quarantine'
+
+
+def create_quarantine_table(conn, table_name):
+    """Create <trip table>_quarantine: the trip table's columns plus the broken rule's name."""
+    name = quarantine_table(table_name)
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {name} AS SELECT * FROM {table_name} WHERE 0')
+    if QUALITY_COLUMN not in [row[1] for row in conn.execute(f'PRAGMA table_info({name})')]:
+        conn.execute(f'ALTER TABLE {name} ADD COLUMN {QUALITY_COLUMN} TEXT')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_source_id ON {name} (source_id)')
+
+
+def delete_quarantine(conn, table_name, source_id):
+    conn.execute(f'DELETE FROM {quarantine_table(table_name)} WHERE source_id = ?', (source_id,))
+
+
+def quarantine_writer(conn, load, table_name, columns, encoders=None, time_encoding=DEFAULT_TIME_ENCODING):
+    """Return a callable inserting rejected rows of one file into its quarantine table.
+
+    It runs inside the file's transaction, so the quarantine is replaced
+    together with the file's rows. encoders are the trip table's (lookup
+    ids of text columns).
+    """
+    writer = BulkWriter(conn, quarantine_table(table_name), list(columns) + [QUALITY_COLUMN],
+                        constants={'source_id': load.source_id}, time_encoding=time_encoding)
+    encoders = encoders or {}
+
+    def write(rows):
+        if encoders:
+            rows = rows.assign(**{col: encode(rows) for col, encode in encoders.items()})
+        writer.insert_rows(rows)
+
+    return write
+
+
+if __name__ == "__main__":
+    from sqlite_bulk_writer import connect_for_bulk_load
+    from taxi_types import TAXI_TYPES, load_loader
+
+    parser = argparse.ArgumentParser(description="Show how many rows each quality rule quarantined per file.")
+    parser.add_argument('--db', default=r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\taxi_data.db")
+    parser.add_argument('--types', nargs='+', choices=list(TAXI_TYPES), default=list(TAXI_TYPES))
+    args = parser.parse_args()
+
+    conn = connect_for_bulk_load(args.db)
+    for taxi_type in args.types:
+        table_name = load_loader(taxi_type).TABLE_NAME
+        try:
+            counts = pd.read_sql_query(
+                f'SELECT m.file_name AS file, q.{QUALITY_COLUMN} AS rule, COUNT(*) AS rows_rejected '
+                f'FROM {quarantine_table(table_name)} q JOIN ingest_manifest m USING (source_id) '
+                f'GROUP BY 1, 2 ORDER BY 1, 3 DESC', conn)
+        except pd.errors.DatabaseError:
+            print(f"{taxi_type}: no quarantine table")
+            continue
+        print(f"{taxi_type}: {counts['rows_rejected'].sum():,} rows quarantined")
+        if not counts.empty:
+            print(counts.to_string(index=False))
+    conn.close()
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+import pandas as pd
+
+# Per-table data version, moved forward in the same transaction as every
+# load that changes the table. Query results are cached under the versions
+# of the tables they read, so a new load makes the old entries unreachable.
+DATA_VERSIONS_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS data_versions (
+    table_name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+'''
+
+# Total size of the cache files before the least recently used ones are removed
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+_STRING_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+
+def bump_data_version(conn, table_name):
+    """Move table_name's data version forward (inside the caller's transaction).
+
+    The version is at least the current time in nanoseconds, so it also moves
+    past the versions of a database that was deleted and loaded again.
+    """
+    conn.execute(
+        'INSERT INTO data_versions (table_name, version) VALUES (?, ?) '
+        'ON CONFLICT (table_name) DO UPDATE SET version = MAX(version + 1, excluded.version)',
+        (table_name, time.time_ns())
+    )
+
+
+def data_version(conn, table_name):
+    """Return table_name's data version, 0 if it was never loaded with versioning."""
+    try:
+        row = conn.execute('SELECT version FROM data_versions WHERE table_name = ?', (table_name,)).fetchone()
+    except sqlite3.OperationalError:
+        # Database created before data versions existed
+        return 0
+    return row[0] if row else 0
+
+
+def normalize_sql(sql):
+    """Collapse whitespace outside string literals and drop trailing semicolons."""
+    parts = _STRING_LITERAL.split(sql)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r'\s+', ' ', parts[i])
+    return ''.join(parts).strip().rstrip(';').rstrip()
+
+
+class QueryCache:
+    """Query results stored as zstd-compressed Parquet files in cache_dir.
+
+    An entry's key is a hash of the normalized SQL, its parameters, the data
+    versions of the tables it reads and a namespace (the database or dataset
+    it ran against). Reading an entry refreshes its modification time, and
+    once the files add up to more than max_bytes the least recently used ones
+    are deleted.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, sql, params=(), versions=None, namespace=''):
+        payload = json.dumps([namespace, normalize_sql(sql), list(params), sorted((versions or {}).items())],
+                             default=str)
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.parquet')
+
+    def get(self, key):
+        """Return the cached DataFrame for key, or None."""
+        path = self._path(key)
+        try:
+            df = pd.read_parquet(path)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return df
+
+    def put(self, key, df):
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        df.to_parquet(tmp_path, compression='zstd', index=False)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def get_or_run(self, sql, params, versions, run, namespace=''):
+        """Return the cached result of sql, calling run() and caching it on a miss."""
+        key = self.key(sql, params, versions, namespace)
+        df = self.get(key)
+        if df is not None:
+            self.hits += 1
+            return df
+        self.misses += 1
+        df = run()
+        self.put(key, df)
+        return df
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.parquet'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # removed by another process
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.parquet'):
+                os.remove(entry.path)
@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pyarrow as pa
+
+from month_partitions import parse_month
+from named_queries import QUERIES, ZONE_FILTERS
+from query_cache import QueryCache
+from storage_backends import SQLiteBackend
+from taxi_types import TAXI_TYPES
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+
+# Threads running queries, each on its own read-only connection. SQLite lets
+# any number of readers run beside the loader's write transaction in WAL
+# mode, and releases the GIL while a statement runs.
+DEFAULT_QUERY_THREADS = 2 * (os.cpu_count() or 1)
+
+# Results kept in memory, least recently used dropped first. An entry is only
+# served while its taxi type's data version is unchanged, so every loaded
+# file makes the next request run its query again.
+RESULT_CACHE_ENTRIES = 1024
+
+# Response formats, by the 'format' parameter
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+# Longest request line or header accepted, and most headers per request
+MAX_LINE_BYTES = 8192
+MAX_HEADERS = 100
+
+
+class RequestError(Exception):
+    """A request the service answers with an error status instead of data."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _single(params, name):
+    values = params.get(name)
+    if values and len(values) > 1:
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"{name} given more than once")
+    return values[0] if values else None
+
+
+def _month_text(month):
+    """'YYYY-MM' of a yyyymm integer; an open bound stays None."""
+    return None if month is None else f'{month // 100}-{month % 100:02d}'
+
+
+def parse_query(taxi_type, name, params):
+    """Check a request's path and parameters; return (name, taxi_type, months, zones)."""
+    if taxi_type not in TAXI_TYPES:
+        raise RequestError(HTTPStatus.NOT_FOUND, f"Unknown taxi type {taxi_type!r}, expected one of {list(TAXI_TYPES)}")
+    if name not in QUERIES:
+        raise RequestError(HTTPStatus.NOT_FOUND, f"Unknown query {name!r}, expected one of {list(QUERIES)}")
+    start, end = _single(params, 'start'), _single(params, 'end')
+    try:
+        # Normalized, so '2019-01' and '201901' share one query and cache entry; a missing bound stays None
+        months = (parse_month(start), parse_month(end)) if start or end else None
+        zones = {}
+        for zone_filter in ZONE_FILTERS:
+            zone = _single(params, zone_filter)
+            if zone is not None:
+                zones[zone_filter] = int(zone)
+    except ValueError as e:
+        raise RequestError(HTTPStatus.BAD_REQUEST, str(e)) from None
+    return name, taxi_type, months, zones
+
+
+def encode(df, output_format, meta):
+    """Serialize a query result to (content type, body bytes)."""
+    if output_format == 'arrow':
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({'query': json.dumps(meta)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return CONTENT_TYPES['arrow'], sink.getvalue().to_pybytes()
+    body = json.dumps({**meta, 'rows': json.loads(df.to_json(orient='records'))})
+    return CONTENT_TYPES['json'], body.encode()
+
+
+class AggregateService:
+    """Answers the named aggregate queries over HTTP while the database keeps loading.
+
+    GET /v1/<taxi type>/<query>?start=YYYY-MM&end=YYYY-MM&pickup_zone=N
+        &dropoff_zone=N&approximate=1&format=json|arrow
+    runs one of storage_backends.QUERIES (peak_hours, passenger_fare,
+    monthly_trips); every parameter is optional. GET /health reports the
+    request counters.
+
+    The event loop only parses requests and writes responses; queries run
+    on a pool of threads sharing one read-only SQLiteBackend, which gives
+    every thread its own read-only connection. Identical requests that
+    arrive while one is running wait for that query instead of starting
+    their own, so a burst of the same dashboard request costs one scan,
+    and the result is reused until the next file of that taxi type loads
+    (see RESULT_CACHE_ENTRIES).
+    """
+
+    def __init__(self, sqlite_db, threads=DEFAULT_QUERY_THREADS, cache_dir=None):
+        # A wrong path must not leave an empty database behind that answers
+        # every request with "no such table"
+        if not os.path.isfile(sqlite_db):
+            raise FileNotFoundError(f"No database at {sqlite_db}")
+        # Readers only run beside a writer in WAL mode; the loaders switch the
+        # database to it too, but it may not have been loaded by them yet.
+        # mode=rw opens the existing file and never creates one.
+        conn = sqlite3.connect(Path(os.path.abspath(sqlite_db)).as_uri() + '?mode=rw', uri=True)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.close()
+        self.backend = SQLiteBackend(sqlite_db, QueryCache(cache_dir) if cache_dir else None, read_only=True)
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='aggregate-query')
+        self._running = {}   # (query, taxi type, months, zones, approximate) -> future of its DataFrame
+        self._results = OrderedDict()   # same key -> (data version, DataFrame)
+        self.started = time.time()
+        self.requests = 0
+        self.queries = 0
+        self.coalesced = 0
+        self.cached = 0
+
+    def _remember(self, key, version, future):
+        self._running.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._results[key] = (version, future.result())
+        self._results.move_to_end(key)
+        while len(self._results) > RESULT_CACHE_ENTRIES:
+            self._results.popitem(last=False)
+
+    async def aggregate(self, name, taxi_type, months=None, zones=None, approximate=False):
+        """Run a query on the thread pool, or join the identical one already running."""
+        key = (name, taxi_type, months, tuple(sorted((zones or {}).items())), approximate)
+        # A primary-key lookup on the event loop's own read-only connection
+        version = self.backend.data_version(taxi_type)
+        result = self._results.get(key)
+        if result is not None and result[0] == version:
+            self.cached += 1
+            self._results.move_to_end(key)
+            return result[1]
+        future = self._running.get(key)
+        if future is None:
+            self.queries += 1
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, partial(self.backend.query, name, taxi_type, approximate, months, zones))
+            self._running[key] = future
+            future.add_done_callback(partial(self._remember, key, version))
+        else:
+            self.coalesced += 1
+        # A client hanging up must not cancel the query other clients wait for
+        return await asyncio.shield(future)
+
+    async def respond(self, method, target, headers):
+        """Answer one request; return (status, content type, body)."""
+        self.requests += 1
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        if method not in ('GET', 'HEAD'):
+            raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} is not supported")
+        if parts == ['health']:
+            body = {'status': 'ok', 'uptime_seconds': round(time.time() - self.started, 1),
+                    'requests': self.requests, 'queries': self.queries, 'coalesced': self.coalesced,
+                    'cached': self.cached, 'running': len(self._running)}
+            return HTTPStatus.OK, CONTENT_TYPES['json'], json.dumps(body).encode()
+        if len(parts) != 3 or parts[0] != 'v1':
+            raise RequestError(HTTPStatus.NOT_FOUND, f"No such resource {url.path}")
+
+        name, taxi_type, months, zones = parse_query(parts[1], parts[2], params)
+        approximate = _single(params, 'approximate') in ('1', 'true')
+        output_format = _single(params, 'format')
+        if output_format is None:
+            output_format = 'arrow' if CONTENT_TYPES['arrow'] in headers.get('accept', '') else 'json'
+        if output_format not in CONTENT_TYPES:
+            raise RequestError(HTTPStatus.BAD_REQUEST,
+                               f"Unknown format {output_format!r}, expected one of {list(CONTENT_TYPES)}")
+
+        df = await self.aggregate(name, taxi_type, months, zones, approximate)
+        meta = {'taxi_type': taxi_type, 'query': name,
+                'months': dict(zip(('start', 'end'), map(_month_text, months))) if months else None,
+                'zones': zones, 'approximate': approximate}
+        content_type, body = encode(df, output_format, meta)
+        return HTTPStatus.OK, content_type, body
+
+    async def _read_request(self, reader):
+        """Read one request's line and headers; return None when the client closed the connection."""
+        line = await reader.readline()
+        if not line:
+            return None
+        if len(line) > MAX_LINE_BYTES or not line.endswith(b'\n'):
+            raise RequestError(HTTPStatus.REQUEST_URI_TOO_LONG, "Request line too long")
+        try:
+            method, target, version = line.decode('latin-1').split()
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Malformed request line") from None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= MAX_HEADERS or len(line) > MAX_LINE_BYTES:
+                raise RequestError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many or too long headers")
+            field, _, value = line.decode('latin-1').partition(':')
+            headers[field.strip().lower()] = value.strip()
+        return method, target, version, headers
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one connection, keeping it open between them (HTTP/1.1)."""
+        try:
+            while True:
+                keep_alive = False
+                method = None
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, target, version, headers = request
+                    connection = headers.get('connection', '').lower()
+                    keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+                    status, content_type, body = await self.respond(method, target, headers)
+                except RequestError as e:
+                    status, content_type = e.status, CONTENT_TYPES['json']
+                    body = json.dumps({'error': str(e)}).encode()
+                except Exception as e:
+                    status, content_type = HTTPStatus.INTERNAL_SERVER_ERROR, CONTENT_TYPES['json']
+                    body = json.dumps({'error': f'{type(e).__name__}: {e}'}).encode()
+                    print(f"{method} {request[1] if request else ''}: {type(e).__name__}: {e}")
+                head = (f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                        f'Content-Type: {content_type}\r\n'
+                        f'Content-Length: {len(body)}\r\n'
+                        f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+                writer.write(head.encode('latin-1') + (b'' if method == 'HEAD' else body))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE_BYTES * 2)
+        print(f"Serving aggregates of {self.backend.location} on http://{host}:{port}/v1/<taxi type>/<query>")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown()
+        self.backend.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the aggregate queries over HTTP as JSON or Arrow.")
+    parser.add_argument('--db', default=r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\taxi_data.db")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--threads', type=int, default=DEFAULT_QUERY_THREADS, help="query threads")
+    parser.add_argument('--cache-dir', help="cache query results in this directory (see query_cache.py)")
+    args = parser.parse_args()
+
+    try:
+        service = AggregateService(args.db, args.threads, args.cache_dir)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    print("Stopped serving.")
@@ -0,0 +1,168 @@
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from ingest_telemetry import stage
+from month_partitions import trip_rows
+from query_cache import bump_data_version
+from transform_engine import widen_money
+
+# Additive per-file rollups. Every row holds sums for one (taxi type, grain,
+# bucket) coming from one source file, so batches and files merge with a
+# plain SUM and replacing a file only touches that file's rows.
+ROLLUP_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS trip_rollups (
+    taxi_type TEXT NOT NULL,
+    grain TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    source_id INTEGER NOT NULL,
+    trip_count INTEGER NOT NULL,
+    fare_count INTEGER NOT NULL,
+    fare_sum REAL NOT NULL,
+    distance_sum REAL NOT NULL,
+    PRIMARY KEY (taxi_type, grain, bucket, source_id)
+) WITHOUT ROWID;
+'''
+
+# Grains and the bucket format each one uses
+#   hour            'YYYY-MM-DD HH'
+#   day             'YYYY-MM-DD'
+#   month           'YYYY-MM'
+#   passenger_count passenger count as an integer string, '' when unknown
+GRAINS = ('hour', 'day', 'month', 'passenger_count')
+
+UPSERT_SQL = '''
+INSERT INTO trip_rollups (taxi_type, grain, bucket, source_id, trip_count, fare_count, fare_sum, distance_sum)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (taxi_type, grain, bucket, source_id) DO UPDATE SET
+    trip_count = trip_count + excluded.trip_count,
+    fare_count = fare_count + excluded.fare_count,
+    fare_sum = fare_sum + excluded.fare_sum,
+    distance_sum = distance_sum + excluded.distance_sum
+'''
+
+
+def create_rollup_table(conn):
+    conn.execute(ROLLUP_TABLE_SQL)
+
+
+def delete_rollups(conn, source_id):
+    conn.execute('DELETE FROM trip_rollups WHERE source_id = ?', (source_id,))
+
+
+def _measures(df, spec):
+    """Return the per-row measures used by every grain as a DataFrame."""
+    fare = df[spec['fare']] if spec.get('fare') else pd.Series(np.nan, index=df.index)
+    distance = df[spec['distance']] if spec.get('distance') else pd.Series(0.0, index=df.index)
+    return pd.DataFrame({
+        'trip_count': np.ones(len(df), dtype=np.int64),
+        'fare_count': fare.notna().to_numpy(dtype=np.int64),
+        'fare_sum': widen_money(fare.fillna(0)),
+        'distance_sum': distance.fillna(0).to_numpy(dtype=np.float64),
+    }, index=df.index)
+
+
+def compute_rollups(df, spec):
+    """Aggregate one batch into rows of (grain, bucket, trip_count, fare_count, fare_sum, distance_sum).
+
+    spec maps 'pickup', 'fare', 'distance' and 'passenger' to column names of
+    df; missing measures are left out (fare/distance sums stay 0). The batch is
+    grouped once by pickup hour and the day and month grains are derived from
+    that small result instead of from the rows again.
+    """
+    pickup = df[spec['pickup']]
+    if not pd.api.types.is_datetime64_any_dtype(pickup.dtype):
+        pickup = pd.to_datetime(pickup, errors='coerce')
+    measures = _measures(df, spec)
+    measure_names = list(measures.columns)
+
+    hourly = measures.groupby(pickup.dt.floor('h').rename('ts')).sum()
+    frames = []
+    for grain, fmt in (('hour', '%Y-%m-%d %H'), ('day', '%Y-%m-%d'), ('month', '%Y-%m')):
+        keys = hourly.index.strftime(fmt)
+        grouped = hourly.groupby(keys).sum() if grain != 'hour' else hourly.set_axis(keys)
+        frames.append(grouped.rename_axis('bucket').reset_index().assign(grain=grain))
+
+    if spec.get('passenger'):
+        passengers = df[spec['passenger']]
+        keys = passengers.round().astype('Int64').astype('string').fillna('').rename('bucket')
+        grouped = measures.groupby(keys).sum().reset_index()
+        frames.append(grouped.assign(grain='passenger_count'))
+
+    return pd.concat(frames, ignore_index=True)[['grain', 'bucket'] + measure_names]
+
+
+def update_rollups(conn, taxi_type, source_id, df, spec):
+    """Merge one batch's rollups into trip_rollups (inside the caller's transaction)."""
+    if df.empty:
+        return
+    with stage('aggregate', len(df)):
+        rollups = compute_rollups(df, spec)
+        conn.executemany(UPSERT_SQL, (
+            (taxi_type, grain, bucket, source_id, int(trips), int(fares), float(fare_sum), float(distance_sum))
+            for grain, bucket, trips, fares, fare_sum, distance_sum in rollups.itertuples(index=False)
+        ))
+
+
+def rebuild_rollups(conn, taxi_type, table_name, spec, time_encoding='text'):
+    """Recompute the rollups of one taxi type from its trip table with SQL.
+
+    Only needed for databases that were loaded before rollups existed; rows
+    without a source_id are grouped under source_id 0. Every row is read,
+    from the month partitions too. The trip table's data version is moved
+    forward so cached rollup queries are recomputed.
+    """
+    pickup = f"{spec['pickup']}, 'unixepoch'" if time_encoding == 'epoch' else spec['pickup']
+    fare = spec.get('fare')
+    distance = spec.get('distance')
+    measures = (
+        'COUNT(*), '
+        f'{f"COUNT({fare})" if fare else "0"}, '
+        f'{f"TOTAL({fare})" if fare else "0.0"}, '
+        f'{f"TOTAL({distance})" if distance else "0.0"}'
+    )
+    buckets = {
+        'hour': f"strftime('%Y-%m-%d %H', {pickup})",
+        'day': f"strftime('%Y-%m-%d', {pickup})",
+        'month': f"strftime('%Y-%m', {pickup})",
+    }
+    if spec.get('passenger'):
+        buckets['passenger_count'] = (
+            f"COALESCE(CAST(CAST(ROUND({spec['passenger']}) AS INTEGER) AS TEXT), '')"
+        )
+    rows = trip_rows(conn, table_name)
+    conn.execute('BEGIN')
+    conn.execute('DELETE FROM trip_rollups WHERE taxi_type = ?', (taxi_type,))
+    for grain, bucket in buckets.items():
+        conn.execute(f'''
+            INSERT INTO trip_rollups
+            SELECT ?, ?, {bucket} AS b, COALESCE(source_id, 0), {measures}
+            FROM {rows}
+            WHERE {spec['pickup']} IS NOT NULL
+            GROUP BY b, COALESCE(source_id, 0)
+        ''', (taxi_type, grain))
+    bump_data_version(conn, table_name)
+    conn.execute('COMMIT')
+
+
+if __name__ == "__main__":
+    from ingest_manifest import prepare_table
+    from month_partitions import prepare_partitions
+    from sqlite_bulk_writer import connect_for_bulk_load
+    from taxi_types import TAXI_TYPES, load_loader
+
+    parser = argparse.ArgumentParser(description="Rebuild trip_rollups from the trip tables.")
+    parser.add_argument('--db', default=r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\taxi_data.db")
+    parser.add_argument('--types', nargs='+', choices=list(TAXI_TYPES), default=list(TAXI_TYPES))
+    args = parser.parse_args()
+
+    conn = connect_for_bulk_load(args.db)
+    for taxi_type in args.types:
+        loader = load_loader(taxi_type)
+        prepare_table(conn, loader.TABLE_NAME, loader.TIME_ENCODING)
+        prepare_partitions(conn, loader.TABLE_NAME, loader.PARTITIONING, loader.ROLLUP_COLUMNS['pickup'],
+                           loader.TIME_ENCODING)
+        rebuild_rollups(conn, taxi_type, loader.TABLE_NAME, loader.ROLLUP_COLUMNS, loader.TIME_ENCODING)
+        print(f"Rebuilt rollups for {taxi_type}")
+    conn.close()
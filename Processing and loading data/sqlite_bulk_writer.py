@@ -0,0 +1,144 @@
+import itertools
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from ingest_telemetry import stage
+from time_encoding import DEFAULT_TIME_ENCODING
+from transform_engine import widen_money
+
+# Pragmas applied to the connection for the duration of a bulk load.
+# WAL keeps readers unblocked while a load is running, synchronous=NORMAL is
+# safe under WAL, and a large page cache avoids re-reading index pages.
+LOAD_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -262144,  # negative value = KiB, i.e. 256 MiB
+    'temp_store': 'MEMORY',
+}
+
+# Number of rows handed to a single executemany call
+DEFAULT_BATCH_ROWS = 50_000
+
+
+def connect_for_bulk_load(sqlite_db, pragmas=None):
+    """Open a SQLite connection tuned for bulk loading.
+
+    The connection is in autocommit mode so that transactions are opened
+    explicitly by BulkWriter (one per file) instead of implicitly per statement.
+    """
+    conn = sqlite3.connect(sqlite_db, isolation_level=None)
+    for name, value in (pragmas or LOAD_PRAGMAS).items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def _column_to_list(series, time_encoding=DEFAULT_TIME_ENCODING):
+    """Convert a pandas column into a list of values sqlite3 can bind."""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values = series.to_numpy(dtype='datetime64[s]')
+        if time_encoding == 'epoch':
+            out = values.astype(np.int64).astype(object)
+        else:
+            out = np.char.replace(np.datetime_as_string(values, unit='s'), 'T', ' ').astype(object)
+        out[np.isnat(values)] = None
+        return out.tolist()
+    if series.dtype == object or isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+        return series.to_numpy(dtype=object, na_value=None).tolist()
+    if series.dtype == np.float32:
+        # Compact dollar amounts; store the exact cents, not float32 rounding noise
+        return widen_money(series.to_numpy()).tolist()
+    # Plain numpy numbers: tolist() yields Python ints/floats, NaN is stored as NULL
+    return series.to_numpy().tolist()
+
+
+class BulkWriter:
+    """Stream DataFrame batches into one SQLite table inside a single transaction.
+
+    Usage:
+        with BulkWriter(conn, 'yellow_taxi_data', columns) as writer:
+            writer.write(df)
+
+    Rows are converted column by column (not row by row) and inserted with
+    executemany in slices of batch_rows. The transaction is committed when the
+    block exits normally and rolled back if it raises. constants maps extra
+    column names to a value written on every row (e.g. the source file id).
+    Callables in listeners are called with every written batch inside the same
+    transaction, which is how derived tables stay consistent with the rows.
+    encoders maps stored columns that are not in the batch to a callable
+    computing them from it (e.g. lookup ids of a text column); listeners see
+    the batch with those columns added. quarantine, if set, is called first
+    with every batch and returns the rows to write, having taken out the
+    ones the quality rules rejected (see quarantine.py).
+    Datetime columns are stored as text or as epoch seconds per time_encoding.
+    """
+
+    def __init__(self, conn, table_name, columns, batch_rows=DEFAULT_BATCH_ROWS, label=None,
+                 constants=None, time_encoding=DEFAULT_TIME_ENCODING, encoders=None, quarantine=None):
+        self.conn = conn
+        self.table_name = table_name
+        self.columns = list(columns)
+        self.constants = dict(constants or {})
+        self.listeners = []
+        self.encoders = dict(encoders or {})
+        self.quarantine = quarantine
+        self.time_encoding = time_encoding
+        self.batch_rows = batch_rows
+        self.label = label or table_name
+        self.rows_written = 0
+        self.elapsed = 0.0
+        self.insert_sql = self.insert_statement(table_name)
+
+    def insert_statement(self, table_name):
+        all_columns = self.columns + list(self.constants)
+        placeholders = ', '.join('?' * len(all_columns))
+        return f'INSERT INTO {table_name} ({", ".join(all_columns)}) VALUES ({placeholders})'
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self.conn.execute('BEGIN')
+        return self
+
+    def write(self, df):
+        """Insert every row of df (only the writer's columns are used)."""
+        if self.quarantine is not None:
+            df = self.quarantine(df)
+        with stage('write', len(df)):
+            rows = df.assign(**{col: encode(df) for col, encode in self.encoders.items()}) if self.encoders else df
+            self.insert_rows(rows)
+        for listener in self.listeners:
+            listener(rows)
+        return len(df)
+
+    def delete_source(self, source_id):
+        """Delete the rows previously loaded from one source file."""
+        self.conn.execute(f'DELETE FROM {self.table_name} WHERE source_id = ?', (source_id,))
+
+    def insert_rows(self, rows):
+        """Insert rows that already hold every stored column, in the caller's transaction."""
+        self.insert_into(self.insert_sql, rows)
+
+    def insert_into(self, insert_sql, rows):
+        for start in range(0, len(rows), self.batch_rows):
+            chunk = rows.iloc[start:start + self.batch_rows]
+            columns = [_column_to_list(chunk[col], self.time_encoding) for col in self.columns]
+            columns += [itertools.repeat(value, len(chunk)) for value in self.constants.values()]
+            self.conn.executemany(insert_sql, zip(*columns))
+            self.rows_written += len(chunk)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        self.elapsed = time.perf_counter() - self._started
+        if exc_type is None:
+            print(f"{self.label}: wrote {self.rows_written:,} rows in {self.elapsed:.2f}s "
+                  f"({self.rows_per_second:,.0f} rows/sec)")
+        return False
+
+    @property
+    def rows_per_second(self):
+        return self.rows_written / self.elapsed if self.elapsed else 0.0
@@ -0,0 +1,508 @@
+import glob
+import os
+import sqlite3
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from arrow_cache import ArrowCacheWriter, arrow_cache_root, arrow_column, arrow_schema, open_trips
+from ingest_manifest import MANIFEST_TABLE_SQL, begin_load, check_file, load_file_atomically, record_load
+from ingest_telemetry import stage
+from month_partitions import PartitionReader, month_range, tables_to_read
+from named_queries import (APPROXIMATE_QUERIES, DATASET_QUERIES, PARTITION_QUERIES, QUERIES, ROLLUP_QUERIES,
+                           ZONE_FILTERS)
+from od_matrices import ODAccumulator, ODMatrices, od_root
+from quality_rules import QUALITY_COLUMN
+from quarantine import Quarantine
+from query_cache import DATA_VERSIONS_TABLE_SQL, QueryCache, bump_data_version, data_version
+from sqlite_bulk_writer import connect_for_bulk_load
+from taxi_types import load_loader
+from trip_samples import estimate
+
+# Where cleaned trips are stored and queried from
+#   'sqlite'  - the trip tables and trip_rollups in taxi_data.db
+#   'parquet' - a Hive-partitioned Parquet dataset
+#               (taxi_type=X/year=YYYY/month=MM/part-<source file>.parquet)
+#               queried in-process with DuckDB
+STORAGE_BACKENDS = ('sqlite', 'parquet')
+DEFAULT_STORAGE_BACKEND = 'sqlite'
+
+
+def zone_conditions(taxi_type, zones):
+    """SQL conditions (each starting with ' AND ') and params keeping only trips in the given zones.
+
+    zones maps ZONE_FILTERS names to TLC zone ids; None means no filter.
+    """
+    spec = load_loader(taxi_type).OD_COLUMNS
+    sql, params = '', ()
+    for name, zone in sorted((zones or {}).items()):
+        if zone is None:
+            continue
+        if name not in ZONE_FILTERS:
+            raise ValueError(f"Unknown zone filter {name!r}, expected one of {list(ZONE_FILTERS)}")
+        sql += f' AND {spec[ZONE_FILTERS[name]]} = ?'
+        params += (int(zone),)
+    return sql, params
+
+
+def _import_duckdb():
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("The 'parquet' storage backend needs DuckDB: pip install duckdb") from e
+    return duckdb
+
+
+class StorageBackend:
+    """Where the loaders write cleaned trips and the visualize scripts read them back.
+
+    Files are checked against an ingest manifest, written one source file at
+    a time through file_writer(load) and replaced as a whole when they change.
+    Every replace moves the trip table's data version forward; with a
+    QueryCache, query() only runs SQL when that version has changed. With a
+    TelemetrySink, load_file() reports per-stage timings of every file.
+    Every loaded file also updates the origin-destination matrices under
+    od_root (see od_matrices.py) and, when its loader sets ARROW_CACHE, the
+    memory-mappable copy of its cleaned trips under arrow_root (see
+    arrow_cache.py).
+    """
+
+    name = None
+    cache = None
+    telemetry = None
+    od_root = None
+    arrow_root = None
+
+    def prepare(self, taxi_type):
+        raise NotImplementedError
+
+    def check_file(self, taxi_type, file_path):
+        raise NotImplementedError
+
+    def file_writer(self, load):
+        """Context manager yielding a writer with write(df); the file is replaced when it exits."""
+        raise NotImplementedError
+
+    def query_sql(self, name, taxi_type, months=None, zones=None):
+        """Return (sql, params) of a named query, or None when it has no data to read.
+
+        months is None or the (first, last) yyyymm range the trips must be
+        picked up in; zones holds ZONE_FILTERS.
+        """
+        raise NotImplementedError
+
+    def run_sql(self, sql, params):
+        raise NotImplementedError
+
+    def data_version(self, taxi_type):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def approximate_query(self, name, taxi_type, months=None, zones=None):
+        """Answer one of QUERIES from trip samples, or return None when there are none."""
+        return None
+
+    def od_matrices(self, taxi_type):
+        """The memory-mapped origin-destination matrices of a taxi type (see od_matrices.py)."""
+        return ODMatrices(self.od_root, taxi_type)
+
+    def trips(self, taxi_type, columns=None, months=None):
+        """The cleaned trips of a taxi type as a zero-copy Arrow table from the Arrow cache.
+
+        months=(start, end) only opens those 'YYYY-MM' months; only columns
+        are kept when given.
+        """
+        return open_trips(self.arrow_root, taxi_type, columns, *(months or (None, None)))
+
+    def arrow_cache_writer(self, load, stack):
+        """Enter an ArrowCacheWriter for load's file on stack, or return None when its loader does not cache."""
+        loader = load_loader(load.taxi_type)
+        if not loader.ARROW_CACHE:
+            return None
+        return stack.enter_context(ArrowCacheWriter(self.arrow_root, load.taxi_type, load.file_name,
+                                                    arrow_schema(loader)))
+
+    def query(self, name, taxi_type, approximate=False, months=None, zones=None):
+        """Run one of QUERIES for a taxi type and return a DataFrame.
+
+        months=(start, end) only counts trips picked up in that inclusive
+        range of 'YYYY-MM' months; either bound may be None. zones, e.g.
+        {'pickup_zone': 132}, only counts trips from or to those TLC zones
+        (see ZONE_FILTERS). With approximate=True, a backend that keeps trip
+        samples answers from them and adds <column>_low/<column>_high
+        confidence bounds; the others answer exactly.
+        """
+        months = month_range(*months) if months else None
+        if approximate:
+            result = self.approximate_query(name, taxi_type, months, zones)
+            if result is not None:
+                return result
+        statement = self.query_sql(name, taxi_type, months, zones)
+        if statement is None:
+            return pd.DataFrame(columns=QUERIES[name])
+        sql, params = statement
+        return self.cached(taxi_type, sql, params, lambda: self.run_sql(sql, params))
+
+    def cached(self, taxi_type, sql, params, run):
+        """Return run(), or the result cached under sql and params while taxi_type's data is unchanged."""
+        if self.cache is None:
+            return run()
+        versions = {load_loader(taxi_type).TABLE_NAME: self.data_version(taxi_type)}
+        return self.cache.get_or_run(sql, params, versions, run, namespace=f'{self.name}:{self.location}')
+
+    def track(self, load):
+        """Context manager collecting the stage telemetry of one file, if a TelemetrySink is set."""
+        if self.telemetry is None:
+            return nullcontext()
+        return self.telemetry.track(load.taxi_type, load.file_path, self.name)
+
+    def load_file(self, load, batches):
+        """Write a stream of cleaned DataFrame batches as the new contents of one source file."""
+        with self.track(load), self.file_writer(load) as writer:
+            for df in batches:
+                writer.write(df)
+        return writer.rows_written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def _merge_partials(name, partials):
+    """Add up the per-partition results of one of PARTITION_QUERIES into the columns of QUERIES."""
+    group = QUERIES[name][0]
+    df = partials.groupby(group, dropna=False, as_index=False).sum()
+    if name == 'passenger_fare':
+        df['avg_fare'] = df['fare_sum'] / df['fare_count'].replace(0, np.nan)
+        df = df.sort_values(group, na_position='first', ignore_index=True)
+    elif name == 'monthly_trips':
+        # Trips without a pickup time, from a trip table's own rows, count under a None month
+        df = df.sort_values(group, na_position='first', ignore_index=True)
+        df['month'] = [None if pd.isna(month) else f'{int(month) // 100}-{int(month) % 100:02d}'
+                       for month in df['month']]
+    else:
+        df = df.sort_values('trip_count', ascending=False, ignore_index=True)
+    return df[QUERIES[name]]
+
+
+class SQLiteBackend(StorageBackend):
+    """The trip tables, manifest and rollups in one SQLite database.
+
+    The named queries are answered from trip_rollups. Over a range of months
+    or within zones they run on the trip tables' month partitions instead,
+    pruned to the range and scanned in parallel by a PartitionReader. A
+    read_only backend only queries: every thread that calls it uses its own
+    read-only connection, so it can be shared by a pool of query threads.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, sqlite_db, cache=None, query_workers=None, read_only=False):
+        self.location = os.path.abspath(sqlite_db)
+        self.od_root = od_root(sqlite_db)
+        self.arrow_root = arrow_cache_root(sqlite_db)
+        self.read_only = read_only
+        self.cache = cache
+        self.partitions = PartitionReader(sqlite_db, query_workers)
+        self._conn = None if read_only else connect_for_bulk_load(sqlite_db)
+
+    @property
+    def conn(self):
+        """The bulk-load connection, or the calling thread's read-only connection when read_only."""
+        return self.partitions.connection() if self.read_only else self._conn
+
+    def prepare(self, taxi_type):
+        load_loader(taxi_type).create_table(self.conn)
+
+    def check_file(self, taxi_type, file_path):
+        return check_file(self.conn, taxi_type, file_path)
+
+    @contextmanager
+    def file_writer(self, load):
+        loader = load_loader(load.taxi_type)
+        od = ODAccumulator(loader.OD_COLUMNS)
+        # The Arrow files are renamed into place after the rows are committed
+        with ExitStack() as stack:
+            cache = self.arrow_cache_writer(load, stack)
+            writer = stack.enter_context(load_file_atomically(
+                self.conn, load, loader.TABLE_NAME, loader.COLUMNS, loader.ROLLUP_COLUMNS, loader.DIMENSIONS,
+                loader.SAMPLE_RATE, time_encoding=loader.TIME_ENCODING))
+            writer.listeners.append(od.add)
+            if cache is not None:
+                writer.listeners.append(cache.write)
+            yield writer
+        # The matrices follow the committed rows; od_matrices.py --rebuild
+        # catches up if the process stops in between
+        od.save(self.od_root, load.taxi_type, load.source_id)
+
+    def query_sql(self, name, taxi_type, months=None, zones=None):
+        return ROLLUP_QUERIES[name], (taxi_type,)
+
+    def query(self, name, taxi_type, approximate=False, months=None, zones=None):
+        filtered = any(zone is not None for zone in (zones or {}).values())
+        if (months is None and not filtered) or approximate:
+            return super().query(name, taxi_type, approximate, months, zones)
+        return self.partitioned_query(name, taxi_type, month_range(*(months or ())), zones)
+
+    def partitioned_query(self, name, taxi_type, months, zones=None):
+        """Run one of PARTITION_QUERIES on every partition in the (first, last) month range and merge the results."""
+        loader = load_loader(taxi_type)
+        spec = loader.ROLLUP_COLUMNS
+        if name == 'passenger_fare' and not spec.get('passenger'):
+            return pd.DataFrame(columns=QUERIES[name])
+        conditions, zone_params = zone_conditions(taxi_type, zones)
+        sql = PARTITION_QUERIES[name].format(trips='{trips}', months='{months}', passenger=spec.get('passenger'),
+                                             fare=spec.get('fare') or 'NULL', zones=conditions)
+
+        def run():
+            tables = tables_to_read(self.conn, loader.TABLE_NAME, *months)
+            partials = self.partitions.map(sql, tables, zone_params)
+            if partials is None:
+                return pd.DataFrame(columns=QUERIES[name])
+            return _merge_partials(name, partials)
+
+        return self.cached(taxi_type, sql, tuple(months) + zone_params, run)
+
+    def approximate_query(self, name, taxi_type, months=None, zones=None):
+        loader = load_loader(taxi_type)
+        group_by, measure, group = APPROXIMATE_QUERIES[name]
+        spec = loader.ROLLUP_COLUMNS
+        if '{passenger}' in group_by and not spec.get('passenger'):
+            return pd.DataFrame(columns=QUERIES[name])
+        conditions, zone_params = zone_conditions(taxi_type, zones)
+        where = ('pickup_month BETWEEN ? AND ?' if months else '1') + conditions
+        try:
+            df = estimate(self.conn, taxi_type, loader.TABLE_NAME, group_by.format(passenger=spec.get('passenger')),
+                          spec.get(measure) if measure else None, where, tuple(months or ()) + zone_params)
+        except (sqlite3.OperationalError, pd.errors.DatabaseError):
+            return None  # no sample table: answer exactly
+        df = df.rename(columns={'group': group, 'mean': 'avg_fare', 'mean_low': 'avg_fare_low',
+                                'mean_high': 'avg_fare_high'})
+        if name == 'monthly_trips':
+            df['month'] = [f'{month // 100}-{month % 100:02d}' for month in df['month'].astype(int)]
+        elif df[group].notna().all():
+            # Integer keys, as the exact queries return them when no group is NULL
+            df[group] = df[group].astype(np.int64)
+        order = {'peak_hours': ('trip_count', False)}.get(name, (group, True))
+        # The NULL group first, like the exact queries' ORDER BY
+        df = df.sort_values(order[0], ascending=order[1], na_position='first', ignore_index=True)
+        extra = [f'{col}_{bound}' for col in QUERIES[name][1:] for bound in ('low', 'high')]
+        return df[QUERIES[name] + extra]
+
+    def run_sql(self, sql, params):
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def data_version(self, taxi_type):
+        return data_version(self.conn, load_loader(taxi_type).TABLE_NAME)
+
+    def close(self):
+        self.partitions.close()
+        if self._conn is not None:
+            self._conn.close()
+
+
+class PartitionedParquetWriter:
+    """Write one source file's batches into the month partitions of a Hive-style dataset.
+
+    Rows go to <type_dir>/year=YYYY/month=MM/ by their pickup_month, through
+    one streaming ParquetWriter per month into a temporary file. Only when
+    the block exits normally are the source file's previous parts removed
+    and the new ones renamed into place; on error the temporary files are
+    deleted and the old parts stay untouched. Rows rejected by the quality
+    rules replace the file's previous ones in quarantine_path the same way.
+    Callables in listeners are called with every batch of rows written.
+    """
+
+    def __init__(self, type_dir, part_name, schema, label=None, quarantine_path=None):
+        self.type_dir = type_dir
+        self.part_name = part_name
+        self.schema = schema
+        self.label = label or part_name
+        self.rows_written = 0
+        self.elapsed = 0.0
+        self._writers = {}
+        self.quarantine_path = quarantine_path
+        self.quarantine = Quarantine(self._write_rejected if quarantine_path else None)
+        self._rejected_writer = None
+        self.listeners = []
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def _partition_path(self, month):
+        year, month = divmod(int(month), 100)
+        return os.path.join(self.type_dir, f'year={year:04d}', f'month={month:02d}', self.part_name)
+
+    def _write_rejected(self, rows):
+        schema = self.schema.append(pa.field(QUALITY_COLUMN, pa.string()))
+        if self._rejected_writer is None:
+            os.makedirs(os.path.dirname(self.quarantine_path), exist_ok=True)
+            self._rejected_writer = pq.ParquetWriter(self.quarantine_path + '.tmp', schema)
+        self._rejected_writer.write_table(
+            pa.Table.from_arrays([arrow_column(rows[field.name], field.type) for field in schema], schema=schema)
+        )
+
+    def write(self, df):
+        """Append every row of df (only the schema's columns are used)."""
+        df = self.quarantine(df)
+        if df.empty:
+            return 0
+        with stage('write', len(df)):
+            table = pa.Table.from_arrays([arrow_column(df[field.name], field.type) for field in self.schema],
+                                         schema=self.schema)
+            months = df['pickup_month'].to_numpy(dtype=np.int64)
+            for month in np.unique(months):
+                writer = self._writers.get(month)
+                if writer is None:
+                    path = self._partition_path(month)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    writer = self._writers[month] = pq.ParquetWriter(path + '.tmp', self.schema)
+                writer.write_table(table.filter(pa.array(months == month)))
+        for listener in self.listeners:
+            listener(df)
+        self.rows_written += len(df)
+        return len(df)
+
+    def __exit__(self, exc_type, exc, tb):
+        for writer in self._writers.values():
+            writer.close()
+        new_parts = [self._partition_path(month) for month in self._writers]
+        if self._rejected_writer is not None:
+            self._rejected_writer.close()
+            new_parts.append(self.quarantine_path)
+        if exc_type is None:
+            for old_part in glob.glob(os.path.join(self.type_dir, '*', '*', self.part_name)):
+                os.remove(old_part)
+            if self.quarantine_path and os.path.exists(self.quarantine_path):
+                os.remove(self.quarantine_path)
+            for path in new_parts:
+                os.replace(path + '.tmp', path)
+        else:
+            for path in new_parts:
+                os.remove(path + '.tmp')
+        self.elapsed = time.perf_counter() - self._started
+        if exc_type is None:
+            print(f"{self.label}: wrote {self.rows_written:,} rows in {self.elapsed:.2f}s "
+                  f"({self.rows_per_second:,.0f} rows/sec)")
+            self.quarantine.report(self.label)
+        return False
+
+    @property
+    def rows_per_second(self):
+        return self.rows_written / self.elapsed if self.elapsed else 0.0
+
+
+class ParquetDatasetBackend(StorageBackend):
+    """A Hive-partitioned Parquet dataset under dataset_root, queried with DuckDB.
+
+    The ingest manifest lives in dataset_root/_manifest.db, so unchanged files
+    are skipped and changed files replaced exactly as with SQLite. Rows
+    rejected by the quality rules go to
+    dataset_root/_quarantine/taxi_type=X/part-<source file>.parquet and the
+    origin-destination matrices to dataset_root/_od/ and the Arrow cache to
+    dataset_root/_arrow/. Columns
+    are stored with the types declared in each loader's CREATE_TABLE_SQL and
+    timestamps as Parquet timestamps (TIME_ENCODING only applies to SQLite).
+    """
+
+    name = 'parquet'
+
+    def __init__(self, dataset_root, cache=None):
+        self.root = dataset_root
+        self.location = os.path.abspath(dataset_root)
+        self.od_root = os.path.join(self.location, '_od')
+        self.arrow_root = os.path.join(self.location, '_arrow')
+        os.makedirs(dataset_root, exist_ok=True)
+        self.manifest = sqlite3.connect(os.path.join(dataset_root, '_manifest.db'), isolation_level=None)
+        self.manifest.execute(MANIFEST_TABLE_SQL)
+        self.manifest.execute(DATA_VERSIONS_TABLE_SQL)
+        self.cache = cache
+        self._duckdb = None
+
+    def type_dir(self, taxi_type):
+        return os.path.join(self.root, f'taxi_type={taxi_type}')
+
+    def prepare(self, taxi_type):
+        os.makedirs(self.type_dir(taxi_type), exist_ok=True)
+
+    def check_file(self, taxi_type, file_path):
+        return check_file(self.manifest, taxi_type, file_path)
+
+    @contextmanager
+    def file_writer(self, load):
+        loader = load_loader(load.taxi_type)
+        begin_load(self.manifest, load)
+        part_name = f'part-{os.path.splitext(load.file_name)[0]}.parquet'
+        quarantine_path = os.path.join(self.root, '_quarantine', f'taxi_type={load.taxi_type}', part_name)
+        od = ODAccumulator(loader.OD_COLUMNS)
+        with ExitStack() as stack:
+            cache = self.arrow_cache_writer(load, stack)
+            writer = stack.enter_context(PartitionedParquetWriter(
+                self.type_dir(load.taxi_type), part_name, arrow_schema(loader), label=load.file_name,
+                quarantine_path=quarantine_path))
+            writer.listeners.append(od.add)
+            if cache is not None:
+                writer.listeners.append(cache.write)
+            yield writer
+        od.save(self.od_root, load.taxi_type, load.source_id)
+        self.manifest.execute('BEGIN')
+        record_load(self.manifest, load, writer.rows_written)
+        bump_data_version(self.manifest, loader.TABLE_NAME)
+        self.manifest.execute('COMMIT')
+
+    def query_sql(self, name, taxi_type, months=None, zones=None):
+        spec = load_loader(taxi_type).ROLLUP_COLUMNS
+        pattern = os.path.join(self.type_dir(taxi_type), '*', '*', '*.parquet')
+        if not glob.glob(pattern) or (name == 'passenger_fare' and not spec.get('passenger')):
+            return None
+        trips = ("read_parquet('{}', hive_partitioning = true, union_by_name = true, "
+                 "hive_types = {{'year': INTEGER, 'month': INTEGER}})").format(pattern.replace("'", "''"))
+        # Only the month directories in the range are read
+        conditions, zone_params = zone_conditions(taxi_type, zones)
+        where = 'year * 100 + month BETWEEN ? AND ?' if months else ''
+        where = f'WHERE {where or "true"}{conditions}' if where or conditions else ''
+        sql = DATASET_QUERIES[name].format(trips=trips, where=where, passenger=spec.get('passenger'),
+                                           fare=spec.get('fare') or 'NULL')
+        return sql, tuple(months or ()) + zone_params
+
+    def run_sql(self, sql, params):
+        if self._duckdb is None:
+            self._duckdb = _import_duckdb().connect()
+        return self._duckdb.execute(sql, list(params)).df()
+
+    def data_version(self, taxi_type):
+        return data_version(self.manifest, load_loader(taxi_type).TABLE_NAME)
+
+    def close(self):
+        self.manifest.close()
+        if self._duckdb is not None:
+            self._duckdb.close()
+
+
+def open_backend(name=DEFAULT_STORAGE_BACKEND, sqlite_db=None, dataset_root=None, cache_dir=None,
+                 telemetry=None):
+    """Open a storage backend by name: the SQLite database or the Parquet dataset root.
+
+    With a cache_dir, query results are cached there (see query_cache.py).
+    With a telemetry TelemetrySink, every loaded file reports its stage
+    timings to it (see ingest_telemetry.py).
+    """
+    cache = QueryCache(cache_dir) if cache_dir else None
+    if name == 'sqlite':
+        backend = SQLiteBackend(sqlite_db, cache)
+    elif name == 'parquet':
+        backend = ParquetDatasetBackend(dataset_root, cache)
+    else:
+        raise ValueError(f"Unknown storage backend {name!r}, expected one of {STORAGE_BACKENDS}")
+    backend.telemetry = telemetry
+    return backend
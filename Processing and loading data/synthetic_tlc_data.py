@@ -0,0 +1,259 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from taxi_types import TAXI_TYPES
+
+# Rows per generated row group; chunks are generated one at a time, so memory
+# stays flat however many rows a file has
+DEFAULT_ROW_GROUP_ROWS = 1_000_000
+
+# Share of trips starting in each hour of the day (TLC-like: quiet at 4-5am,
+# morning and evening peaks)
+HOUR_WEIGHTS = np.array([
+    3.0, 2.2, 1.6, 1.2, 1.0, 1.2, 2.2, 3.6, 4.4, 4.4, 4.2, 4.3,
+    4.6, 4.7, 5.0, 5.1, 5.0, 5.5, 6.3, 6.4, 5.8, 5.4, 5.0, 4.0,
+])
+HOUR_WEIGHTS = HOUR_WEIGHTS / HOUR_WEIGHTS.sum()
+
+# Passenger counts 0-6 as they appear in the yellow and green files
+PASSENGER_WEIGHTS = np.array([0.02, 0.70, 0.14, 0.04, 0.02, 0.05, 0.03])
+
+# TLC taxi zones are numbered 1-265; trips concentrate on a few busy zones
+ZONE_COUNT = 265
+BASE_COUNT = 300
+HVFHS_LICENSES = (['HV0002', 'HV0003', 'HV0004', 'HV0005'], [0.01, 0.72, 0.02, 0.25])
+
+# Share of rows with the defects the loaders have to cope with
+MISSING_DROPOFF_RATE = 0.001
+MISSING_PASSENGER_RATE = 0.01
+NEGATIVE_FARE_RATE = 0.001
+ZERO_DISTANCE_RATE = 0.01
+
+
+def _zone_weights(rng, count=ZONE_COUNT, skew=1.1):
+    """Zipf-like popularity of zone (or base) numbers, in a seeded random order."""
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    return rng.permutation(weights / weights.sum())
+
+
+def _pickup_times(rng, n, year, month):
+    """Pickup datetimes over the month following the hourly profile."""
+    first = np.datetime64(f'{year:04d}-{month:02d}', 'M')
+    days = int(((first + 1).astype('datetime64[D]') - first.astype('datetime64[D]')).astype(np.int64))
+    seconds = (rng.integers(0, days, n) * 86400
+               + rng.choice(24, n, p=HOUR_WEIGHTS) * 3600
+               + rng.integers(0, 3600, n))
+    return first.astype('datetime64[s]') + seconds.astype('timedelta64[s]')
+
+
+def _trips(rng, n, year, month):
+    """Shared trip shape: pickup/dropoff, duration-correlated distance and a metered fare."""
+    pickup = _pickup_times(rng, n, year, month)
+    minutes = np.clip(rng.lognormal(np.log(12), 0.6, n), 1, 240)
+    dropoff = pickup + (minutes * 60).astype('timedelta64[s]')
+    dropoff[rng.random(n) < MISSING_DROPOFF_RATE] = np.datetime64('NaT')
+    mph = np.clip(rng.lognormal(np.log(11), 0.35, n), 2, 60)
+    distance = np.round(minutes / 60 * mph, 2)
+    distance[rng.random(n) < ZERO_DISTANCE_RATE] = 0.0
+    fare = np.round(2.5 + 2.5 * distance + 0.35 * minutes + rng.normal(0, 1, n), 1).clip(2.5)
+    fare[rng.random(n) < NEGATIVE_FARE_RATE] *= -1
+    return pickup, dropoff, minutes, distance, fare
+
+
+def _zones(rng, weights, n):
+    return rng.choice(ZONE_COUNT, n, p=weights) + 1
+
+
+def _passengers(rng, n):
+    passengers = rng.choice(len(PASSENGER_WEIGHTS), n, p=PASSENGER_WEIGHTS).astype(np.float64)
+    passengers[rng.random(n) < MISSING_PASSENGER_RATE] = np.nan
+    return passengers
+
+
+def _metered_extras(rng, n, fare):
+    tip = np.round(np.where(rng.random(n) < 0.65, fare * rng.uniform(0.1, 0.25, n), 0.0), 2)
+    tolls = np.where(rng.random(n) < 0.05, 6.12, 0.0)
+    congestion = np.where(rng.random(n) < 0.9, 2.5, 0.0)
+    return tip, tolls, congestion
+
+
+def yellow_trips(rng, n, year, month, zones):
+    pickup, dropoff, _, distance, fare = _trips(rng, n, year, month)
+    tip, tolls, congestion = _metered_extras(rng, n, fare)
+    return pd.DataFrame({
+        'VendorID': rng.choice([1, 2], n, p=[0.35, 0.65]),
+        'tpep_pickup_datetime': pickup,
+        'tpep_dropoff_datetime': dropoff,
+        'passenger_count': _passengers(rng, n),
+        'trip_distance': distance,
+        'RatecodeID': np.where(rng.random(n) < 0.97, 1.0, 2.0),
+        'store_and_fwd_flag': np.where(rng.random(n) < 0.99, 'N', 'Y'),
+        'PULocationID': _zones(rng, zones, n),
+        'DOLocationID': _zones(rng, zones, n),
+        'payment_type': rng.choice([1, 2, 3, 4], n, p=[0.70, 0.28, 0.01, 0.01]),
+        'fare_amount': fare,
+        'extra': rng.choice([0.0, 0.5, 1.0], n),
+        'mta_tax': 0.5,
+        'tip_amount': tip,
+        'tolls_amount': tolls,
+        'improvement_surcharge': 0.3,
+        'total_amount': np.round(fare + 0.8 + tip + tolls + congestion, 2),
+        'congestion_surcharge': congestion,
+        'airport_fee': np.nan,
+    })
+
+
+def green_trips(rng, n, year, month, zones):
+    pickup, dropoff, _, distance, fare = _trips(rng, n, year, month)
+    tip, tolls, congestion = _metered_extras(rng, n, fare)
+    return pd.DataFrame({
+        'VendorID': rng.choice([1, 2], n, p=[0.2, 0.8]),
+        'lpep_pickup_datetime': pickup,
+        'lpep_dropoff_datetime': dropoff,
+        'store_and_fwd_flag': np.where(rng.random(n) < 0.99, 'N', 'Y'),
+        'RatecodeID': np.where(rng.random(n) < 0.95, 1.0, 5.0),
+        'PULocationID': _zones(rng, zones, n),
+        'DOLocationID': _zones(rng, zones, n),
+        'passenger_count': _passengers(rng, n),
+        'trip_distance': distance,
+        'fare_amount': fare,
+        'extra': rng.choice([0.0, 0.5, 1.0], n),
+        'mta_tax': 0.5,
+        'tip_amount': tip,
+        'tolls_amount': tolls,
+        'ehail_fee': np.nan,
+        'improvement_surcharge': 0.3,
+        'total_amount': np.round(fare + 0.8 + tip + tolls + congestion, 2),
+        'payment_type': rng.choice([1.0, 2.0], n, p=[0.6, 0.4]),
+        'trip_type': np.where(rng.random(n) < 0.97, 1.0, 2.0),
+        'congestion_surcharge': congestion,
+    })
+
+
+def fhv_trips(rng, n, year, month, zones):
+    pickup, dropoff, _, _, _ = _trips(rng, n, year, month)
+    bases = np.array([f'B{i:05d}' for i in range(1, BASE_COUNT + 1)], dtype=object)
+    base_weights = _zone_weights(np.random.default_rng(1), BASE_COUNT, skew=1.3)
+    dispatching = bases[rng.choice(BASE_COUNT, n, p=base_weights)]
+    affiliated = np.where(rng.random(n) < 0.9, dispatching, bases[rng.choice(BASE_COUNT, n)])
+    affiliated[rng.random(n) < 0.05] = None
+    pu = _zones(rng, zones, n).astype(np.float64)
+    do = _zones(rng, zones, n).astype(np.float64)
+    pu[rng.random(n) < 0.2] = np.nan
+    do[rng.random(n) < 0.1] = np.nan
+    return pd.DataFrame({
+        'dispatching_base_num': dispatching,
+        'pickup_datetime': pickup,
+        'dropOff_datetime': dropoff,
+        'PUlocationID': pu,
+        'DOlocationID': do,
+        'SR_Flag': np.where(rng.random(n) < 0.1, 1.0, np.nan),
+        'Affiliated_base_number': affiliated,
+    })
+
+
+def fhvhv_trips(rng, n, year, month, zones):
+    pickup, dropoff, minutes, distance, fare = _trips(rng, n, year, month)
+    licenses, license_weights = HVFHS_LICENSES
+    license_num = rng.choice(licenses, n, p=license_weights)
+    base = np.char.add('B0', (2510 + rng.integers(0, 400, n)).astype(str))
+    wait = rng.integers(60, 900, n).astype('timedelta64[s]')
+    return pd.DataFrame({
+        'hvfhs_license_num': license_num,
+        'dispatching_base_num': base,
+        'originating_base_num': base,
+        'request_datetime': pickup - wait,
+        'on_scene_datetime': pickup - wait // 4,
+        'pickup_datetime': pickup,
+        'dropoff_datetime': dropoff,
+        'PULocationID': _zones(rng, zones, n),
+        'DOLocationID': _zones(rng, zones, n),
+        'trip_miles': distance,
+        'trip_time': (minutes * 60).astype(np.int64),
+        'base_passenger_fare': fare,
+        'tolls': np.where(rng.random(n) < 0.05, 6.12, 0.0),
+        'bcf': np.round(np.abs(fare) * 0.025, 2),
+        'sales_tax': np.round(np.abs(fare) * 0.08875, 2),
+        'congestion_surcharge': np.where(rng.random(n) < 0.8, 2.75, 0.0),
+        'airport_fee': np.nan,
+        'tips': np.round(np.where(rng.random(n) < 0.15, rng.uniform(1, 8, n), 0.0), 2),
+        'driver_pay': np.round(np.abs(fare) * 0.75, 2),
+        'shared_request_flag': np.where(rng.random(n) < 0.05, 'Y', 'N'),
+        'shared_match_flag': np.where(rng.random(n) < 0.02, 'Y', 'N'),
+        'access_a_ride_flag': np.where(license_num == 'HV0005', 'N', ' '),
+        'wav_request_flag': np.where(rng.random(n) < 0.01, 'Y', 'N'),
+        'wav_match_flag': np.where(rng.random(n) < 0.05, 'Y', 'N'),
+    })
+
+
+GENERATORS = {
+    'yellow': yellow_trips,
+    'green': green_trips,
+    'fhv': fhv_trips,
+    'fhvhv': fhvhv_trips,
+}
+
+
+def synthetic_file_name(taxi_type, year, month):
+    """TLC file name, so the loaders classify the file like a downloaded one."""
+    return f'{taxi_type}_tripdata_{year:04d}-{month:02d}.parquet'
+
+
+def generate_month(out_dir, taxi_type, year, month, rows, seed=0, row_group_rows=DEFAULT_ROW_GROUP_ROWS):
+    """Write one month of synthetic trips for a taxi type and return the file path.
+
+    The output only depends on (seed, taxi_type, year, month, rows,
+    row_group_rows): every row group is generated from its own seeded stream.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, synthetic_file_name(taxi_type, year, month))
+    type_index = list(TAXI_TYPES).index(taxi_type)
+    zones = _zone_weights(np.random.default_rng([seed, type_index]))
+    writer = None
+    try:
+        for chunk, start in enumerate(range(0, rows, row_group_rows)):
+            rng = np.random.default_rng([seed, type_index, year, month, chunk])
+            df = GENERATORS[taxi_type](rng, min(row_group_rows, rows - start), year, month, zones)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path + '.tmp', table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def generate_dataset(out_dir, rows, taxi_types=None, year=2019, months=(1,), seed=0,
+                     row_group_rows=DEFAULT_ROW_GROUP_ROWS):
+    """Generate every (taxi type, month) file, skipping files that already have the right row count."""
+    paths = []
+    for taxi_type in taxi_types or TAXI_TYPES:
+        for month in months:
+            path = os.path.join(out_dir, synthetic_file_name(taxi_type, year, month))
+            if not (os.path.exists(path) and pq.ParquetFile(path).metadata.num_rows == rows):
+                generate_month(out_dir, taxi_type, year, month, rows, seed, row_group_rows)
+            paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write deterministic synthetic TLC trip files.")
+    parser.add_argument('--out-dir', default='synthetic_data')
+    parser.add_argument('--rows', type=int, default=1_000_000, help="rows per file")
+    parser.add_argument('--types', nargs='+', choices=list(TAXI_TYPES), default=list(TAXI_TYPES))
+    parser.add_argument('--year', type=int, default=2019)
+    parser.add_argument('--months', nargs='+', type=int, default=[1])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--row-group-rows', type=int, default=DEFAULT_ROW_GROUP_ROWS)
+    args = parser.parse_args()
+
+    for path in generate_dataset(args.out_dir, args.rows, args.types, args.year, args.months,
+                                 args.seed, args.row_group_rows):
+        print(f"Wrote {path}")
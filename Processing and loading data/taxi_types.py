@@ -0,0 +1,46 @@
+import importlib
+
+# Loader module, clean/transform function and file-name rule for each taxi type.
+# The name rules are the same substring checks the loaders use in their main loop.
+TAXI_TYPES = {
+    'yellow': {
+        'module': 'insert_yellow_data_to_sqlite',
+        'transform': 'clean_and_transform_yellow_data',
+        'matches': lambda name: 'yellow' in name,
+    },
+    'green': {
+        'module': 'insert_green_data_to_sqlite',
+        'transform': 'clean_and_transform_green_taxi_data',
+        'matches': lambda name: 'green' in name.lower(),
+    },
+    'fhv': {
+        'module': 'insert_fhv_data_to_sqlite',
+        'transform': 'clean_and_transform_fhv_data',
+        'matches': lambda name: 'fhv' in name and 'fhvhv' not in name,
+    },
+    'fhvhv': {
+        'module': 'insert_fhvhv_data_to_sqlite',
+        'transform': 'clean_and_transform_fhvhv_data',
+        'matches': lambda name: 'fhvhv' in name,
+    },
+}
+
+
+def classify_file(file_name):
+    """Return the taxi type of a Parquet file name, or None if it is not a trip file."""
+    if not file_name.endswith('.parquet'):
+        return None
+    for taxi_type, spec in TAXI_TYPES.items():
+        if spec['matches'](file_name):
+            return taxi_type
+    return None
+
+
+def load_loader(taxi_type):
+    """Import and return the loader module for a taxi type."""
+    return importlib.import_module(TAXI_TYPES[taxi_type]['module'])
+
+
+def get_transform(taxi_type):
+    """Return the clean_and_transform_* function for a taxi type."""
+    return getattr(load_loader(taxi_type), TAXI_TYPES[taxi_type]['transform'])
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+# How pickup/dropoff timestamps are stored in the trip tables
+#   'text'  - 'YYYY-MM-DD HH:MM:SS' strings (the original format)
+#   'epoch' - integer seconds since 1970-01-01, 8 bytes or less per value and
+#             no string parsing when a query needs the time back
+TIME_ENCODINGS = ('text', 'epoch')
+DEFAULT_TIME_ENCODING = 'text'
+
+# Compact integer buckets materialized from the pickup time of every trip:
+#   pickup_hour  0-23
+#   pickup_date  yyyymmdd, e.g. 20190131
+#   pickup_month yyyymm,   e.g. 201901
+TIME_BUCKET_COLUMNS = ['pickup_hour', 'pickup_date', 'pickup_month']
+
+SETTINGS_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS storage_settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+
+def time_buckets(pickup_ns, missing=None):
+    """Return {bucket column: int32 array} for int64 nanosecond pickup times.
+
+    Entries flagged in missing get NULL (a nullable Int32 array is returned
+    for a column only when something is missing).
+    """
+    if missing is not None and missing.any():
+        pickup_ns = np.where(missing, 0, pickup_ns)
+    else:
+        missing = None
+    values = pickup_ns.view('datetime64[ns]')
+    months = values.astype('datetime64[M]')
+    month_index = months.astype(np.int64)
+    year = month_index // 12 + 1970
+    month = month_index % 12 + 1
+    day = (values.astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64) + 1
+    hour = (pickup_ns // 3_600_000_000_000) % 24
+
+    buckets = {
+        'pickup_hour': hour,
+        'pickup_date': year * 10000 + month * 100 + day,
+        'pickup_month': year * 100 + month,
+    }
+    for name, bucket in buckets.items():
+        if missing is not None:
+            bucket = pd.array(bucket, dtype='Int32')
+            bucket[missing] = pd.NA
+        else:
+            bucket = bucket.astype(np.int32)
+        buckets[name] = bucket
+    return buckets
+
+
+def add_time_buckets(df, pickup_col):
+    """Add pickup_hour, pickup_date and pickup_month to df from a datetime column."""
+    values = df[pickup_col].to_numpy(dtype='datetime64[ns]')
+    for name, bucket in time_buckets(values.view(np.int64), np.isnat(values)).items():
+        df[name] = bucket
+    return df
+
+
+def create_time_bucket_indexes(conn, table_name):
+    """Index each bucket column; COUNT(*) ... GROUP BY bucket is then answered from the index alone."""
+    for column in TIME_BUCKET_COLUMNS:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_{column} ON {table_name} ({column})')
+
+
+def check_time_encoding(conn, table_name, time_encoding):
+    """Record the table's time encoding on first use and refuse to mix encodings later."""
+    if time_encoding not in TIME_ENCODINGS:
+        raise ValueError(f"Unknown time encoding {time_encoding!r}, expected one of {TIME_ENCODINGS}")
+    conn.execute(SETTINGS_TABLE_SQL)
+    name = f'time_encoding:{table_name}'
+    row = conn.execute('SELECT value FROM storage_settings WHERE name = ?', (name,)).fetchone()
+    if row is None:
+        conn.execute('INSERT INTO storage_settings (name, value) VALUES (?, ?)', (name, time_encoding))
+    elif row[0] != time_encoding:
+        raise ValueError(f"{table_name} stores timestamps as {row[0]!r}; "
+                         f"cannot load it with time encoding {time_encoding!r}")
@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+from ingest_telemetry import stage
+from quality_rules import QUALITY_COLUMN, compile_rules
+from time_encoding import TIME_BUCKET_COLUMNS, time_buckets
+
+NS_PER_HOUR = 3_600_000_000_000
+
+# A transform schema describes one taxi type's source columns:
+#   pickup / dropoff     - source datetime columns
+#   distance             - source column with trip miles, or None (no avg_speed)
+#   required             - extra columns whose NULLs drop the row
+#   rename               - {source column: output column}
+#   zero_invalid_speed   - replace inf/NaN avg_speed with 0 instead of keeping it
+#   dtypes               - {output column: compact dtype}, see COMPACT_DTYPES
+#   categories           - source string columns held as pandas categoricals
+#   rules                - data-quality rules checked on the output columns,
+#                          see quality_rules.py
+
+# Output columns computed by transform_trips rather than read from the source
+DERIVED_COLUMNS = ('trip_duration', 'avg_speed', *TIME_BUCKET_COLUMNS)
+
+# Compact in-memory dtypes a schema can ask for:
+#   'int8' / 'int16' - small integer codes such as passenger counts and location
+#                      IDs (nullable Int8/Int16 when the column has NULLs)
+#   'float32'        - dollar amounts in whole cents; widen_money() turns
+#                      them back into the exact float64 values
+# A column is left as it is when a value would not survive the downcast.
+COMPACT_DTYPES = ('int8', 'int16', 'float32')
+MONEY_DECIMALS = 2
+# Below this magnitude float32 resolves well under half a cent
+MAX_FLOAT32_MONEY = 80_000.0
+
+
+def _datetime_ns(series):
+    """Return a column as datetime64[ns] values, parsing only when it is not a datetime yet."""
+    if not pd.api.types.is_datetime64_any_dtype(series.dtype):
+        series = pd.to_datetime(series, errors='coerce')
+    return series.to_numpy(dtype='datetime64[ns]')
+
+
+def _take(series, keep):
+    """Return the values of a column for the kept rows without building a new DataFrame."""
+    values = series.array if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) else series.to_numpy()
+    return values if keep is None else values[keep]
+
+
+def _compact(values, dtype):
+    """Downcast one output column to a COMPACT_DTYPES dtype when no value changes."""
+    if dtype == 'float32':
+        if values.dtype != np.float64:
+            return values
+        finite = values[np.isfinite(values)]
+        if finite.size and (np.abs(finite).max() >= MAX_FLOAT32_MONEY
+                            or not np.array_equal(np.round(finite, MONEY_DECIMALS), finite)):
+            return values
+        return values.astype(np.float32)
+
+    info = np.iinfo(dtype)
+    series = pd.Series(values, copy=False)
+    present = series.dropna()
+    if not pd.api.types.is_numeric_dtype(present.dtype) or (
+            len(present) and (present.min() < info.min or present.max() > info.max
+                              or not (present == present.round()).all())):
+        return values
+    if len(present) < len(series):
+        return pd.array(series, dtype=dtype.capitalize())
+    return series.to_numpy(dtype=dtype)
+
+
+def widen_money(values):
+    """Return a fare column as float64, turning compact float32 amounts back into exact cents."""
+    values = np.asarray(values)
+    if values.dtype == np.float32:
+        return np.round(values.astype(np.float64), MONEY_DECIMALS)
+    return values.astype(np.float64, copy=False)
+
+
+def source_columns(schema, columns):
+    """Return the source columns transform_trips reads to build columns.
+
+    Loaders read only these from Parquet; everything else in a file is never
+    decoded.
+    """
+    sources = {out: src for src, out in schema.get('rename', {}).items()}
+    needed = [schema['pickup'], schema['dropoff'], schema.get('distance'), *schema.get('required', ())]
+    needed += [sources.get(col, col) for col in columns if col not in DERIVED_COLUMNS]
+    return list(dict.fromkeys(col for col in needed if col))
+
+
+def transform_trips(df, schema, columns):
+    """Clean one batch of trips and return exactly the requested output columns.
+
+    Rows with a missing pickup, dropoff or required value are dropped with a
+    single boolean mask. trip_duration (hours), avg_speed (mph) and the pickup
+    time buckets are computed with NumPy on int64 nanosecond arrays, and every
+    output column is sliced from the source once, so no intermediate
+    DataFrames are created. Columns listed in the schema's dtypes are
+    downcast to compact types on the way out. With quality rules, the
+    batch gets a quality_rule column naming the rule each rejected row
+    broke (see quality_rules.py); the writers quarantine those rows.
+    """
+    with stage('parse', len(df)):
+        pickup = _datetime_ns(df[schema['pickup']])
+        dropoff = _datetime_ns(df[schema['dropoff']])
+
+    with stage('transform', len(df)) as timer:
+        invalid = np.isnat(pickup) | np.isnat(dropoff)
+        for col in schema.get('required', ()):
+            invalid |= df[col].isna().to_numpy()
+        keep = ~invalid if invalid.any() else None
+
+        pickup_ns = pickup.view(np.int64)
+        dropoff_ns = dropoff.view(np.int64)
+        if keep is not None:
+            pickup, pickup_ns, dropoff_ns = pickup[keep], pickup_ns[keep], dropoff_ns[keep]
+            dropoff = dropoff[keep]
+
+        derived = {'trip_duration': (dropoff_ns - pickup_ns) / NS_PER_HOUR}
+        if schema.get('distance'):
+            distance = _take(df[schema['distance']], keep).astype(np.float64)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                speed = distance / derived['trip_duration']
+            if schema.get('zero_invalid_speed'):
+                speed[~np.isfinite(speed)] = 0
+            derived['avg_speed'] = speed
+        derived.update(time_buckets(pickup_ns))
+
+        sources = {out: src for src, out in schema.get('rename', {}).items()}
+        datetimes = {schema['pickup']: pickup, schema['dropoff']: dropoff}
+        dtypes = schema.get('dtypes', {})
+        out = {}
+        for col in columns:
+            if col in derived:
+                out[col] = derived[col]
+            elif col in datetimes:
+                out[col] = datetimes[col]
+            else:
+                out[col] = _take(df[sources.get(col, col)], keep)
+            if col in dtypes:
+                out[col] = _compact(out[col], dtypes[col])
+        timer.rows_out = len(pickup)
+
+    if schema.get('rules'):
+        with stage('validate', len(pickup)) as timer:
+            rules = compile_rules(schema['rules'])
+            codes = rules.evaluate({**derived, **out})
+            rejected = int(np.count_nonzero(codes >= 0))
+            if rejected:
+                out[QUALITY_COLUMN] = rules.reasons(codes)
+            timer.rows_out = len(pickup) - rejected
+    return pd.DataFrame(out, copy=False)
@@ -0,0 +1,241 @@
+import argparse
+import time
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from month_partitions import trip_rows
+from sqlite_bulk_writer import BulkWriter
+
+# Fraction of every (source file, pickup month, pickup hour) stratum copied into
+# <trip table>_sample while loading; 0 turns sampling off for a taxi type.
+# Rows are picked by a hash of their values, so reloading a file picks the
+# same rows again. Every stratum keeps at least one row, so none of its
+# trips is missing from the estimates.
+DEFAULT_SAMPLE_RATE = 0.01
+
+# Confidence level of the intervals returned by estimate()
+DEFAULT_CONFIDENCE = 0.95
+
+STRATA_TABLE_SQL = '''
+CREATE TABLE IF NOT EXISTS trip_sample_strata (
+    taxi_type TEXT NOT NULL,
+    source_id INTEGER NOT NULL,
+    pickup_month INTEGER,
+    pickup_hour INTEGER,
+    population INTEGER NOT NULL,
+    sampled INTEGER NOT NULL,
+    PRIMARY KEY (taxi_type, source_id, pickup_month, pickup_hour)
+) WITHOUT ROWID;
+'''
+
+STRATA_UPSERT_SQL = '''
+INSERT INTO trip_sample_strata (taxi_type, source_id, pickup_month, pickup_hour, population, sampled)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (taxi_type, source_id, pickup_month, pickup_hour) DO UPDATE SET
+    population = population + excluded.population,
+    sampled = sampled + excluded.sampled
+'''
+
+STRATUM_COLUMNS = ['source_id', 'pickup_month', 'pickup_hour']
+
+
+def sample_table(table_name):
+    return f'{table_name}_sample'
+
+
+def create_sample_tables(conn, table_name):
+    """Create the strata table and an empty sample table with the trip table's columns."""
+    conn.execute(STRATA_TABLE_SQL)
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {sample_table(table_name)} AS SELECT * FROM {table_name} WHERE 0')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{sample_table(table_name)}_source_id '
+                 f'ON {sample_table(table_name)} (source_id)')
+
+
+def delete_samples(conn, table_name, source_id):
+    conn.execute(f'DELETE FROM {sample_table(table_name)} WHERE source_id = ?', (source_id,))
+    conn.execute('DELETE FROM trip_sample_strata WHERE source_id = ?', (source_id,))
+
+
+def _sampled(rows, columns, rate):
+    """Boolean mask picking about rate of the rows, the same rows on every run."""
+    if rate >= 1:
+        return np.ones(len(rows), dtype=bool)
+    hashes = pd.util.hash_pandas_object(rows[columns], index=False).to_numpy()
+    return hashes < np.uint64(rate * 2 ** 64)
+
+
+def update_samples(writer, taxi_type, source_id, rows, rate):
+    """Add one written batch's sample rows and stratum counts (inside the writer's transaction).
+
+    writer is a BulkWriter for the sample table; rows is the batch with the
+    trip table's stored columns.
+    """
+    if rows.empty:
+        return
+    keep = _sampled(rows, writer.columns, rate)
+    keys = pd.DataFrame({'pickup_month': rows['pickup_month'].to_numpy(),
+                         'pickup_hour': rows['pickup_hour'].to_numpy()})
+    # The first row of a stratum the hash left empty is kept as well
+    empty = ~pd.Series(keep).groupby([keys['pickup_month'], keys['pickup_hour']]).transform('any')
+    keep = keep | (empty.fillna(False).to_numpy(dtype=bool) & ~keys.duplicated().to_numpy())
+    strata = keys.assign(sampled=keep.astype(np.int64)).groupby(
+        ['pickup_month', 'pickup_hour'])['sampled'].agg(['size', 'sum'])
+    writer.conn.executemany(STRATA_UPSERT_SQL, (
+        (taxi_type, source_id, int(month), int(hour), int(population), int(sampled))
+        for (month, hour), population, sampled in strata.itertuples()
+    ))
+    writer.insert_rows(rows[keep])
+
+
+def sample_listener(conn, load, table_name, columns, rate, time_encoding):
+    """Return a BulkWriter listener that samples every batch of one file."""
+    writer = BulkWriter(conn, sample_table(table_name), columns, constants={'source_id': load.source_id},
+                        time_encoding=time_encoding)
+    return lambda rows: update_samples(writer, load.taxi_type, load.source_id, rows, rate)
+
+
+def rebuild_samples(conn, taxi_type, table_name, rate=DEFAULT_SAMPLE_RATE):
+    """Re-draw the sample of one taxi type from its trip table with SQL.
+
+    Only needed for tables loaded before sampling existed; later loads keep
+    the sample up to date. Rows are picked with SQLite's random(), so this
+    sample is not reproducible like the ones drawn during ingest.
+    """
+    create_sample_tables(conn, table_name)
+    threshold = int(rate * 2 ** 63)
+    conn.execute('BEGIN')
+    conn.execute(f'DELETE FROM {sample_table(table_name)}')
+    conn.execute('DELETE FROM trip_sample_strata WHERE taxi_type = ?', (taxi_type,))
+    rows = trip_rows(conn, table_name)
+    conn.execute(f'INSERT INTO {sample_table(table_name)} SELECT * FROM {rows} '
+                 f'WHERE abs(random() % 9223372036854775807) < ?', (threshold,))
+    # One row of every stratum random() left empty
+    columns = ', '.join(row[1] for row in conn.execute(f'PRAGMA table_info({table_name})'))
+    conn.execute(f'''
+        INSERT INTO {sample_table(table_name)}
+        SELECT {columns} FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY source_id, pickup_month, pickup_hour) AS n FROM {rows}
+        ) t
+        WHERE n = 1 AND NOT EXISTS (
+            SELECT 1 FROM {sample_table(table_name)} s
+            WHERE s.source_id IS t.source_id AND s.pickup_month IS t.pickup_month AND s.pickup_hour IS t.pickup_hour
+        )
+    ''')
+    conn.execute(f'''
+        INSERT INTO trip_sample_strata
+        SELECT ?, COALESCE(p.source_id, 0), p.pickup_month, p.pickup_hour, p.population, COALESCE(s.sampled, 0)
+        FROM (SELECT source_id, pickup_month, pickup_hour, COUNT(*) AS population
+              FROM {rows} GROUP BY 1, 2, 3) p
+        LEFT JOIN (SELECT source_id, pickup_month, pickup_hour, COUNT(*) AS sampled
+                   FROM {sample_table(table_name)} GROUP BY 1, 2, 3) s
+        ON s.source_id IS p.source_id AND s.pickup_month IS p.pickup_month AND s.pickup_hour IS p.pickup_hour
+    ''', (taxi_type,))
+    conn.execute('COMMIT')
+
+
+def estimate(conn, taxi_type, table_name, group_by, value=None, where=None, params=(),
+             confidence=DEFAULT_CONFIDENCE):
+    """Estimate trip counts (and the mean of value) per group from the stratified sample.
+
+    group_by, value and where are SQL over the trip table's columns. Every
+    stratum's sample is scaled up by population / sampled, and the intervals
+    use the stratified-sampling variance with a finite population
+    correction (for means, the linearized variance of a ratio). Grouping by
+    pickup month or hour, the strata themselves, gives exact counts with
+    zero-width intervals. Samples drawn before every stratum kept a row may
+    have strata without one; their trips cannot be placed in a group, so
+    they widen every trip_count_high instead (re-draw with --rebuild).
+    Returns group, trip_count, trip_count_low,
+    trip_count_high, sample_rows and, with a value, mean, mean_low and
+    mean_high, one row per group.
+    """
+    y = value or 'NULL'
+    sample = pd.read_sql_query(f'''
+        SELECT source_id, pickup_month, pickup_hour, {group_by} AS "group",
+               COUNT(*) AS c, COUNT({y}) AS cy, TOTAL({y}) AS sy, TOTAL(({y}) * ({y})) AS syy
+        FROM {sample_table(table_name)}
+        {f'WHERE {where}' if where else ''}
+        GROUP BY 1, 2, 3, 4
+    ''', conn, params=params)
+    strata = pd.read_sql_query(
+        'SELECT source_id, pickup_month, pickup_hour, population, sampled '
+        'FROM trip_sample_strata WHERE taxi_type = ?', conn, params=(taxi_type,))
+    unsampled = int(strata.loc[strata['sampled'] == 0, 'population'].sum())
+    df = sample.merge(strata[strata['sampled'] > 0], on=STRATUM_COLUMNS)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    n = df['sampled'].to_numpy(dtype=np.float64)
+    big_n = df['population'].to_numpy(dtype=np.float64)
+    fpc = 1 - n / big_n
+    weight = big_n / n
+    # Variance terms of each stratum: N^2 (1 - n/N) s^2 / n, where s^2 is the
+    # sample variance of the stratum's indicator (counts) or residual (means)
+    scale = np.divide(big_n ** 2 * fpc, n * (n - 1), out=np.zeros_like(n), where=n > 1)
+    p = df['c'] / n
+    df['count'] = weight * df['c']
+    df['count_var'] = scale * n * p * (1 - p)
+    df['y_total'] = weight * df['sy']
+    df['y_count'] = weight * df['cy']
+
+    grouped = df.groupby('group', dropna=False)
+    result = grouped[['count', 'count_var', 'y_total', 'y_count', 'c']].sum()
+    half = z * np.sqrt(result['count_var'])
+    out = pd.DataFrame({
+        'trip_count': result['count'],
+        'trip_count_low': (result['count'] - half).clip(lower=0),
+        'trip_count_high': result['count'] + half + unsampled,
+        'sample_rows': result['c'].astype(np.int64),
+    })
+    if value:
+        mean = result['y_total'] / result['y_count'].replace(0, np.nan)
+        m = df.join(mean.rename('m'), on='group')['m'].to_numpy(dtype=np.float64)
+        s1 = df['sy'] - m * df['cy']
+        s2 = df['syy'] - 2 * m * df['sy'] + m ** 2 * df['cy']
+        df['mean_var'] = scale * (s2 - s1 ** 2 / n)
+        mean_var = df.groupby('group', dropna=False)['mean_var'].sum() / result['y_count'] ** 2
+        half = z * np.sqrt(mean_var.clip(lower=0))
+        out['mean'], out['mean_low'], out['mean_high'] = mean, mean - half, mean + half
+    return out.rename_axis('group').reset_index()
+
+
+def exact(conn, table_name, group_by, value=None, where=None, params=()):
+    """The same question as estimate(), answered with a full scan of the trip table."""
+    mean = f', AVG({value}) AS mean' if value else ''
+    return pd.read_sql_query(f'''
+        SELECT {group_by} AS "group", COUNT(*) AS trip_count{mean}
+        FROM {trip_rows(conn, table_name)}
+        {f'WHERE {where}' if where else ''}
+        GROUP BY 1
+    ''', conn, params=params)
+
+
+if __name__ == "__main__":
+    from sqlite_bulk_writer import connect_for_bulk_load
+    from taxi_types import TAXI_TYPES, load_loader
+
+    parser = argparse.ArgumentParser(
+        description="Ask an ad-hoc question of the stratified trip samples, or of the full table with --exact.")
+    parser.add_argument('--db', default=r"C:\Users\Minfy\Desktop\Assignment-d2k-tech\taxi_data.db")
+    parser.add_argument('--type', choices=list(TAXI_TYPES), required=True)
+    parser.add_argument('--group-by', default='pickup_hour', help="SQL expression to group trips by")
+    parser.add_argument('--value', help="SQL expression to average per group, e.g. trip_distance")
+    parser.add_argument('--where', help="SQL filter on the trip table's columns")
+    parser.add_argument('--exact', action='store_true', help="scan the full trip table instead of the sample")
+    parser.add_argument('--rebuild', action='store_true', help="re-draw the sample from the full trip table first")
+    args = parser.parse_args()
+
+    loader = load_loader(args.type)
+    conn = connect_for_bulk_load(args.db)
+    if args.rebuild:
+        rebuild_samples(conn, args.type, loader.TABLE_NAME, loader.SAMPLE_RATE or DEFAULT_SAMPLE_RATE)
+    started = time.perf_counter()
+    if args.exact:
+        result = exact(conn, loader.TABLE_NAME, args.group_by, args.value, args.where)
+    else:
+        result = estimate(conn, args.type, loader.TABLE_NAME, args.group_by, args.value, args.where)
+    with pd.option_context('display.max_rows', 200, 'display.width', 200):
+        print(result.sort_values('group').to_string(index=False))
+    print(f"{'Exact' if args.exact else 'Estimated'} in {time.perf_counter() - started:.2f}s")
+    conn.close()
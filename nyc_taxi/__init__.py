@@ -0,0 +1,31 @@
+import os
+import sys
+
+__version__ = '0.1.0'
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# The project's scripts stay in their own directories and import each other by
+# bare module name. Installed, each directory is a subpackage of nyc_taxi (see
+# pyproject.toml); in a source checkout they sit next to this package.
+SCRIPT_DIRS = (
+    ('processing', 'Processing and loading data'),
+    ('analysis', 'Analysis and visualization of data'),
+    ('fetching', 'Code_to_fetch_data_2019'),
+)
+
+
+def script_dirs():
+    """The directories holding the loaders, the chart scripts and the downloader."""
+    dirs = []
+    for package_dir, checkout_dir in SCRIPT_DIRS:
+        installed = os.path.join(HERE, package_dir)
+        dirs.append(installed if os.path.isdir(installed) else os.path.join(os.path.dirname(HERE), checkout_dir))
+    return dirs
+
+
+def use_scripts():
+    """Make the script modules importable by their bare names. Imports nothing itself."""
+    for path in reversed(script_dirs()):
+        if path not in sys.path:
+            sys.path.insert(0, path)
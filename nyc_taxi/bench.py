@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from nyc_taxi import HERE
+
+# Startup budget of the light commands: a fresh process must finish each of
+# them in this many milliseconds (median of the runs), without importing any
+# of HEAVY_MODULES
+STARTUP_BUDGET_MS = 200.0
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'matplotlib', 'seaborn', 'duckdb', 'requests', 'bs4')
+
+
+def light_commands(sqlite_db):
+    """{label: nyc-taxi arguments} of the commands held to the budget."""
+    return {
+        '--help': ['--help'],
+        'query --help': ['query', '--help'],
+        'query yellow peak_hours': ['--backend', 'sqlite', '--db', sqlite_db, 'query', 'yellow', 'peak_hours'],
+    }
+
+
+def _run(args, python_flags=()):
+    env = dict(os.environ)
+    # Run the package being checked, installed or not
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(HERE), env.get('PYTHONPATH')]))
+    result = subprocess.run([sys.executable, *python_flags, '-m', 'nyc_taxi', *args],
+                            capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(f"nyc-taxi {' '.join(args)} failed:\n{result.stderr}")
+    return result
+
+
+def startup_ms(args, repeat):
+    """Median wall time of running nyc-taxi with args in a fresh process, after one warm-up run."""
+    _run(args)
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _run(args)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def heavy_imports(args):
+    """The HEAVY_MODULES a run of nyc-taxi with args imports, from python -X importtime."""
+    stderr = _run(args, ('-X', 'importtime')).stderr
+    imported = {line.rpartition('|')[2].strip().split('.')[0]
+                for line in stderr.splitlines() if line.startswith('import time:')}
+    return sorted(imported & set(HEAVY_MODULES))
+
+
+def check_startup(budget_ms=STARTUP_BUDGET_MS, repeat=5):
+    """Time every light command and print a report; return False when one breaks the budget."""
+    from rollups import ROLLUP_TABLE_SQL
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        # An empty database with the rollup table, so the query reads no data
+        sqlite_db = os.path.join(tmp, 'startup.db')
+        conn = sqlite3.connect(sqlite_db)
+        conn.executescript(ROLLUP_TABLE_SQL)
+        conn.close()
+
+        print(f"{'command':<26}{'median ms':>10}  heavy imports")
+        for label, args in light_commands(sqlite_db).items():
+            elapsed = startup_ms(args, repeat)
+            heavy = heavy_imports(args)
+            over = elapsed > budget_ms or heavy
+            ok = ok and not over
+            print(f"{label:<26}{elapsed:>10.1f}  {', '.join(heavy) or '-'}{'  OVER BUDGET' if over else ''}")
+    print(f"{'All commands within' if ok else 'Startup budget broken:'} {budget_ms:.0f} ms, "
+          f"no {', '.join(HEAVY_MODULES)}")
+    return ok
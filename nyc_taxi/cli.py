@@ -0,0 +1,258 @@
+import argparse
+import os
+import sys
+
+from nyc_taxi import __version__, use_scripts
+from nyc_taxi.config import BACKENDS, DEFAULTS, load_settings
+
+# Only the standard library and the light script modules (taxi_types,
+# named_queries) are imported up front. pandas, pyarrow, matplotlib and the
+# HTTP libraries are imported inside the subcommands that use them, so --help
+# and queries answered from the rollups start quickly (see `nyc-taxi bench`).
+use_scripts()
+
+from named_queries import QUERIES, ROLLUP_QUERIES, ZONE_FILTERS  # noqa: E402
+from taxi_types import TAXI_TYPES  # noqa: E402
+
+OUTPUT_FORMATS = ('table', 'json', 'csv')
+
+
+def _telemetry(args):
+    if not (args.telemetry_jsonl or args.prometheus_textfile):
+        return None
+    from ingest_telemetry import TelemetrySink
+    return TelemetrySink(args.telemetry_jsonl, args.prometheus_textfile)
+
+
+def _open_backend(settings, **kwargs):
+    from storage_backends import open_backend
+    return open_backend(settings['backend'], sqlite_db=settings['db'], dataset_root=settings['dataset_root'],
+                        **kwargs)
+
+
+def cmd_fetch(args, settings):
+    import fetch_taxi_data_2019 as fetch
+    from tlc_catalog import parse_years
+
+    try:
+        years = parse_years(args.years)
+    except ValueError as e:
+        raise RuntimeError(str(e)) from None
+    options = {name: value for name, value in (('page_url', args.page_url), ('recheck_days', args.recheck_days))
+               if value is not None}
+    try:
+        failed = fetch.sync_catalog(settings['data_dir'], years, args.types, max_workers=args.workers, **options)
+    except fetch.requests.exceptions.RequestException as e:
+        raise RuntimeError(f"Could not read the list of trip files: {e}") from None
+    return 1 if failed else 0
+
+
+def cmd_ingest(args, settings):
+    taxi_types = args.types or list(TAXI_TYPES)
+    if args.watch:
+        import signal
+
+        from ingest_daemon import IngestDaemon
+
+        backend = _open_backend(settings, telemetry=_telemetry(args))
+        daemon = IngestDaemon(backend, settings['data_dir'], taxi_types)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: daemon.stop())
+        try:
+            daemon.run()
+        finally:
+            daemon.close()
+        return 0
+
+    from parallel_ingest import run_parallel_ingest
+    from parquet_stream import DEFAULT_BATCH_ROWS
+
+    run_parallel_ingest(settings['data_dir'], settings['db'], taxi_types, args.workers,
+                        batch_rows=args.batch_rows or DEFAULT_BATCH_ROWS, storage_backend=settings['backend'],
+                        dataset_root=settings['dataset_root'], telemetry=_telemetry(args))
+    return 0
+
+
+def rollup_query(sqlite_db, name, taxi_type):
+    """Answer a query from trip_rollups with sqlite3 alone; return (columns, rows)."""
+    import sqlite3
+    from pathlib import Path
+
+    if not os.path.exists(sqlite_db):
+        raise RuntimeError(f"No database at {sqlite_db}; load one with `nyc-taxi ingest` or pass --db")
+    conn = sqlite3.connect(Path(os.path.abspath(sqlite_db)).as_uri() + '?mode=ro', uri=True)
+    try:
+        cursor = conn.execute(ROLLUP_QUERIES[name], (taxi_type,))
+    except sqlite3.OperationalError as e:
+        raise RuntimeError(f"{sqlite_db} has no rollups to query ({e}); load it with `nyc-taxi ingest`") from None
+    try:
+        return [column[0] for column in cursor.description], cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def print_rows(columns, rows, output_format):
+    if output_format == 'json':
+        import json
+        print(json.dumps([dict(zip(columns, row)) for row in rows], indent=1))
+    elif output_format == 'csv':
+        import csv
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        writer.writerow(columns)
+        writer.writerows(rows)
+    else:
+        cells = [[('' if value is None else f'{value:,.2f}' if isinstance(value, float) else str(value))
+                  for value in row] for row in rows]
+        widths = [max([len(column)] + [len(row[i]) for row in cells]) for i, column in enumerate(columns)]
+        print('  '.join(column.rjust(width) for column, width in zip(columns, widths)))
+        for row in cells:
+            print('  '.join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+def cmd_query(args, settings):
+    zones = {name: getattr(args, name) for name in ZONE_FILTERS if getattr(args, name) is not None}
+    months = (args.start, args.end) if args.start or args.end else None
+    if settings['backend'] == 'sqlite' and not (months or zones or args.approximate):
+        columns, rows = rollup_query(settings['db'], args.query, args.taxi_type)
+    else:
+        import json
+
+        with _open_backend(settings) as backend:
+            df = backend.query(args.query, args.taxi_type, args.approximate, months, zones)
+        # Integer columns holding NULLs come back as floats; make them integers again
+        result = json.loads(df.convert_dtypes().to_json(orient='split', index=False))
+        columns, rows = result['columns'], result['data']
+    print_rows(columns, rows, args.format)
+    return 0
+
+
+def cmd_render(args, settings):
+    from render_charts import render_all
+
+    with _open_backend(settings, cache_dir=settings['cache_dir']) as backend:
+        render_all(backend, args.types or None, settings['chart_dir'], args.formats, args.workers, args.force,
+                   args.approximate)
+    return 0
+
+
+def cmd_serve(args, settings):
+    import asyncio
+
+    from query_service import DEFAULT_QUERY_THREADS, AggregateService
+
+    try:
+        service = AggregateService(settings['db'], args.threads or DEFAULT_QUERY_THREADS,
+                                   settings['cache_dir'] if args.cache else None)
+    except FileNotFoundError as e:
+        raise RuntimeError(f"{e}; load one with `nyc-taxi ingest` or pass --db") from None
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+def cmd_bench(args, settings):
+    if args.suite == 'ingest':
+        import benchmark
+        benchmark.main(args.benchmark_args, prog='nyc-taxi bench ingest')
+        return 0
+    from nyc_taxi.bench import check_startup
+    return 0 if check_startup(args.budget_ms, args.repeat) else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='nyc-taxi',
+                                     description="Download, load, query and chart NYC TLC trip records.")
+    parser.add_argument('--version', action='version', version=f'%(prog)s {__version__}')
+    parser.add_argument('--config', help="TOML file with the settings below (see nyc_taxi/config.py)")
+    parser.add_argument('--data-dir',
+                        help=f"where trip files are downloaded to and loaded from ({DEFAULTS['data_dir']})")
+    parser.add_argument('--db', help=f"SQLite database ({DEFAULTS['db']})")
+    parser.add_argument('--dataset-root',
+                        help=f"Parquet dataset root, with --backend parquet ({DEFAULTS['dataset_root']})")
+    parser.add_argument('--backend', choices=BACKENDS, help=f"storage backend ({DEFAULTS['backend']})")
+    parser.add_argument('--cache-dir', help=f"query result cache ({DEFAULTS['cache_dir']})")
+    parser.add_argument('--chart-dir', help=f"where render writes charts ({DEFAULTS['chart_dir']})")
+    commands = parser.add_subparsers(title='commands', dest='command', required=True)
+
+    fetch = commands.add_parser('fetch', help="download new and changed trip files")
+    fetch.add_argument('--years', nargs='+', default=['2019'], help="years or ranges, e.g. 2009-2012 2019 2021-")
+    fetch.add_argument('--types', nargs='+', choices=list(TAXI_TYPES))
+    fetch.add_argument('--workers', type=int, default=4, help="parallel downloads and HEAD checks")
+    fetch.add_argument('--page-url', help="page listing the files (default: the TLC trip record page)")
+    fetch.add_argument('--recheck-days', type=float,
+                       help="check downloaded files against the server again after this many days (30)")
+    fetch.set_defaults(run=cmd_fetch)
+
+    ingest = commands.add_parser('ingest', help="load downloaded trip files")
+    ingest.add_argument('types', nargs='*', metavar='type',
+                        help=f"taxi types to load: {', '.join(TAXI_TYPES)} (default: all)")
+    ingest.add_argument('--workers', type=int, help="worker processes (default: CPU count)")
+    ingest.add_argument('--batch-rows', type=int)
+    ingest.add_argument('--watch', action='store_true', help="keep running and load files as they land")
+    ingest.add_argument('--telemetry-jsonl', help="append per-stage telemetry of every file to this JSON lines file")
+    ingest.add_argument('--prometheus-textfile', help="write stage metrics to this file for node_exporter")
+    ingest.set_defaults(run=cmd_ingest)
+
+    query = commands.add_parser('query', help="run a named aggregate query")
+    query.add_argument('taxi_type', choices=list(TAXI_TYPES))
+    query.add_argument('query', choices=list(QUERIES))
+    query.add_argument('--start', help="first pickup month, YYYY-MM")
+    query.add_argument('--end', help="last pickup month, YYYY-MM")
+    query.add_argument('--pickup-zone', dest='pickup_zone', type=int, help="only trips from this TLC zone")
+    query.add_argument('--dropoff-zone', dest='dropoff_zone', type=int, help="only trips to this TLC zone")
+    query.add_argument('--approximate', action='store_true', help="answer from the trip samples")
+    query.add_argument('--format', choices=OUTPUT_FORMATS, default='table')
+    query.set_defaults(run=cmd_query)
+
+    render = commands.add_parser('render', help="draw every chart to files")
+    render.add_argument('--types', nargs='+', choices=list(TAXI_TYPES))
+    render.add_argument('--formats', nargs='+', choices=['png', 'svg'], default=['png'])
+    render.add_argument('--workers', type=int, help="render processes (default: CPU count)")
+    render.add_argument('--approximate', action='store_true',
+                        help="answer from the trip samples and draw confidence intervals")
+    render.add_argument('--force', action='store_true', help="redraw charts even if their data is unchanged")
+    render.set_defaults(run=cmd_render)
+
+    serve = commands.add_parser('serve', help="serve the aggregate queries over HTTP")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8080)
+    serve.add_argument('--threads', type=int, help="query threads (default: 2 x CPU count)")
+    serve.add_argument('--cache', action='store_true', help="also cache query results in --cache-dir")
+    serve.set_defaults(run=cmd_serve)
+
+    bench = commands.add_parser('bench', help="check the startup budget, or benchmark ingest",
+                                description="startup (default): time the light commands in fresh processes and "
+                                            "exit 1 when one is over budget or imports a heavy library. "
+                                            "ingest: run benchmark.py with the remaining arguments.")
+    bench.add_argument('suite', nargs='?', choices=['startup', 'ingest'], default='startup')
+    bench.add_argument('--budget-ms', type=float, default=200.0)
+    bench.add_argument('--repeat', type=int, default=5, help="runs per command; the median is checked")
+    bench.add_argument('benchmark_args', nargs=argparse.REMAINDER, help="arguments for benchmark.py (ingest)")
+    bench.set_defaults(run=cmd_bench)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'types', None):
+        unknown = sorted(set(args.types) - set(TAXI_TYPES))
+        if unknown:
+            parser.error(f"unknown taxi types {unknown}, expected some of {list(TAXI_TYPES)}")
+    try:
+        settings = load_settings(args.config, {name: getattr(args, name) for name in DEFAULTS})
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    try:
+        return args.run(args, settings)
+    except RuntimeError as e:
+        print(f"{parser.prog}: error: {e}", file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # Output piped into e.g. head, which stopped reading
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
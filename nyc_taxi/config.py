@@ -0,0 +1,74 @@
+import os
+
+# Settings the subcommands read, with their defaults. Each one comes from, in
+# order of precedence: its command-line flag, the NYC_TAXI_<NAME> environment
+# variable, the config file, this default. Relative paths are relative to the
+# working directory.
+DEFAULTS = {
+    'data_dir': 'data',
+    'db': 'taxi_data.db',
+    'dataset_root': 'taxi_dataset',
+    'backend': 'sqlite',
+    'cache_dir': '.query_cache',
+    'chart_dir': 'charts',
+}
+ENV_PREFIX = 'NYC_TAXI_'
+
+# storage_backends.STORAGE_BACKENDS, repeated here so checking a setting
+# does not import pandas
+BACKENDS = ('sqlite', 'parquet')
+
+# The config file is TOML with the settings as top-level keys, e.g.
+#   db = "/srv/taxi/taxi_data.db"
+#   data_dir = "/srv/taxi/data"
+# It is read from --config, else $NYC_TAXI_CONFIG, else the first of these
+# that exists
+CONFIG_ENV = 'NYC_TAXI_CONFIG'
+CONFIG_FILES = (
+    'nyc_taxi.toml',
+    os.path.join(os.environ.get('XDG_CONFIG_HOME') or os.path.join('~', '.config'), 'nyc_taxi', 'config.toml'),
+)
+
+
+def find_config(path=None):
+    """The config file to read, or None when there is none."""
+    path = path or os.environ.get(CONFIG_ENV)
+    if path:
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Config file {path} does not exist")
+        return path
+    for candidate in CONFIG_FILES:
+        candidate = os.path.expanduser(candidate)
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def read_config(path):
+    """The settings in a config file, checked against DEFAULTS."""
+    import tomllib
+
+    with open(path, 'rb') as f:
+        values = tomllib.load(f)
+    unknown = sorted(set(values) - set(DEFAULTS))
+    if unknown:
+        raise ValueError(f"{path}: unknown settings {unknown}, expected some of {list(DEFAULTS)}")
+    return values
+
+
+def load_settings(config_path=None, flags=None):
+    """Resolve every setting; flags holds the values given on the command line (None = not given)."""
+    settings = dict(DEFAULTS)
+    path = find_config(config_path)
+    if path is not None:
+        settings.update(read_config(path))
+    for name in DEFAULTS:
+        value = os.environ.get(ENV_PREFIX + name.upper())
+        if value:
+            settings[name] = value
+    settings.update({name: value for name, value in (flags or {}).items() if value is not None})
+    if settings['backend'] not in BACKENDS:
+        raise ValueError(f"Unknown backend {settings['backend']!r}, expected one of {list(BACKENDS)}")
+    for name in ('data_dir', 'db', 'dataset_root', 'cache_dir', 'chart_dir'):
+        settings[name] = os.path.expanduser(str(settings[name]))
+    return settings
@@ -0,0 +1,17 @@
+import pytest
+
+from nyc_taxi import use_scripts
+
+# The tests import the script modules by their bare names, as they import each other
+use_scripts()
+
+from tlc_server import TLCServer  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    """A TLC stand-in serving on a free local port for the duration of one test."""
+    server = TLCServer()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,34 @@
+import json
+import os
+import subprocess
+import sys
+
+from nyc_taxi import HERE
+from nyc_taxi.bench import STARTUP_BUDGET_MS, startup_ms
+
+# The libraries `nyc-taxi --help` must not import
+HEAVY_MODULES = ('pandas', 'pyarrow', 'duckdb')
+
+# Runs the command line in a fresh interpreter and reports which of
+# HEAVY_MODULES ended up in sys.modules
+PROBE = f'''
+import contextlib, io, json, sys
+from nyc_taxi.cli import main
+with contextlib.redirect_stdout(io.StringIO()):
+    try:
+        main(['--help'])
+    except SystemExit:
+        pass
+print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))
+'''
+
+
+def test_help_starts_within_budget():
+    assert startup_ms(['--help'], repeat=5) <= STARTUP_BUDGET_MS
+
+
+def test_help_imports_no_heavy_library():
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.path.dirname(HERE),
+                                                                    os.environ.get('PYTHONPATH')])))
+    result = subprocess.run([sys.executable, '-c', PROBE], capture_output=True, text=True, env=env, check=True)
+    assert json.loads(result.stdout) == []
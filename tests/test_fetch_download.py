@@ -0,0 +1,70 @@
+import os
+
+import pyarrow.parquet as pq
+import pytest
+import requests
+from tenacity import wait_none
+
+import fetch_taxi_data_2019 as fetch
+from tlc_server import NAMES, file_gets, parquet_bytes
+
+
+@pytest.fixture
+def no_wait(monkeypatch):
+    monkeypatch.setattr(fetch.download_parquet_file.retry, 'wait', wait_none())
+
+
+def file_url(server, name):
+    return f'http://127.0.0.1:{server.server_port}/files/{name}'
+
+
+def test_larger_republished_file_is_not_appended_to_the_old_one(server, tmp_path):
+    name = NAMES[0]
+    old = server.files[name][0]
+    (tmp_path / name).write_bytes(old)
+    republished = parquet_bytes(5000)
+    server.publish(name, republished, '"v2"')
+
+    url = file_url(server, name)
+    assert fetch.download_files([url], str(tmp_path), verify_existing=True) == []
+    assert (tmp_path / name).read_bytes() == republished
+    assert pq.read_table(tmp_path / name).num_rows == 5000
+
+
+def test_partial_download_resumes_only_the_same_version(server, tmp_path):
+    name = NAMES[0]
+    path = str(tmp_path / name)
+    url = file_url(server, name)
+    body, etag = server.files[name]
+
+    # Same version: the rest is fetched with a Range request
+    (tmp_path / f'{name}.part').write_bytes(body[:1000])
+    (tmp_path / f'{name}.part.validator').write_text(etag)
+    fetch.download_parquet_file(url, path)
+    assert file_gets(server)[-1][2] == 206
+    assert (tmp_path / name).read_bytes() == body
+
+    # The server has a new version: If-Range fails and the download starts over
+    republished = parquet_bytes(5000)
+    server.publish(name, republished, '"v2"')
+    (tmp_path / f'{name}.part').write_bytes(body[:1000])
+    (tmp_path / f'{name}.part.validator').write_text(etag)
+    fetch.download_parquet_file(url, path)
+    assert file_gets(server)[-1][2] == 200
+    assert (tmp_path / name).read_bytes() == republished
+    assert not os.path.exists(path + '.part.validator')
+
+
+def test_missing_file_is_not_retried(server, tmp_path, no_wait):
+    with pytest.raises(requests.exceptions.HTTPError):
+        fetch.download_parquet_file(file_url(server, 'yellow_tripdata_2019-13.parquet'),
+                                    str(tmp_path / 'yellow_tripdata_2019-13.parquet'))
+    assert [status for _, _, status in file_gets(server)] == [404]
+
+
+def test_server_errors_are_retried(server, tmp_path, no_wait):
+    name = NAMES[0]
+    server.errors[name] = [503, 500]
+    fetch.download_parquet_file(file_url(server, name), str(tmp_path / name))
+    assert [status for _, _, status in file_gets(server)] == [503, 500, 200]
+    assert (tmp_path / name).read_bytes() == server.files[name][0]
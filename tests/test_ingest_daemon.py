@@ -0,0 +1,53 @@
+import os
+import sqlite3
+
+from ingest_daemon import IngestDaemon, PollingWatcher
+from storage_backends import SQLiteBackend
+from synthetic_tlc_data import generate_month, synthetic_file_name
+
+FAILING, GOOD, DELETED = (synthetic_file_name('yellow', 2019, month) for month in (1, 2, 3))
+
+
+def test_poll_cycle_survives_a_deleted_and_a_failing_file(tmp_path):
+    data = tmp_path / 'data'
+    for month in (1, 2, 3):
+        generate_month(str(data), 'yellow', 2019, month, 1000)
+
+    backend = SQLiteBackend(str(tmp_path / 'taxi.db'))
+    daemon = IngestDaemon(backend, str(data), ['yellow'], settle_seconds=0,
+                          watcher=PollingWatcher(str(data), interval=0.01))
+    checked = []
+    waits_after_cycle = []
+    check_file = backend.check_file
+    wait = daemon.watcher.wait
+
+    def check(taxi_type, file_path):
+        name = os.path.basename(file_path)
+        checked.append(name)
+        if name == FAILING:
+            raise sqlite3.OperationalError('database is locked')
+        if name == GOOD:
+            # The last file goes away after the cycle found it settled, before the daemon reaches it
+            os.remove(data / DELETED)
+        return check_file(taxi_type, file_path)
+
+    def watch(timeout):
+        # The daemon is back to watching once the cycle that met all three files is over
+        if len(checked) >= 3:
+            waits_after_cycle.append(timeout)
+            daemon.stop()
+        return wait(timeout)
+
+    backend.check_file = check
+    daemon.watcher.wait = watch
+    try:
+        daemon.run()
+    finally:
+        daemon.close()
+
+    assert len(waits_after_cycle) == 1
+    assert checked[:3] == [FAILING, GOOD, DELETED]
+    assert list(daemon._failed) == [FAILING]
+    with sqlite3.connect(tmp_path / 'taxi.db') as conn:
+        loaded = conn.execute('SELECT file_name FROM ingest_manifest WHERE loaded_at IS NOT NULL').fetchall()
+    assert loaded == [(GOOD,)]
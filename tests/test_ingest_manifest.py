@@ -0,0 +1,110 @@
+import os
+import sqlite3
+
+import pytest
+
+import ingest_manifest
+from parquet_stream import iter_parquet_batches
+from storage_backends import SQLiteBackend
+from synthetic_tlc_data import generate_month
+from taxi_types import get_transform, load_loader
+
+BATCH_ROWS = 500
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'taxi.db'))
+    backend.prepare('yellow')
+    yield backend
+    backend.close()
+
+
+def batches(file_path):
+    loader = load_loader('yellow')
+    transform = get_transform('yellow')
+    return (transform(df) for df in iter_parquet_batches(file_path, BATCH_ROWS, loader.READ_COLUMNS,
+                                                         loader.CATEGORY_COLUMNS))
+
+
+def load(backend, file_path, batch_stream=None):
+    file_load = backend.check_file('yellow', file_path)
+    backend.load_file(file_load, batch_stream if batch_stream is not None else batches(file_path))
+    return file_load
+
+
+def rows_of(db, source_id):
+    """Rows of a source file as a separate connection sees them."""
+    with sqlite3.connect(db) as conn:
+        return conn.execute('SELECT COUNT(*) FROM yellow_taxi_data_all WHERE source_id = ?',
+                            (source_id,)).fetchone()[0]
+
+
+def test_unchanged_file_is_skipped_without_hashing(backend, tmp_path, monkeypatch):
+    path = generate_month(str(tmp_path / 'data'), 'yellow', 2019, 1, 2000)
+    load(backend, path)
+
+    monkeypatch.setattr(ingest_manifest, 'hash_file', lambda file_path: pytest.fail('hashed an unchanged file'))
+    assert backend.check_file('yellow', path).status == 'unchanged'
+
+
+def test_touched_file_with_the_same_content_is_skipped(backend, tmp_path):
+    path = generate_month(str(tmp_path / 'data'), 'yellow', 2019, 1, 2000)
+    first = load(backend, path)
+    mtime = os.stat(path).st_mtime + 3600
+    os.utime(path, (mtime, mtime))
+
+    check = backend.check_file('yellow', path)
+    assert check.status == 'unchanged'
+    assert check.content_hash == first.content_hash
+    # The new mtime is recorded, so the next check is a stat() again
+    recorded = backend.conn.execute('SELECT file_mtime FROM ingest_manifest WHERE source_id = ?',
+                                    (first.source_id,)).fetchone()[0]
+    assert recorded == mtime
+
+
+def test_changed_file_replaces_its_rows_in_one_transaction(backend, tmp_path):
+    db = backend.location
+    path = generate_month(str(tmp_path / 'data'), 'yellow', 2019, 1, 2000)
+    first = load(backend, path)
+    old_rows = rows_of(db, first.source_id)
+    assert old_rows > 0
+
+    generate_month(str(tmp_path / 'data'), 'yellow', 2019, 1, 3000, seed=1)
+    check = backend.check_file('yellow', path)
+    assert check.status == 'changed'
+    assert check.source_id == first.source_id
+
+    seen = []
+
+    def watched(stream):
+        # Between batches other connections still see every old row and none of the new ones
+        for df in stream:
+            yield df
+            seen.append(rows_of(db, first.source_id))
+
+    backend.load_file(check, watched(batches(path)))
+    assert len(seen) > 1 and set(seen) == {old_rows}
+    new_rows = rows_of(db, first.source_id)
+    assert old_rows < new_rows <= 3000
+    loaded = backend.conn.execute('SELECT rows_read, rows_loaded FROM ingest_manifest WHERE source_id = ?',
+                                  (first.source_id,)).fetchone()
+    assert loaded == (3000, new_rows)
+
+
+def test_failed_replace_keeps_the_old_rows(backend, tmp_path):
+    db = backend.location
+    path = generate_month(str(tmp_path / 'data'), 'yellow', 2019, 1, 2000)
+    first = load(backend, path)
+    old_rows = rows_of(db, first.source_id)
+
+    generate_month(str(tmp_path / 'data'), 'yellow', 2019, 1, 3000, seed=1)
+
+    def failing(stream):
+        yield next(stream)
+        raise OSError('disk full')
+
+    with pytest.raises(OSError):
+        load(backend, path, failing(batches(path)))
+    assert rows_of(db, first.source_id) == old_rows
+    assert backend.check_file('yellow', path).status == 'changed'
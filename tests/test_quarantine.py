@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from parquet_stream import iter_parquet_batches
+from quality_rules import RuleSet
+from quarantine import quarantine_table
+from storage_backends import SQLiteBackend
+from taxi_types import get_transform, load_loader
+
+TABLE = load_loader('yellow').TABLE_NAME
+
+# (pickup, dropoff, distance, fare, the rule the trip breaks)
+TRIPS = [
+    ('2019-01-01 08:00:00', '2019-01-01 08:30:00', 5.0, 20.0, None),
+    ('2019-01-01 09:00:00', '2019-01-01 09:10:00', 1.5, 8.0, None),
+    ('2019-01-02 10:00:00', '2019-01-02 10:20:00', 0.0, 0.0, None),
+    ('2019-01-02 11:00:00', '2019-01-02 11:15:00', np.nan, 9.0, None),
+    ('2019-01-03 12:00:00', '2019-01-03 11:00:00', 2.0, 10.0, 'negative_duration'),
+    ('2019-01-03 12:00:00', '2019-01-05 12:00:00', 30.0, 90.0, 'over_24_hours'),
+    ('2019-01-04 13:00:00', '2019-01-04 13:30:00', -1.0, 5.0, 'negative_distance'),
+    ('2019-01-04 14:00:00', '2019-01-04 14:10:00', 2.0, -5.0, 'negative_fare'),
+    ('2019-01-05 15:00:00', '2019-01-05 15:10:00', 0.0, 12.0, 'zero_distance_with_fare'),
+    ('2019-01-05 16:00:00', '2019-01-05 16:06:00', 50.0, 100.0, 'impossible_speed'),
+]
+
+
+def write_trips(path, trips):
+    pickup, dropoff, distance, fare, _ = zip(*trips)
+    n = len(trips)
+    pd.DataFrame({
+        'tpep_pickup_datetime': pd.to_datetime(pickup),
+        'tpep_dropoff_datetime': pd.to_datetime(dropoff),
+        'passenger_count': np.ones(n, dtype=np.int64),
+        'trip_distance': distance,
+        'PULocationID': np.full(n, 132),
+        'DOLocationID': np.full(n, 236),
+        'fare_amount': fare,
+    }).to_parquet(path, index=False)
+    return str(path)
+
+
+def load(backend, path):
+    loader = load_loader('yellow')
+    transform = get_transform('yellow')
+    file_load = backend.check_file('yellow', path)
+    backend.load_file(file_load, (transform(df) for df in iter_parquet_batches(
+        path, loader.BATCH_ROWS, loader.READ_COLUMNS, loader.CATEGORY_COLUMNS)))
+    return file_load
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'taxi.db'))
+    backend.prepare('yellow')
+    yield backend
+    backend.close()
+
+
+def test_bad_rows_are_quarantined_with_their_rule(backend, tmp_path):
+    path = write_trips(tmp_path / 'yellow_tripdata_2019-01.parquet', TRIPS)
+    file_load = load(backend, path)
+
+    loaded = backend.conn.execute(f'SELECT trip_distance, fare_amount FROM {TABLE}_all '
+                                  f'WHERE source_id = ? ORDER BY tpep_pickup_datetime',
+                                  (file_load.source_id,)).fetchall()
+    # A missing distance breaks no rule
+    assert [(None if np.isnan(d) else d, f) for _, _, d, f, rule in TRIPS if rule is None] == loaded
+
+    rejected = backend.conn.execute(f'SELECT quality_rule, trip_distance, fare_amount FROM {quarantine_table(TABLE)} '
+                                    f'WHERE source_id = ? ORDER BY tpep_pickup_datetime, trip_distance',
+                                    (file_load.source_id,)).fetchall()
+    assert rejected == [(rule, d, f) for _, _, d, f, rule in TRIPS if rule is not None]
+
+
+def test_reloading_a_file_replaces_its_quarantined_rows(backend, tmp_path):
+    path = write_trips(tmp_path / 'yellow_tripdata_2019-01.parquet', TRIPS)
+    file_load = load(backend, path)
+    write_trips(path, TRIPS[:2] + TRIPS[-1:])
+    load(backend, path)
+
+    rules = backend.conn.execute(f'SELECT quality_rule FROM {quarantine_table(TABLE)} WHERE source_id = ?',
+                                 (file_load.source_id,)).fetchall()
+    assert rules == [('impossible_speed',)]
+    assert backend.conn.execute(f'SELECT COUNT(*) FROM {TABLE}_all').fetchone()[0] == 2
+
+
+def test_a_row_is_blamed_on_the_first_rule_it_breaks():
+    rules = RuleSet({'negative': [('x', '<', 0)], 'small': [('x', '<', 10)], 'both': [('x', '<', 10), ('y', '>', 0)]})
+    codes = rules.evaluate({'x': np.array([-1.0, 5.0, 20.0, np.nan]), 'y': np.array([1.0, 1.0, 1.0, 1.0])})
+    # A missing value breaks no rule
+    assert codes.tolist() == [0, 1, -1, -1]
+    assert rules.reasons(codes).tolist()[:2] == ['negative', 'small']
@@ -0,0 +1,39 @@
+import asyncio
+import json
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from month_partitions import month_range
+from query_service import AggregateService, parse_query
+
+
+@pytest.mark.parametrize('params, months', [
+    ({'start': ['2019-02']}, (201902, None)),
+    ({'end': ['201903']}, (None, 201903)),
+    ({}, None),
+])
+def test_open_bound_stays_open(params, months):
+    assert parse_query('yellow', 'monthly_trips', params)[2] == months
+
+
+def test_response_reports_the_range_as_given(tmp_path, monkeypatch):
+    db = tmp_path / 'taxi.db'
+    sqlite3.connect(db).close()
+    service = AggregateService(str(db), threads=1)
+    seen = []
+
+    def query(name, taxi_type, approximate, months, zones):
+        seen.append(month_range(*months))
+        return pd.DataFrame({'month': ['2019-02'], 'trip_count': [1]})
+
+    monkeypatch.setattr(service.backend, 'query', query)
+    try:
+        status, _, body = asyncio.run(service.respond('GET', '/v1/yellow/monthly_trips?start=2019-02', {}))
+    finally:
+        service.close()
+    assert status == 200
+    assert json.loads(body)['months'] == {'start': '2019-02', 'end': None}
+    # The backend still reads the range up to the last month
+    assert seen == [month_range(201902, None)]
@@ -0,0 +1,36 @@
+import os
+
+import pyarrow.parquet as pq
+
+import fetch_taxi_data_2019 as fetch
+from tlc_catalog import CATALOG_FILE
+from tlc_server import NAMES, PAGE, file_gets, parquet_bytes
+
+
+def sync(server, data_dir, **options):
+    server.log.clear()
+    return fetch.sync_catalog(str(data_dir), [2019], page_url=server.page_url, max_workers=2, **options)
+
+
+def test_unchanged_sync_sends_one_conditional_get(server, tmp_path):
+    assert sync(server, tmp_path) == []
+    assert len(file_gets(server)) == len(NAMES)
+    assert os.path.exists(tmp_path / CATALOG_FILE)
+
+    assert sync(server, tmp_path) == []
+    assert server.log == [('GET', PAGE, 304)]
+
+
+def test_republished_file_is_downloaded_again_whole(server, tmp_path):
+    sync(server, tmp_path)
+    name = NAMES[0]
+    republished = parquet_bytes(5000)
+    server.publish(name, republished, '"v2"')
+
+    # The page itself is unchanged; the file is only checked once it is due
+    assert sync(server, tmp_path) == []
+    assert file_gets(server) == []
+    assert sync(server, tmp_path, recheck_days=0) == []
+    assert file_gets(server) == [('GET', f'/files/{name}', 200)]
+    assert (tmp_path / name).read_bytes() == republished
+    assert pq.read_table(tmp_path / name).num_rows == 5000
@@ -0,0 +1,76 @@
+import sqlite3
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from sqlite_bulk_writer import BulkWriter
+from trip_samples import create_sample_tables, estimate, exact, rebuild_samples, sample_listener
+
+TABLE = 'trips'
+COLUMNS = ['pickup_month', 'pickup_hour', 'trip_distance']
+RATE = 0.01
+
+
+def trips():
+    """Strata of 1 to 400 rows over two months, most too small for a 1% sample to reach."""
+    rng = np.random.default_rng(0)
+    frames = []
+    for month in (201901, 201902):
+        for hour in range(24):
+            n = int(rng.integers(1, 400))
+            frames.append(pd.DataFrame({'pickup_month': month, 'pickup_hour': hour,
+                                        'trip_distance': rng.exponential(3.0, n)}))
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:', isolation_level=None)
+    conn.execute(f'CREATE TABLE {TABLE} (source_id INTEGER, pickup_month INTEGER, pickup_hour INTEGER, '
+                 f'trip_distance REAL)')
+    create_sample_tables(conn, TABLE)
+    yield conn
+    conn.close()
+
+
+def load(conn, df, source_id=1):
+    with BulkWriter(conn, TABLE, COLUMNS, constants={'source_id': source_id}) as writer:
+        load = SimpleNamespace(source_id=source_id, taxi_type='yellow')
+        writer.listeners.append(sample_listener(conn, load, TABLE, COLUMNS, RATE, 'text'))
+        for start in range(0, len(df), 1000):
+            writer.write(df.iloc[start:start + 1000])
+
+
+def compare(conn, group_by):
+    estimated = estimate(conn, 'yellow', TABLE, group_by).set_index('group')
+    counted = exact(conn, TABLE, group_by).set_index('group')
+    return estimated.join(counted['trip_count'].rename('exact'))
+
+
+@pytest.mark.parametrize('group_by', ['pickup_month', 'pickup_hour'])
+def test_counts_by_stratum_column_are_exact(conn, group_by):
+    load(conn, trips())
+    result = compare(conn, group_by)
+    assert (result['trip_count'].round() == result['exact']).all()
+    assert (result['trip_count_low'].round() == result['exact']).all()
+    assert (result['trip_count_high'].round() == result['exact']).all()
+
+
+def test_rebuilt_sample_keeps_every_stratum(conn):
+    load(conn, trips())
+    rebuild_samples(conn, 'yellow', TABLE, RATE)
+    assert conn.execute('SELECT COUNT(*) FROM trip_sample_strata WHERE sampled = 0').fetchone()[0] == 0
+    result = compare(conn, 'pickup_month')
+    assert (result['trip_count'].round() == result['exact']).all()
+
+
+def test_strata_without_sample_rows_widen_the_interval(conn):
+    load(conn, trips())
+    # A stratum left empty by a sample drawn before every stratum kept a row
+    conn.execute(f'DELETE FROM {TABLE}_sample WHERE pickup_month = 201902 AND pickup_hour = 3')
+    conn.execute('UPDATE trip_sample_strata SET sampled = 0 WHERE pickup_month = 201902 AND pickup_hour = 3')
+    result = compare(conn, 'pickup_month')
+    assert (result['trip_count_low'] <= result['exact'] + 1e-6).all()
+    assert (result['trip_count_high'] >= result['exact'] - 1e-6).all()
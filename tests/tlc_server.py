@@ -0,0 +1,89 @@
+"""A stand-in for the TLC site, shared by the catalog and download tests."""
+import io
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+PAGE = '/trip-record-data.page'
+PAGE_ETAG = '"page-1"'
+PAGE_MODIFIED = 'Mon, 01 Jan 2024 00:00:00 GMT'
+NAMES = ('yellow_tripdata_2019-01.parquet', 'green_tripdata_2019-01.parquet')
+
+
+def parquet_bytes(rows):
+    buf = io.BytesIO()
+    pq.write_table(pa.table({'trip_distance': [float(i) for i in range(rows)]}), buf)
+    return buf.getvalue()
+
+
+class TLCServer(ThreadingHTTPServer):
+    """A stand-in for the TLC site: the trip record page and its files, with
+    conditional GETs, HEAD and Range/If-Range like the real servers."""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), TLCHandler)
+        self.files = {name: (parquet_bytes(1000), '"v1"') for name in NAMES}
+        self.log = []   # (method, path, status) of every request
+        self.errors = {}   # name -> statuses to answer its next GETs with
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def page_url(self):
+        return f'http://127.0.0.1:{self.server_port}{PAGE}'
+
+    def publish(self, name, body, etag):
+        self.files[name] = (body, etag)
+
+
+class TLCHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, headers, body=b'', send_body=True):
+        self.server.log.append((self.command, self.path, status))
+        self.send_response(status)
+        for field, value in headers.items():
+            self.send_header(field, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _page(self):
+        if self.headers.get('If-None-Match') == PAGE_ETAG:
+            return self._reply(304, {'ETag': PAGE_ETAG})
+        links = ''.join(f'<a href="/files/{name}">{name}</a>' for name in self.server.files)
+        self._reply(200, {'ETag': PAGE_ETAG, 'Last-Modified': PAGE_MODIFIED},
+                    f'<html><body>{links}</body></html>'.encode())
+
+    def do_GET(self):
+        if self.path == PAGE:
+            return self._page()
+        name = os.path.basename(self.path)
+        if self.server.errors.get(name):
+            return self._reply(self.server.errors[name].pop(0), {})
+        if name not in self.server.files:
+            return self._reply(404, {})
+        body, etag = self.server.files[name]
+        ranged = self.headers.get('Range')
+        if ranged and self.headers.get('If-Range') in (None, etag):
+            start = int(ranged.partition('=')[2].rstrip('-'))
+            return self._reply(206, {'ETag': etag, 'Content-Range': f'bytes {start}-{len(body) - 1}/{len(body)}'},
+                               body[start:])
+        self._reply(200, {'ETag': etag}, body)
+
+    def do_HEAD(self):
+        body, etag = self.server.files[os.path.basename(self.path)]
+        self.server.log.append(('HEAD', self.path, 200))
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+
+def file_gets(server):
+    return [entry for entry in server.log if entry[0] == 'GET' and entry[1] != PAGE]